@@ -0,0 +1,346 @@
+"""Offline benchmarks of every public Database method against synthetic data. Run from `src/`:
+
+    python benchmark.py --users 10000 --output bench.json          # mongod at MONGODB_URI or localhost
+    python benchmark.py --users 10000 --mock --output bench.json   # in-process mongomock_motor
+    python benchmark.py --compare before.json after.json
+
+The data is seeded into its own database (`agriweathBot_benchmark` by default), which is dropped
+first. With a real mongod each case also records its round trips through `command_monitor`.
+Each case times one method over the seeded users: the handler reads and writes, the activity,
+dialog and coupon writes, the forecast and segment queries, /stats and the export. mongomock
+doesn't implement $bucketAuto (get_member_counts), $lookup with `let` (register_not_pressed and
+refresh_segments), $geoWithin (the radius and polygon queries) or explain (check_indexes), those
+cases are reported with their error instead of a timing that means anything.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import motor.motor_asyncio
+
+import database
+from utils.mongo_monitoring import current_operation, percentile
+
+PRODUCTS = ["پسته اکبری", "پسته اوحدی", "پسته احمدآقایی", "گندم", "زعفران", "انار"]
+PROVINCES = ["کرمان", "یزد", "فارس", "سمنان", "خراسان رضوی"]
+KERMAN = [(54.5, 26.5), (59.5, 26.5), (59.5, 32.0), (54.5, 32.0)]
+ACTIVITIES = ["start", "start register", "request weather", "chose advice date", "navigated to home view"]
+# methods that only make sense once, against production data
+SKIPPED = {
+    "get_admins": "returns None, kept for reference",
+    "migrate_activity_logs": "one-shot migration",
+    "migrate_dialogs": "one-shot migration",
+    "migrate_member_counts": "one-shot migration",
+    "migrate_coupons": "one-shot migration",
+    "migrate_farms": "one-shot migration",
+    "migrate_timestamps": "one-shot migration",
+    "refresh_grid_cells": "needs forecast grids loaded in the process",
+    "populate_user_collection": "legacy pickle import",
+    "populate_mongodb_from_pickle": "legacy pickle import",
+}
+
+
+def _farm(rng: random.Random, with_location: bool) -> dict:
+    return {
+        "type": "باغ",
+        "product": rng.choice(PRODUCTS),
+        "province": rng.choice(PROVINCES),
+        "city": f"city-{rng.randrange(200)}",
+        "village": f"village-{rng.randrange(2000)}",
+        "area": rng.randrange(1, 50),
+        "location": {"latitude": round(rng.uniform(25, 38), 5), "longitude": round(rng.uniform(45, 60), 5)}
+                    if with_location else {"latitude": None, "longitude": None},
+        "location-method": "Link" if with_location else "Unspecified",
+    }
+
+
+def _user(rng: random.Random, user_id: int, first_seen: datetime) -> tuple[dict, list[dict]]:
+    document = {
+        "_id": user_id,
+        "username": f"user{user_id}",
+        "first-seen": first_seen,
+        "blocked": rng.random() < 0.1,
+    }
+    if rng.random() < 0.7:
+        document["name"] = f"name {user_id}"
+        document["phone-number"] = f"0912{user_id:07d}"[:11] if rng.random() < 0.9 else ""
+        farms = {f"farm {i}": _farm(rng, rng.random() < 0.8) for i in range(rng.choice([0, 1, 1, 2, 3]))}
+        document["pressed-register"] = True
+    else:
+        farms = {}
+        document["pressed-register"] = rng.random() < 0.3
+    document["segments"] = database._user_segments({**document, "farms": farms})
+    document["menu-state"] = database._menu_state({**document, "farms": farms})
+    return document, [database._farm_document(user_id, name, farm) for name, farm in farms.items()]
+
+
+async def _insert(collection, documents: list, chunk_size: int = 10000) -> None:
+    for i in range(0, len(documents), chunk_size):
+        await collection.insert_many(documents[i:i + chunk_size], ordered=False)
+
+
+async def seed(db: database.Database, users: int, activity_per_user: int, seed: int = 0) -> dict:
+    """Fills every collection the bot reads with `users` synthetic users and their logs."""
+    rng = random.Random(seed)
+    await db.client.drop_database(db.db.name)
+    await db.ensure_indexes()
+    now = datetime.now()
+    chunk_size = 10000
+    for start in range(0, users, chunk_size):
+        ids = range(start + 1, min(start + chunk_size, users) + 1)
+        generated = [_user(rng, i, now - timedelta(minutes=rng.randrange(500000))) for i in ids]
+        await _insert(db.user_collection, [user for user, _ in generated])
+        await _insert(db.farm_collection, [farm for _, farms in generated for farm in farms])
+        buckets = {}
+        for i in ids:
+            for j in range(rng.randrange(activity_per_user + 1)):
+                timestamp = (now - timedelta(minutes=rng.randrange(40000))).replace(second=0, microsecond=0)
+                day = database._day(timestamp)
+                bucket = buckets.setdefault((i, day), {"userID": i, "day": day,
+                                                       "username": f"user{i}", "count": 0, "events": []})
+                bucket["events"].append({"user_activity": "start register" if j == 1 else rng.choice(ACTIVITIES),
+                                         "value": "", "timestamp": timestamp})
+                bucket["count"] += 1
+        if buckets:
+            await _insert(db.activity_collection, list(buckets.values()))
+        dialogs = [
+            {"userID": i, "day": database._day(now), "username": f"user{i}", "count": 3,
+             "messages": [{"timestamp": now, "function": "send_todays_data",
+                           "message": "forecast"}] * 3}
+            for i in ids
+        ]
+        await _insert(db.dialog_collection, dialogs)
+    await _insert(db.token_collection, [
+        {"owner": rng.randrange(1, users + 1), "token-value": f"token-{i}", "time-created": now,
+         "used-by": [rng.randrange(1, users + 1) for _ in range(rng.randrange(5))]}
+        for i in range(max(users // 10, 1))
+    ])
+    await _insert(db.member_count_collection, [
+        {"timestamp": now - timedelta(hours=2 * i), "members": users - i} for i in range(2000)
+    ])
+    await _insert(db.coupon_collection, [
+        {"code": f"coupon-{i}", "value": 50000.0, "uses": 0, "max-uses": None, "time-created": now}
+        for i in range(100)
+    ])
+    return {name: await getattr(db, name).estimated_document_count()
+            for name in ["user_collection", "farm_collection", "activity_collection", "dialog_collection",
+                         "token_collection"]}
+
+
+def cases(users: int, sample: list[int], export_dir: str) -> list[tuple]:
+    """`(name, method, call)` tuples. Per-user calls run once per sampled user, the rest `repeat` times."""
+    new_ids = iter(range(users + 1, users + 10 ** 7))
+    farm = _farm(random.Random(1), True)
+
+    def per_user(method, make_call):
+        return [(method, method, lambda db, user_id=user_id: make_call(db, user_id)) for user_id in sample]
+
+    def once(method, call, repeat=3, name=None):
+        return [(name or method, method, call)] * repeat
+
+    return [
+        *per_user("get_user_document", lambda db, u: db.get_user_document(u)),
+        *per_user("check_if_user_exists", lambda db, u: db.check_if_user_exists(u)),
+        *per_user("check_if_user_is_registered", lambda db, u: db.check_if_user_is_registered(u)),
+        *per_user("check_if_user_has_farms", lambda db, u: db.check_if_user_has_farms(u)),
+        *per_user("check_if_user_has_farms_with_location", lambda db, u: db.check_if_user_has_farms_with_location(u)),
+        *per_user("check_if_user_has_pesteh", lambda db, u: db.check_if_user_has_pesteh(u)),
+        *per_user("find_start_keyboard", lambda db, u: db.find_start_keyboard(u)),
+        *per_user("get_menu_state", lambda db, u: db.get_menu_state(u)),
+        *per_user("get_farms", lambda db, u: db.get_farms(u)),
+        *per_user("get_farm_map", lambda db, u: db.get_farm_map(u)),
+        *per_user("get_user_attribute", lambda db, u: db.get_user_attribute(u, "phone-number")),
+        *per_user("set_user_attribute", lambda db, u: db.set_user_attribute(u, "phone-number", f"0935{u:07d}")),
+        *per_user("add_new_farm", lambda db, u: db.add_new_farm(u, "benchmark", farm)),
+        *per_user("update_farm", lambda db, u: db.update_farm(u, "benchmark", {"area": 7, "location-method": "Link"})),
+        *once("update_farms", lambda db: db.update_farms([(u, "benchmark", {"area": 8}) for u in sample])),
+        *per_user("delete_farm", lambda db, u: db.delete_farm(u, "benchmark")),
+        *per_user("add_new_user", lambda db, u: db.add_new_user(next(new_ids), "benchmark")),
+        *per_user("add_token", lambda db, u: db.add_token(u, f"benchmark-{u}")),
+        *per_user("log_token_use", lambda db, u: db.log_token_use(u, f"benchmark-{sample[0]}")),
+        *per_user("calc_token_number", lambda db, u: db.calc_token_number(f"benchmark-{u}")),
+        *per_user("calc_user_tokens", lambda db, u: db.calc_user_tokens(u)),
+        *per_user("log_payment", lambda db, u: db.log_payment(u, code=f"benchmark-{u}")),
+        *per_user("add_coupon_to_payment_dict", lambda db, u: db.add_coupon_to_payment_dict(u, f"benchmark-{u}", "coupon-1")),
+        *per_user("modify_final_price_in_payment_dict",
+                  lambda db, u: db.modify_final_price_in_payment_dict(u, f"benchmark-{u}", 450000.0)),
+        *per_user("get_final_price", lambda db, u: db.get_final_price(u, f"benchmark-{u}")),
+        *per_user("verify_payment", lambda db, u: db.verify_payment(u, f"benchmark-{u}")),
+        *per_user("verify_coupon", lambda db, u: db.verify_coupon(f"coupon-{u % 100}")),
+        *per_user("apply_coupon", lambda db, u: db.apply_coupon(f"coupon-{u % 100}", 500000.0)),
+        *per_user("claim_coupon_use", lambda db, u: db.claim_coupon_use(u)),
+        *per_user("log_sms_message", lambda db, u: db.log_sms_message(u, "benchmark", 1)),
+        *per_user("log_new_message", lambda db, u: db.log_new_message(u, f"user{u}", "benchmark", "benchmark")),
+        *per_user("check_if_dialog_exists", lambda db, u: db.check_if_dialog_exists(u)),
+        *per_user("get_last_messages", lambda db, u: db.get_last_messages(u)),
+        *per_user("log_activity", lambda db, u: db.log_activity(u, "benchmark")),
+        *per_user("check_if_user_activity_exsits",
+                  lambda db, u: db.check_if_user_activity_exsits(u, "start register", datetime.now() - timedelta(days=7))),
+        *once("flush_activity_logs", lambda db: db.flush_activity_logs(), repeat=1),
+        *once("save_coupon", lambda db: db.save_coupon(f"benchmark-{time.perf_counter_ns()}", 1000)),
+        *once("process_coupon_use", lambda db: db.process_coupon_use()),
+        *once("log_sent_messages", lambda db: db.log_sent_messages(sample, "benchmark")),
+        *once("log_member_changes", lambda db: db.log_member_changes(users)),
+        *once("get_member_counts", lambda db: db.get_member_counts(datetime.now() - timedelta(days=90), max_points=30)),
+        *once("get_all_pesteh_farmers", lambda db: db.get_all_pesteh_farmers()),
+        *once("register_not_pressed", lambda db: db.register_not_pressed()),
+        *once("iter_register_not_pressed", lambda db: _consume(db.iter_register_not_pressed())),
+        *once("get_users_with_location", lambda db: db.get_users_with_location()),
+        *once("get_forecast_farms", lambda db: db.get_forecast_farms()),
+        *once("get_users_without_location", lambda db: db.get_users_without_location()),
+        *once("get_users_without_phone", lambda db: db.get_users_without_phone()),
+        *once("get_farms_within_radius", lambda db: db.get_farms_within_radius(30.3, 57.0, 50)),
+        *once("get_users_within_radius", lambda db: db.get_users_within_radius(30.3, 57.0, 50)),
+        *once("get_farms_in_polygon", lambda db: db.get_farms_in_polygon(KERMAN)),
+        *once("get_users_in_polygon", lambda db: db.get_users_in_polygon(KERMAN)),
+        *once("refresh_farm_locations", lambda db: db.refresh_farm_locations(), repeat=1),
+        *once("get_users_in_menu_state", lambda db: db.get_users_in_menu_state("no-location")),
+        *once("get_segment", lambda db: db.get_segment("with-location")),
+        *once("get_segment_info", lambda db: db.get_segment_info("with-location")),
+        *once("number_of_members", lambda db: db.number_of_members()),
+        *once("number_of_blocks", lambda db: db.number_of_blocks()),
+        *once("refresh_stats", lambda db: db.refresh_stats()),
+        *once("get_stats", lambda db: db.get_stats()),
+        *once("refresh_segments", lambda db: db.refresh_segments(), repeat=1),
+        *once("to_excel", lambda db: db.to_excel(os.path.join(export_dir, "members.csv")), repeat=1, name="to_excel csv"),
+        *once("ensure_indexes", lambda db: db.ensure_indexes(), repeat=1),
+        *once("check_indexes", lambda db: db.check_indexes(), repeat=1),
+    ]
+
+
+async def _consume(iterator) -> int:
+    return len([item async for item in iterator])
+
+
+async def run(db: database.Database, users: int, sample_size: int) -> dict:
+    sample = random.Random(1).sample(range(1, users + 1), min(sample_size, users))
+    results = {}
+    with tempfile.TemporaryDirectory() as export_dir:
+        for name, method, call in cases(users, sample, export_dir):
+            result = results.setdefault(name, {"method": method, "latencies": [], "errors": 0, "error": None})
+            token = current_operation.set(f"benchmark {name}")
+            start = time.perf_counter()
+            try:
+                await call(db)
+            except Exception as e:
+                result["errors"] += 1
+                result["error"] = f"{type(e).__name__}: {e}"[:300]
+            finally:
+                result["latencies"].append(time.perf_counter() - start)
+                current_operation.reset(token)
+    round_trips = database.command_monitor.snapshot()["operations"]
+    for name, result in results.items():
+        latencies = result.pop("latencies")
+        result.update({
+            "calls": len(latencies),
+            "total-ms": 1000 * sum(latencies),
+            "mean-ms": 1000 * sum(latencies) / len(latencies),
+            "p50-ms": 1000 * percentile(latencies, 0.5),
+            "p95-ms": 1000 * percentile(latencies, 0.95),
+            "max-ms": 1000 * max(latencies),
+        })
+        commands = round_trips.get(f"benchmark {name}")
+        result["round-trips-per-call"] = commands["count"] / len(latencies) if commands else None
+    return results
+
+
+def uncovered(results: dict) -> list[str]:
+    covered = {result["method"] for result in results.values()}
+    return [name for name, _ in inspect.getmembers(database.Database, inspect.isfunction)
+            if not name.startswith("_") and name not in covered and name not in SKIPPED]
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_file: str, after_file: str, threshold: float = 1.2) -> int:
+    """Prints the mean latency of both runs per case and returns the number of regressions."""
+    with open(before_file) as f:
+        before = json.load(f)
+    with open(after_file) as f:
+        after = json.load(f)
+    print(f"{before['commit']} -> {after['commit']} ({after['users']} users, {after['backend']})")
+    regressions = 0
+    for name in sorted(set(before["results"]) | set(after["results"])):
+        old, new = before["results"].get(name), after["results"].get(name)
+        if not old or not new:
+            print(f"{name:40} {'only in ' + (before_file if old else after_file)}")
+            continue
+        ratio = new["mean-ms"] / old["mean-ms"] if old["mean-ms"] else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  SLOWER"
+            regressions += 1
+        elif ratio < 1 / threshold:
+            flag = "  faster"
+        print(f"{name:40} {old['mean-ms']:10.2f} ms {new['mean-ms']:10.2f} ms {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def _client(args) -> motor.motor_asyncio.AsyncIOMotorClient:
+    if args.mock:
+        # optional dependency, only needed for the in-process backend
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient()
+    uri = args.uri or os.environ.get("MONGODB_URI", "mongodb://localhost:27017")
+    return motor.motor_asyncio.AsyncIOMotorClient(uri, event_listeners=[database.command_monitor])
+
+
+async def main(args) -> None:
+    db = database.Database(client=_client(args), db_name=args.db_name)
+    start = time.perf_counter()
+    counts = await seed(db, args.users, args.activity_per_user)
+    print(f"seeded {counts} in {time.perf_counter() - start:.1f}s")
+    results = await run(db, args.users, args.sample)
+    report = {
+        "commit": _commit(),
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "backend": "mongomock" if args.mock else "mongod",
+        "python": platform.python_version(),
+        "users": args.users,
+        "documents": counts,
+        "uncovered": uncovered(results),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    for name, result in results.items():
+        error = f"  {result['errors']} errors, last: {result['error']}" if result["errors"] else ""
+        print(f"{name:40} {result['calls']:5} calls {result['mean-ms']:10.2f} ms mean {result['p95-ms']:10.2f} ms p95{error}")
+    if report["uncovered"]:
+        print(f"public methods without a benchmark: {', '.join(report['uncovered'])}")
+    if not args.keep:
+        await db.client.drop_database(db.db.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000, help="synthetic users, e.g. 10000, 100000 or 1000000")
+    parser.add_argument("--activity-per-user", type=int, default=5, help="maximum activity events per user")
+    parser.add_argument("--sample", type=int, default=200, help="users the per-user methods are called for")
+    parser.add_argument("--mock", action="store_true", help="use mongomock_motor instead of a mongod")
+    parser.add_argument("--uri", help="mongod to seed, defaults to MONGODB_URI or localhost")
+    parser.add_argument("--db-name", default="agriweathBot_benchmark", help="database to (re)create")
+    parser.add_argument("--keep", action="store_true", help="don't drop the benchmark database afterwards")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files and exit")
+    args = parser.parse_args()
+    if args.compare:
+        sys.exit(1 if compare(*args.compare) else 0)
+    if args.db_name == "agriweathBot":
+        sys.exit("refusing to seed the production database")
+    asyncio.run(main(args))
@@ -1,10 +1,28 @@
-import pymongo
-from datetime import datetime
+import motor.motor_asyncio
+import asyncio
+import csv
+import openpyxl
+from pymongo import ASCENDING, GEOSPHERE, IndexModel, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+import copy
 import pickle
-import pandas as pd
+import time
 import os
 from telegram import ReplyKeyboardMarkup
 from typing import Callable, Type
+from utils.activity_buffer import ActivityBuffer
+from utils.forecast_store import forecast_store
+from utils.mongo_monitoring import CommandMonitor, PoolMonitor, current_operation
+
+ACTIVITY_BUCKET_SIZE = 1000
+DIALOG_BUCKET_SIZE = 200
+COUPON_CACHE_TTL = 60
+# $indexStats counters restart with mongod, an index only counts as unused after this long without accesses
+INDEX_STATS_MIN_AGE = timedelta(days=int(os.environ.get("INDEX_STATS_MIN_AGE_DAYS", 7)))
+# get_member_count refreshes the snapshot every 2 hours, the TTL only matters if that job stops
+STATS_TTL = 3 * 60 * 60
 
 REQUIRED_FIELDS = [
     "_id",
@@ -13,19 +31,529 @@ REQUIRED_FIELDS = [
     "phone-number",
 ]
 
+# Indexes ensured at startup, per Database collection attribute. Each index comes with a
+# probe query shaped like the hot query it serves; `check_indexes` explains the probe and
+# expects the index to win.
+INDEXES = {
+    "activity_collection": [
+        (IndexModel([("userID", ASCENDING), ("day", ASCENDING)], name="userID_day"),
+         {"userID": 0, "day": {"$gte": datetime.min, "$lte": datetime.min}}),
+        (IndexModel([("events.user_activity", ASCENDING), ("userID", ASCENDING)], name="activity_userID"),
+         {"events.user_activity": "start register"}),
+    ],
+    "dialog_collection": [
+        (IndexModel([("userID", ASCENDING), ("day", ASCENDING), ("_id", ASCENDING)], name="userID_day"),
+         {"userID": 0}),
+    ],
+    "coupon_collection": [
+        (IndexModel([("code", ASCENDING)], name="code", unique=True), {"code": ""}),
+    ],
+    "member_count_collection": [
+        (IndexModel([("timestamp", ASCENDING)], name="timestamp"), {"timestamp": {"$gte": datetime.min}}),
+    ],
+    "token_collection": [
+        (IndexModel([("token-value", ASCENDING)], name="token_value"), {"token-value": ""}),
+        (IndexModel([("owner", ASCENDING)], name="owner"), {"owner": 0}),
+    ],
+    "farm_collection": [
+        (IndexModel([("user_id", ASCENDING), ("name", ASCENDING)], name="user_id_name", unique=True),
+         {"user_id": 0, "name": ""}),
+        (IndexModel([("product", ASCENDING), ("user_id", ASCENDING)], name="product_user_id"),
+         {"product": {"$regex": "^پسته"}}),
+        (IndexModel([("province", ASCENDING)], name="province"), {"province": ""}),
+        (IndexModel([("located", ASCENDING), ("user_id", ASCENDING)], name="located_user_id"), {"located": True}),
+        (IndexModel([("harvest-off", ASCENDING)], name="harvest_off"), {"harvest-off": True}),
+        (IndexModel([("geo", GEOSPHERE)], name="geo"),
+         {"geo": {"$geoWithin": {"$centerSphere": [[56.0, 30.0], 0.01]}}}),
+    ],
+    "user_collection": [
+        (IndexModel([("payments.code", ASCENDING)], name="payments_code"), {"payments.code": ""}),
+        (IndexModel([("blocked", ASCENDING)], name="blocked"), {"blocked": True}),
+        (IndexModel([("segments", ASCENDING)], name="segments"), {"segments": "without-phone"}),
+        (IndexModel([("menu-state", ASCENDING)], name="menu_state"), {"menu-state": "no-location"}),
+    ],
+}
+
+
+# formats of the string timestamps written before they became datetimes
+TIMESTAMP_FORMATS = ["%Y%m%d %H:%M", "%Y-%m-%d %H:%M", "%Y%m%d %H%M", "%Y-%m-%d %H:%M:%S", "%Y%m%d", "%Y-%m-%d"]
+
+
+def _parse_timestamp(value: str) -> datetime | None:
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), timestamp_format)
+        except ValueError:
+            continue
+    return None
+
+
+def to_datetime(value: datetime | str) -> datetime:
+    """Takes a datetime or a timestamp string in one of the legacy `TIMESTAMP_FORMATS`."""
+    if isinstance(value, datetime):
+        return value
+    parsed = _parse_timestamp(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise ValueError(f"not a timestamp: {value!r}")
+    return parsed
+
+
+def time_range(start: datetime | str = None, end: datetime | str = None) -> dict:
+    """A typed `{"$gte": start, "$lte": end}` filter, either bound can be left out."""
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = to_datetime(start)
+    if end is not None:
+        bounds["$lte"] = to_datetime(end)
+    return bounds
+
+
+def _day(timestamp: datetime) -> datetime:
+    """Start of the day of `timestamp`, the key of the activity and dialog buckets."""
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_retention_indexes() -> None:
+    """Optional TTL indexes, e.g. ACTIVITY_RETENTION_DAYS=365.
+
+    Buckets expire a day after their last possible event. Changing a value later needs a
+    collMod on the existing index.
+    """
+    for collection_name, field, variable in [("activity_collection", "day", "ACTIVITY_RETENTION_DAYS"),
+                                             ("dialog_collection", "day", "DIALOG_RETENTION_DAYS"),
+                                             ("sms_collection", "timestamp", "SMS_RETENTION_DAYS")]:
+        if os.environ.get(variable):
+            INDEXES.setdefault(collection_name, []).append((
+                IndexModel([(field, ASCENDING)], name=f"{field}_ttl",
+                           expireAfterSeconds=int((float(os.environ[variable]) + 1) * 24 * 60 * 60)),
+                {field: {"$lt": datetime.min}},
+            ))
+
+
+_add_retention_indexes()
+
+
+# fields of the legacy "activity logs" documents of botCollection
+ACTIVITY_LOG_FIELDS = ["type", "user_activity", "value", "userID", "username", "timestamp"]
+
+
+def _activity_bucket_updates(events: list[dict]) -> list[UpdateOne]:
+    """Groups activity events into one upsert per (user, day) bucket.
+
+    A bucket is closed once it holds `ACTIVITY_BUCKET_SIZE` events, the next write for that
+    user and day then upserts a new one.
+    """
+    buckets = {}
+    for event in events:
+        # migrated legacy events carry string timestamps, unparseable ones go to a bucket without a day
+        timestamp = event["timestamp"]
+        if isinstance(timestamp, str):
+            timestamp = _parse_timestamp(timestamp) or timestamp
+        day = _day(timestamp) if isinstance(timestamp, datetime) else None
+        bucket = buckets.setdefault((event["userID"], day), {"username": None, "events": []})
+        bucket["username"] = event.get("username")
+        bucket["events"].append({
+            "user_activity": event["user_activity"],
+            "value": event.get("value", ""),
+            "timestamp": timestamp,
+        })
+    return [
+        UpdateOne(
+            {"userID": user_id, "day": day, "count": {"$lt": ACTIVITY_BUCKET_SIZE}},
+            {
+                "$push": {"events": {"$each": bucket["events"]}},
+                "$inc": {"count": len(bucket["events"])},
+                "$set": {"username": bucket["username"]},
+            },
+            upsert=True,
+        )
+        for (user_id, day), bucket in buckets.items()
+    ]
+
+
+def _has_location(farm: dict) -> bool:
+    location = farm.get("location") or {}
+    return location.get("latitude") is not None and location.get("longitude") is not None
+
+
+EARTH_RADIUS_KM = 6378.1
+
+
+def _geo_point(farm: dict) -> dict | None:
+    """The farm location as a GeoJSON point, None if it's missing or not a valid coordinate."""
+    location = farm.get("location") or {}
+    latitude, longitude = location.get("latitude"), location.get("longitude")
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in (latitude, longitude)):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+
+def _derived_farm_fields(farm: dict) -> dict:
+    """Fields of a farm document computed from its location, kept in sync on every farm write."""
+    return {"located": _has_location(farm), "geo": _geo_point(farm)}
+
+
+def _grid_cell(row, distance) -> dict:
+    return {"row": None if row is None or row < 0 else int(row), "distance": float(distance)}
+
+
+def _grid_field(farm: dict, grids: dict) -> dict:
+    """The `grid` field of a farm: its location and its nearest cell in each of `grids`, keyed by grid id.
+
+    Handlers read the cell through `ForecastSnapshot.nearest_farm` instead of searching the grid.
+    """
+    point = _geo_point(farm)
+    if point is None:
+        return {"location": None, "cells": {}}
+    longitude, latitude = point["coordinates"]
+    return {"location": point["coordinates"],
+            "cells": {grid_id: _grid_cell(*index.nearest(longitude, latitude)) for grid_id, index in grids.items()}}
+
+
+def _stale_grid_fields(document: dict, grids: dict) -> dict:
+    """Updates for the `grid` field after a location write or when grids were loaded since the last one.
+
+    Cells of grids that aren't loaded in this process are kept until the location changes.
+    """
+    point = _geo_point(document)
+    grid = document.get("grid") or {}
+    if "location" not in grid or grid["location"] != (point["coordinates"] if point else None):
+        return {"grid": _grid_field(document, grids)}
+    missing = {grid_id: index for grid_id, index in grids.items() if grid_id not in (grid.get("cells") or {})}
+    if point is None or not missing:
+        return {}
+    return {f"grid.cells.{grid_id}": cell for grid_id, cell in _grid_field(document, missing)["cells"].items()}
+
+
+def _grid_cell_updates(farms: list[dict], grids: dict) -> list[UpdateOne]:
+    """`_stale_grid_fields` of located farms as updates, resolved against each grid with one `nearest_many`."""
+    coordinates = [_geo_point(farm)["coordinates"] for farm in farms]
+    longitudes, latitudes = zip(*coordinates)
+    nearest = {grid_id: index.nearest_many(longitudes, latitudes) for grid_id, index in grids.items()}
+    updates = []
+    for i, farm in enumerate(farms):
+        cells = {grid_id: _grid_cell(rows[i], distances[i]) for grid_id, (rows, distances) in nearest.items()}
+        grid = farm.get("grid") or {}
+        if grid.get("location") != coordinates[i]:
+            fields = {"grid": {"location": coordinates[i], "cells": cells}}
+        else:
+            fields = {f"grid.cells.{grid_id}": cell for grid_id, cell in cells.items()
+                      if grid_id not in (grid.get("cells") or {})}
+        if fields:
+            updates.append(UpdateOne({"_id": farm["_id"]}, {"$set": fields}))
+    return updates
+
+
+def _location_update_fields(fields: dict) -> dict | None:
+    """Derived fields to `$set` along with a farm update, None if it writes only one coordinate of the location.
+
+    The location handlers write both coordinates, so the derived fields are known before the write.
+    """
+    if not any(key.split(".")[0] == "location" for key in fields):
+        return {}
+    location = {**(fields.get("location") or {}),
+                **{key.split(".", 1)[1]: value for key, value in fields.items() if key.startswith("location.")}}
+    if "location" not in fields and not {"latitude", "longitude"} <= location.keys():
+        return None
+    farm = {"location": location}
+    return {**_derived_farm_fields(farm), "grid": _grid_field(farm, forecast_store.grids())}
+
+
+def _stale_farm_fields(document: dict) -> dict:
+    derived = _derived_farm_fields(document)
+    stale = {key: value for key, value in derived.items() if document.get(key) != value}
+    stale.update(_stale_grid_fields(document, forecast_store.grids()))
+    return stale
+
+
+# farmCollection fields that aren't part of the farm dicts get_farms returns. `grid` is, for the forecast lookups.
+FARM_KEYS = {"_id", "user_id", "name", "located", "geo"}
+
+
+def _farm_document(user_id: int, farm_name: str, farm: dict) -> dict:
+    return {**farm, "user_id": user_id, "name": farm_name, **_derived_farm_fields(farm),
+            "grid": _grid_field(farm, forecast_store.grids())}
+
+
+def _farm_fields(document: dict) -> dict:
+    return {key: value for key, value in document.items() if key not in FARM_KEYS}
+
+
+# Audience segments of /send, kept in the `segments` array of each user document.
+# Each rule takes a user document (phone-number and pressed-register) with its farms map under "farms".
+SEGMENTS = {
+    "pesteh-farmers": lambda doc: any(str(farm.get("product") or "").startswith("پسته")
+                                      for farm in (doc.get("farms") or {}).values()),
+    "with-location": lambda doc: any(_has_location(farm) for farm in (doc.get("farms") or {}).values()),
+    "without-location": lambda doc: not doc.get("farms") or (
+        any((farm.get("location") or {}).get("latitude") is None for farm in doc["farms"].values())
+        and any((farm.get("location") or {}).get("longitude") is None for farm in doc["farms"].values())),
+    "without-phone": lambda doc: not doc.get("phone-number"),
+    "register-not-pressed": lambda doc: not doc.get("pressed-register"),
+}
+SEGMENT_FIELDS = ["phone-number", "pressed-register"]
+
+
+def _user_segments(document: dict) -> list[str]:
+    return [name for name, rule in SEGMENTS.items() if rule(document)]
+
+
+# Start keyboard of each `menu-state`, in the order find_start_keyboard checks them
+MENU_KEYBOARDS = {
+    "not-registered": "start_keyboard_not_registered",
+    "no-farms": "start_keyboard_no_farms",
+    "no-location": "start_keyboard_no_location",
+    "not-pesteh": "start_keyboard_not_pesteh",
+    "pesteh": "start_keyboard_pesteh_kar",
+}
+# user fields the menu state depends on, besides the farms
+MENU_STATE_FIELDS = REQUIRED_FIELDS
+
+
+def _menu_state(document: dict | None) -> str:
+    """Takes a user document with its farms map under "farms", like the SEGMENTS rules."""
+    if document is None or not all(key in document for key in REQUIRED_FIELDS):
+        return "not-registered"
+    farms = document.get("farms") or {}
+    if not farms:
+        return "no-farms"
+    if not any((farm.get("location") or {}).get("longitude") for farm in farms.values()):
+        return "no-location"
+    if not any(str(farm.get("product") or "").startswith("پسته") for farm in farms.values()):
+        return "not-pesteh"
+    return "pesteh"
+
+
+EXPORT_COLUMNS = ['id', 'username', 'phone', 'first-seen', 'name', 'blocked', 'farm name', 'product', 'province', 'city', 'village', 'area', 'latitude', 'longitude', 'location method']
+EXPORT_PROJECTION = {field: 1 for field in REQUIRED_FIELDS + ["first-seen", "blocked"]}
+
+
+def _export_rows(document: dict) -> list[list]:
+    user_columns = [document["_id"], document.get("username"), document.get("phone-number"),
+                    document.get("first-seen"), document.get("name"), document.get("blocked")]
+    # unregistered users are exported without farms, like get_farms does
+    farms = document.get("farms") if all(key in document for key in REQUIRED_FIELDS) else None
+    if not farms:
+        return [user_columns]
+    return [
+        user_columns + [name, farm.get('product'), farm.get('province'), farm.get('city'), farm.get('village'),
+                        farm.get('area'), farm.get('location', {}).get('latitude'),
+                        farm.get('location', {}).get('longitude'), farm.get('location-method')]
+        for name, farm in farms.items()
+    ]
+
+
+def _append_rows(append_row: Callable, rows: list[list]) -> None:
+    for row in rows:
+        append_row([str(value) if isinstance(value, (dict, list)) else value for value in row])
+
+
+def _plan_index_names(plan) -> set:
+    if isinstance(plan, dict):
+        names = {plan["indexName"]} if "indexName" in plan else set()
+        for value in plan.values():
+            names |= _plan_index_names(value)
+        return names
+    if isinstance(plan, list):
+        return set().union(*[_plan_index_names(item) for item in plan])
+    return set()
+
+
+_client = None
+pool_monitor = PoolMonitor()
+command_monitor = CommandMonitor()
+
+
+def get_client() -> motor.motor_asyncio.AsyncIOMotorClient:
+    """The process-wide client every Database shares. Pool settings come from the environment."""
+    global _client
+    if _client is None:
+        _client = motor.motor_asyncio.AsyncIOMotorClient(
+            os.environ["MONGODB_URI"],
+            maxPoolSize=int(os.environ.get("MONGODB_MAX_POOL_SIZE", 50)),
+            minPoolSize=int(os.environ.get("MONGODB_MIN_POOL_SIZE", 0)),
+            maxIdleTimeMS=int(os.environ.get("MONGODB_MAX_IDLE_TIME_MS", 300000)),
+            waitQueueTimeoutMS=int(os.environ.get("MONGODB_WAIT_QUEUE_TIMEOUT_MS", 10000)),
+            connectTimeoutMS=int(os.environ.get("MONGODB_CONNECT_TIMEOUT_MS", 10000)),
+            serverSelectionTimeoutMS=int(os.environ.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 10000)),
+            socketTimeoutMS=int(os.environ.get("MONGODB_SOCKET_TIMEOUT_MS", 60000)),
+            event_listeners=[pool_monitor, command_monitor],
+        )
+    return _client
+
+
+_unit_of_work: ContextVar["UnitOfWork"] = ContextVar("unit_of_work", default=None)
+activity_buffer = ActivityBuffer()
+# coupon code -> (coupon document or None, expiry); cleared for a code when /coupon saves it
+_coupon_cache = {}
+_stats_snapshot = {"stats": None, "expires": 0}
+
+
+class UnitOfWork:
+    """Keeps the user documents read while handling one update.
+
+    Database reads of a user document (and of the user's farms) are served from here after
+    the first round trip, writes made through Database patch the cached copy (or drop it
+    when the change can't be replayed locally).
+    """
+    def __init__(self, effective_user=None) -> None:
+        self.effective_user = effective_user
+        self.users = {}
+        self.farms = {}
+        self.round_trips = 0
+        self.saved_round_trips = 0
+
+    def __enter__(self) -> "UnitOfWork":
+        self._token = _unit_of_work.set(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        _unit_of_work.reset(self._token)
+
+    def patch(self, user_id: int, operator: str, key: str, value: any = None) -> None:
+        document = self.users.get(user_id)
+        if document is None:
+            return
+        *parents, leaf = key.split(".")
+        node = document
+        for part in parents:
+            node = node.setdefault(part, {}) if operator != "$unset" else node.get(part, {})
+            if not isinstance(node, dict):
+                self.users.pop(user_id)
+                return
+        if operator == "$set":
+            node[leaf] = value
+        elif operator == "$unset":
+            node.pop(leaf, None)
+        elif operator == "$push" and isinstance(node.setdefault(leaf, []), list):
+            node[leaf].append(value)
+        else:
+            self.users.pop(user_id)
+
+    def forget(self, user_id: int) -> None:
+        self.users.pop(user_id, None)
+        self.farms.pop(user_id, None)
+
 
 class Database:
-    def __init__(self) -> None:
-        self.client =  pymongo.MongoClient(os.environ["MONGODB_URI"])
-        self.db = self.client["agriweathBot"]  # database name
+    def __init__(self, client: motor.motor_asyncio.AsyncIOMotorClient = None, db_name: str = "agriweathBot") -> None:
+        self.client = client or get_client()
+        self.db = self.client[db_name]
         self.user_collection = self.db["newUserCollection"]
         self.bot_collection = self.db["botCollection"]
         self.token_collection = self.db["tokenCollection"]
         self.dialog_collection = self.db["dialogCollection"]
         self.sms_collection = self.db["smsCollection"]
+        self.activity_collection = self.db["activityCollection"]
+        self.member_count_collection = self.db["memberCountCollection"]
+        self.coupon_collection = self.db["couponCollection"]
+        self.segment_collection = self.db["segmentCollection"]
+        self.farm_collection = self.db["farmCollection"]
+
+    async def ensure_indexes(self) -> None:
+        for collection_name, indexes in INDEXES.items():
+            collection = getattr(self, collection_name)
+            await collection.create_indexes([index for index, _ in indexes])
+
+    async def check_indexes(self, unused_after: timedelta = None) -> dict:
+        """Explains each registered probe query and, with `unused_after`, reads `$indexStats`.
+
+        Args:
+            unused_after (timedelta): how long the access counters of an index must have been
+                collecting before it can be reported unused. Unused indexes aren't checked without it.
+        Returns:
+            dict: `missing` registered indexes absent from the collection, `not_used_by_probe` indexes
+            the planner didn't pick for their probe and `unused` indexes with no recorded accesses
+            (unregistered ones included), as `collection.index` names.
+        """
+        from utils.logger import logger
+        report = {"missing": [], "not_used_by_probe": [], "unused": []}
+        for collection_name, indexes in INDEXES.items():
+            collection = getattr(self, collection_name)
+            existing = await collection.index_information()
+            for index, probe in indexes:
+                name = index.document["name"]
+                if name not in existing:
+                    report["missing"].append(f"{collection_name}.{name}")
+                    continue
+                plan = (await collection.find(probe).explain())["queryPlanner"]["winningPlan"]
+                if name not in _plan_index_names(plan):
+                    report["not_used_by_probe"].append(f"{collection_name}.{name}")
+            if unused_after is None:
+                continue
+            async for stats in collection.aggregate([{"$indexStats": {}}]):
+                # `since` is when the counters started, in UTC
+                if (stats["name"] != "_id_" and stats["accesses"]["ops"] == 0
+                        and datetime.utcnow() - stats["accesses"]["since"] >= unused_after):
+                    report["unused"].append(f"{collection_name}.{stats['name']}")
+        for problem, names in report.items():
+            if names:
+                logger.warning(f"index self-check: {problem}: {', '.join(names)}")
+        return report
 
-    def check_if_user_exists(self, user_id: int, raise_exception: bool = False):
-        if self.user_collection.count_documents({"_id": user_id}) > 0:
+    async def get_user_document(self, user_id: int) -> dict | None:
+        uow = _unit_of_work.get()
+        if uow is None:
+            return await self.user_collection.find_one({"_id": user_id})
+        if user_id in uow.users:
+            uow.saved_round_trips += 1
+        else:
+            uow.users[user_id] = await self.user_collection.find_one({"_id": user_id})
+            uow.round_trips += 1
+        return copy.deepcopy(uow.users[user_id])
+
+    def _patch_cached_user(self, user_id: int, operator: str, key: str, value: any = None) -> None:
+        uow = _unit_of_work.get()
+        if uow is not None:
+            uow.patch(user_id, operator, key, value)
+
+    def _forget_cached_user(self, user_id: int) -> None:
+        uow = _unit_of_work.get()
+        if uow is not None:
+            uow.forget(user_id)
+
+    async def get_farm_map(self, user_id: int) -> dict:
+        """All farms of a user keyed by name, in the order they were added."""
+        uow = _unit_of_work.get()
+        if uow is not None and user_id in uow.farms:
+            uow.saved_round_trips += 1
+            return copy.deepcopy(uow.farms[user_id])
+        cursor = self.farm_collection.find({"user_id": user_id}).sort("_id", ASCENDING)
+        farms = {farm["name"]: _farm_fields(farm) async for farm in cursor}
+        if uow is not None:
+            uow.farms[user_id] = copy.deepcopy(farms)
+            uow.round_trips += 1
+        return farms
+
+    def _patch_cached_farm(self, user_id: int, farm_name: str, farm: dict | None) -> None:
+        uow = _unit_of_work.get()
+        if uow is None or user_id not in uow.farms:
+            return
+        if farm is None:
+            uow.farms[user_id].pop(farm_name, None)
+        else:
+            uow.farms[user_id][farm_name] = copy.deepcopy(farm)
+
+    async def _with_farms(self, users, batch_size: int = 1000):
+        """Attaches the farms map to each user of `users`, a cursor sorted by `_id`.
+
+        farmCollection is read alongside in `user_id` order, so this is a merge join over two cursors.
+        """
+        farms = self.farm_collection.find({}, batch_size=batch_size).sort("user_id", ASCENDING)
+        farm = await anext(farms, None)
+        async for user in users:
+            while farm is not None and farm["user_id"] < user["_id"]:
+                farm = await anext(farms, None)
+            user["farms"] = {}
+            while farm is not None and farm["user_id"] == user["_id"]:
+                user["farms"][farm["name"]] = _farm_fields(farm)
+                farm = await anext(farms, None)
+            yield user
+
+    async def check_if_user_exists(self, user_id: int, raise_exception: bool = False):
+        if await self.get_user_document(user_id) is not None:
             return True
         else:
             if raise_exception:
@@ -33,126 +561,96 @@ class Database:
             else:
                 return False
 
-    def check_if_user_is_registered(self, user_id: int, required_keys: list = REQUIRED_FIELDS):
-        if not self.check_if_user_exists(user_id=user_id):
+    async def check_if_user_is_registered(self, user_id: int, required_keys: list = REQUIRED_FIELDS):
+        if not await self.check_if_user_exists(user_id=user_id):
             return False
         else:
-            document = self.user_collection.find_one( {"_id": user_id} )
+            document = await self.get_user_document(user_id)
             if all(key in document for key in required_keys):
                 return True
             else:
                 return False
     
-    def check_if_user_has_farms(self, user_id: int, user_document: dict = None) -> bool:
-        if not user_document:
-            user_document = self.user_collection.find_one( {"_id": user_id} )
-        if user_document.get("farms"):
+    async def check_if_user_has_farms(self, user_id: int, user_document: dict = None) -> bool:
+        if await self.get_farm_map(user_id):
             return True
         else: 
             return False
         
-    def check_if_user_has_farms_with_location(self, user_id: int, user_document: dict = None) -> bool:
-        if not user_document:
-            user_document = self.user_collection.find_one( {"_id": user_id} )
-        # Lets assume that the user has atleast one farm i.e. we've filtered the users who don't have a farm
-        longitudes = { farm: user_document.get("farms", {}).get(farm, {}).get("location", {}).get("longitude") for farm in list(user_document.get("farms", {}).keys()) }
-        if any([longitudes[farm] for farm in list(longitudes.keys())]):
+    async def check_if_user_has_farms_with_location(self, user_id: int, user_document: dict = None) -> bool:
+        farms = await self.get_farm_map(user_id)
+        if any(farm.get("location", {}).get("longitude") for farm in farms.values()):
             return True
         else:
             return False
         
-    def check_if_user_has_pesteh(self, user_id: int, user_document: dict = None) -> bool:
-        if not user_document:
-            user_document = self.user_collection.find_one( {"_id": user_id} )
-        products = [user_document["farms"][farm].get("product", "") for farm in list(user_document["farms"].keys())]
-        products = [product for product in products if product]
+    async def check_if_user_has_pesteh(self, user_id: int, user_document: dict = None) -> bool:
+        farms = await self.get_farm_map(user_id)
+        products = [farm.get("product") for farm in farms.values() if farm.get("product")]
         if any([product.startswith("پسته") for product in products]):
             return True
         else:
             return False
 
-    def find_start_keyboard(self, user_id: int, user_document: dict = None) -> Callable[[], Type[ReplyKeyboardMarkup]]:
-        from utils import keyboards
-        if not user_document:
-            user_document = self.user_collection.find_one( {"_id": user_id} )
-        if not self.check_if_user_is_registered(user_id):
-            return keyboards.start_keyboard_not_registered()
+    async def get_menu_state(self, user_id: int) -> str:
+        """The user's `menu-state`, read from the cached document or with a projected find_one."""
+        uow = _unit_of_work.get()
+        if uow is not None and user_id in uow.users:
+            uow.saved_round_trips += 1
+            document = uow.users[user_id]
         else:
-            if not self.check_if_user_has_farms(user_id, user_document):
-                return keyboards.start_keyboard_no_farms()
-            else:
-                if not self.check_if_user_has_farms_with_location(user_id, user_document):
-                    return keyboards.start_keyboard_no_location()
-                else:
-                    if not self.check_if_user_has_pesteh(user_id, user_document):
-                        return keyboards.start_keyboard_not_pesteh()
-                    else:
-                        return keyboards.start_keyboard_pesteh_kar()
-
-    def get_all_pesteh_farmers(self) -> list:
-        pipeline = [
-            {
-                '$project': {
-                    'farms': {
-                        '$objectToArray': '$farms'
-                    }
-                }
-            }, {
-                '$unwind': '$farms'
-            }, {
-                '$match': {
-                    'farms.v.product': {
-                        '$regex': '^پسته'
-                    }
-                }
-            }, {
-                '$group': {
-                    '_id': '$_id'
-                }
-            }
-        ]
-        cursor = self.user_collection.aggregate(pipeline) # users who have atleast one pesteh farm 
-        users = [user["_id"] for user in cursor]
-        return users
+            document = await self.user_collection.find_one({"_id": user_id}, {"menu-state": 1})
+        state = (document or {}).get("menu-state")
+        if state is None:
+            # written before menu-state existed and not backfilled yet
+            state = await self._update_user_state(user_id)
+        return state
+
+    async def get_users_in_menu_state(self, state: str) -> list[int]:
+        return [user["_id"] async for user in self.user_collection.find({"menu-state": state}, {"_id": 1})]
+
+    async def find_start_keyboard(self, user_id: int, user_document: dict = None) -> Callable[[], Type[ReplyKeyboardMarkup]]:
+        from utils import keyboards
+        state = (user_document or {}).get("menu-state") or await self.get_menu_state(user_id)
+        return getattr(keyboards, MENU_KEYBOARDS[state])()
 
-    def register_not_pressed(self) -> list[int]:
+    async def get_all_pesteh_farmers(self) -> list:
+        # users who have atleast one pesteh farm, a prefix scan of the product_user_id index
+        return await self.farm_collection.distinct("user_id", {"product": {"$regex": "^پسته"}})
+
+    async def register_not_pressed(self) -> list[int]:
         """_summary_
         Helper function that returns all users that started the bot but never pressed the register button
         Returns:
             list[int]: List of Telegram IDs
         """
+        return [user_id async for user_id in self.iter_register_not_pressed()]
+
+    async def iter_register_not_pressed(self, batch_size: int = 1000):
+        """Yields the ids of `register_not_pressed` from a server-side anti-join, one cursor batch at a time.
+
+        Each user is probed once in activityCollection through the `activity_userID` index.
+        """
         pipeline = [
-            {
-                '$match': {
-                    'user_activity': {
-                        '$exists': True
-                    }
-                }
-            }, {
-                '$group': {
-                    '_id': '$userID',
-                    'activity': {
-                        '$push': '$user_activity'
-                    }
-                }
-            }, {
-                '$match': {
-                    'activity': {
-                        '$elemMatch': {
-                            '$eq': 'start register'
-                        }
-                    }
-                }
-            },
+            {"$project": {"_id": 1}},
+            {"$lookup": {
+                "from": self.activity_collection.name,
+                "let": {"user_id": "$_id"},
+                "pipeline": [
+                    {"$match": {"events.user_activity": "start register", "$expr": {"$eq": ["$userID", "$$user_id"]}}},
+                    {"$limit": 1},
+                    {"$project": {"_id": 1}},
+                ],
+                "as": "pressed",
+            }},
+            {"$match": {"pressed": {"$size": 0}}},
+            {"$project": {"_id": 1}},
         ]
-        cursor = self.bot_collection.aggregate(pipeline)
-        pressed_register = [user["_id"] for user in cursor]
-        all_users = self.user_collection.distinct("_id")
-        not_pressed_register = [user for user in all_users if user not in pressed_register]
-        return not_pressed_register
-        
-    def check_if_dialog_exists(self, user_id: int, raise_exception: bool = False):
-        if self.dialog_collection.count_documents({"_id": user_id}) > 0:
+        async for user in self.user_collection.aggregate(pipeline, batchSize=batch_size):
+            yield user["_id"]
+
+    async def check_if_dialog_exists(self, user_id: int, raise_exception: bool = False):
+        if await self.dialog_collection.count_documents({"userID": user_id}, limit=1) > 0:
             return True
         else:
             if raise_exception:
@@ -160,24 +658,29 @@ class Database:
             else:
                 return False
 
-    def check_if_user_activity_exsits(self, 
+    async def check_if_user_activity_exsits(self, 
                                       user_id: int, 
                                       activity: str, 
-                                      gte: str, 
-                                      lte: str = datetime.now().strftime("%Y%m%d %H:%M"))->bool:
-        """checks user activities in the botCollection and returns True if a particular activity exists.
+                                      gte: datetime | str, 
+                                      lte: datetime | str = None)->bool:
+        """checks user activities in the activityCollection and returns True if a particular activity exists.
 
         Args:
             user_id (int): UserID of a Telegram.User
             activity (str): Name of the activity
-            gt (str): Time to start the search (in `%Y%m%d %H:%M` format)
-            lt (str): Time to stop the search (in `%Y%m%d %H:%M` format)
+            gte (datetime | str): Time to start the search (a datetime, or a string in one of `TIMESTAMP_FORMATS`)
+            lte (datetime | str): Time to stop the search, now by default
         """
-        document = self.bot_collection.find_one( {
+        gte, lte = to_datetime(gte), to_datetime(lte or datetime.now())
+        # events logged in the last few seconds may still be in the activity buffer
+        if any(event["userID"] == user_id and event["user_activity"] == activity and gte <= event["timestamp"] <= lte
+               for event in activity_buffer.events()):
+            return True
+        document = await self.activity_collection.find_one( {
             "userID": user_id,
-            "user_activity": activity,
-            "timestamp": {"$gte": gte, "$lte": lte} 
-        } )
+            "day": time_range(_day(gte), _day(lte)),
+            "events": {"$elemMatch": {"user_activity": activity, "timestamp": time_range(gte, lte)}}
+        }, {"_id": 1} )
         from utils.logger import logger
         logger.info(f"document: {document}\nuser: {user_id}, gte: {gte}, lt: {lte}, activity: {activity}")
         if document:
@@ -185,32 +688,37 @@ class Database:
         else:
             return False
 
-    def log_sms_message(self, user_id: int, msg: str, msg_code: int):
+    async def log_sms_message(self, user_id: int, msg: str, msg_code: int):
         msg_document = {
             "userID": user_id,
             "msg": msg,
             "msg-code": msg_code,
-            "timestamp": datetime.now().strftime("%Y%m%d %H:%M")
+            "timestamp": datetime.now()
         }
-        self.sms_collection.insert_one(msg_document)
+        await self.sms_collection.insert_one(msg_document)
     
-    def add_new_user(
+    async def add_new_user(
         self,
         user_id,
         username: str = "",
-        first_seen: str = datetime.now().strftime("%Y-%m-%d %H:%M")
+        first_seen: datetime = None
     ):
         user_dict = {
             "_id": user_id,
             "username": username,
-            "first-seen": first_seen,
+            "first-seen": first_seen or datetime.now(),
             # "phone-number": "",
             # "name": "",
             "blocked": False
         }
+        user_dict["segments"] = _user_segments(user_dict)
+        user_dict["menu-state"] = _menu_state(user_dict)
 
-        if not self.check_if_user_exists(user_id=user_id):
-            self.user_collection.insert_one(user_dict)
+        if not await self.check_if_user_exists(user_id=user_id):
+            await self.user_collection.insert_one(user_dict)
+            uow = _unit_of_work.get()
+            if uow is not None:
+                uow.users[user_id] = copy.deepcopy(user_dict)
 
     def get_admins(self) -> list:
         """Return a list of admin IDs"""
@@ -218,97 +726,351 @@ class Database:
         # admins = [int(admin) for admin in admins]
         # return admins
 
-    def add_new_farm(self, user_id, farm_name: str, new_farm: dict):
-        self.user_collection.update_one(
-            {"_id": user_id},
-            {"$set": {f"farms.{farm_name}": new_farm}}
+    async def add_new_farm(self, user_id, farm_name: str, new_farm: dict):
+        await self.farm_collection.replace_one(
+            {"user_id": user_id, "name": farm_name}, _farm_document(user_id, farm_name, new_farm), upsert=True
+        )
+        self._patch_cached_farm(user_id, farm_name, new_farm)
+        await self._update_user_state(user_id)
+
+    async def update_farm(self, user_id: int, farm_name: str, fields: dict) -> bool:
+        """Sets several fields of an existing farm in one round trip.
+
+        The fields derived from the location are written in the same update, and the user's
+        segments and menu state are only recomputed when the product or the location changes.
+
+        Args:
+            fields (dict): values keyed by paths relative to the farm, e.g. `{"location.latitude": 35.7, "location-method": "Link"}`
+        Returns:
+            bool: False if the user has no farm called `farm_name`
+        """
+        derived = _location_update_fields(fields)
+        farm = await self.farm_collection.find_one_and_update(
+            {"user_id": user_id, "name": farm_name}, {"$set": {**fields, **(derived or {})}},
+            return_document=ReturnDocument.AFTER
         )
+        if not farm:
+            return False
+        if derived is None:
+            # Only one coordinate was written, the derived fields depend on the stored other one
+            stale = _stale_farm_fields(farm)
+            if stale:
+                await self.farm_collection.update_one({"_id": farm["_id"]}, {"$set": stale})
+                farm.update(stale)
+        self._patch_cached_farm(user_id, farm_name, _farm_fields(farm))
+        if "product" in fields or any(key.split(".")[0] == "location" for key in fields):
+            await self._update_user_state(user_id)
+        return True
+
+    async def update_farms(self, updates: list[tuple[int, str, dict]]) -> list[tuple[int, str]]:
+        """Bulk `update_farm` for admin tools, `updates` being `(user_id, farm_name, fields)` tuples.
+
+        Returns:
+            list[tuple[int, str]]: the `(user_id, farm_name)` pairs that didn't match an existing farm
+        """
+        if not updates:
+            return []
+        await self.farm_collection.bulk_write([
+            UpdateOne({"user_id": user_id, "name": farm_name}, {"$set": fields})
+            for user_id, farm_name, fields in updates
+        ], ordered=False)
+        user_ids = list({user_id for user_id, _, _ in updates})
+        farms = {(farm["user_id"], farm["name"]): farm async for farm in self.farm_collection.find(
+            {"$or": [{"user_id": user_id, "name": farm_name} for user_id, farm_name, _ in updates]})}
+        stale = [(farm["_id"], _stale_farm_fields(farm)) for farm in farms.values()]
+        stale = [UpdateOne({"_id": farm_id}, {"$set": fields}) for farm_id, fields in stale if fields]
+        if stale:
+            await self.farm_collection.bulk_write(stale, ordered=False)
+        for user_id in user_ids:
+            self._forget_cached_user(user_id)
+            await self._update_user_state(user_id)
+        return [(user_id, farm_name) for user_id, farm_name, _ in updates if (user_id, farm_name) not in farms]
+
+    async def delete_farm(self, user_id: int, farm_name: str):
+        await self.farm_collection.delete_one({"user_id": user_id, "name": farm_name})
+        self._patch_cached_farm(user_id, farm_name, None)
+        await self._update_user_state(user_id)
+
+    async def migrate_farms(self, batch_size: int = 1000) -> int:
+        """Moves the `farms.{name}` maps of the user documents into farmCollection.
+
+        Each batch of farms is upserted before it is unset on the users, so the migration can be
+        stopped and started again.
+        """
+        migrated = 0
+        while True:
+            users = await self.user_collection.find({"farms": {"$exists": True}}, {"farms": 1}).limit(batch_size).to_list(None)
+            if not users:
+                break
+            farms = [
+                ReplaceOne({"user_id": user["_id"], "name": name}, _farm_document(user["_id"], name, farm), upsert=True)
+                for user in users for name, farm in (user["farms"] or {}).items() if isinstance(farm, dict)
+            ]
+            if farms:
+                await self.farm_collection.bulk_write(farms, ordered=False)
+            await self.user_collection.update_many({"_id": {"$in": [user["_id"] for user in users]}},
+                                                   {"$unset": {"farms": ""}})
+            migrated += len(farms)
+        return migrated
+
+    async def refresh_farm_locations(self, batch_size: int = 1000) -> int:
+        """Recomputes `located`, `geo` and `grid` of every farm and writes the ones that are out of date."""
+        updates = []
+        corrected = 0
+        async for farm in self.farm_collection.find({}, {"location": 1, "located": 1, "geo": 1, "grid": 1}, batch_size=batch_size):
+            stale = _stale_farm_fields(farm)
+            if stale:
+                updates.append(UpdateOne({"_id": farm["_id"]}, {"$set": stale}))
+            if len(updates) >= batch_size:
+                await self.farm_collection.bulk_write(updates, ordered=False)
+                corrected += len(updates)
+                updates = []
+        if updates:
+            await self.farm_collection.bulk_write(updates, ordered=False)
+            corrected += len(updates)
+        return corrected
+
+    async def refresh_grid_cells(self, batch_size: int = 1000) -> int:
+        """Resolves the cells of located farms in the loaded forecast grids they have no cell in yet.
+
+        Location writes keep the cells current, so this only has work to do when a new grid
+        definition is loaded. Each batch is resolved against each grid with one `nearest_many`.
+        Returns the number of farms updated.
+        """
+        grids = forecast_store.grids()
+        if not grids:
+            return 0
+        query = {"located": True, "$or": [{f"grid.cells.{grid_id}": {"$exists": False}} for grid_id in grids]}
+        updates = []
+        updated = 0
+        batch = []
+        async for farm in self.farm_collection.find(query, {"location": 1, "grid": 1}, batch_size=batch_size):
+            if _geo_point(farm) is not None:
+                batch.append(farm)
+            if len(batch) >= batch_size:
+                updates.extend(_grid_cell_updates(batch, grids))
+                batch = []
+            if len(updates) >= batch_size:
+                await self.farm_collection.bulk_write(updates, ordered=False)
+                updated += len(updates)
+                updates = []
+        if batch:
+            updates.extend(_grid_cell_updates(batch, grids))
+        if updates:
+            await self.farm_collection.bulk_write(updates, ordered=False)
+            updated += len(updates)
+        return updated
+
+    async def get_farms_within_radius(self, latitude: float, longitude: float, radius_km: float,
+                                      projection: dict = None) -> list[dict]:
+        """Farms located at most `radius_km` from the point, through the `geo` 2dsphere index.
+
+        Returns:
+            list[dict]: farm documents, with `user_id` and `name`
+        """
+        query = {"geo": {"$geoWithin": {"$centerSphere": [[longitude, latitude], radius_km / EARTH_RADIUS_KM]}}}
+        return await self.farm_collection.find(query, projection).to_list(None)
+
+    async def get_farms_in_polygon(self, polygon: list[tuple[float, float]], projection: dict = None) -> list[dict]:
+        """Farms located inside `polygon`, a list of (longitude, latitude) vertices. The ring is closed if needed."""
+        ring = [list(vertex) for vertex in polygon]
+        if ring[0] != ring[-1]:
+            ring.append(ring[0])
+        query = {"geo": {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": [ring]}}}}
+        return await self.farm_collection.find(query, projection).to_list(None)
 
-    def add_token(self, user_id: int, value: str):
+    async def get_users_within_radius(self, latitude: float, longitude: float, radius_km: float) -> list[int]:
+        farms = await self.get_farms_within_radius(latitude, longitude, radius_km, {"user_id": 1})
+        return list(dict.fromkeys(farm["user_id"] for farm in farms))
+
+    async def get_users_in_polygon(self, polygon: list[tuple[float, float]]) -> list[int]:
+        farms = await self.get_farms_in_polygon(polygon, {"user_id": 1})
+        return list(dict.fromkeys(farm["user_id"] for farm in farms))
+
+    async def add_token(self, user_id: int, value: str):
         token_dict = {
             "owner": user_id,
             "token-value": value,
-            "time-created": datetime.now().strftime("%Y%m%d %H:%M"),
+            "time-created": datetime.now(),
             "used-by": [],
         }
-        self.token_collection.insert_one(token_dict)
+        await self.token_collection.insert_one(token_dict)
 
-    def log_token_use(self, user_id: int, value: str) -> int:
-        token_document = self.token_collection.find_one({ "token-value": value })
+    async def log_token_use(self, user_id: int, value: str) -> int:
+        token_document = await self.token_collection.find_one({ "token-value": value })
         if token_document:
             owner = token_document.get("owner")
-            self.token_collection.update_one({"token-value": value}, {"$push": {"used-by": user_id}})
-            self.user_collection.update_one({"_id": user_id}, {"$set": {"invited-by": owner}})
+            await self.token_collection.update_one({"token-value": value}, {"$push": {"used-by": user_id}})
+            await self.user_collection.update_one({"_id": user_id}, {"$set": {"invited-by": owner}})
+            self._patch_cached_user(user_id, "$set", "invited-by", owner)
 
-    def calc_token_number(self, value: str):
-        token_document = self.token_collection.find_one({ "token-value": value })
+    async def calc_token_number(self, value: str):
+        token_document = await self.token_collection.find_one({ "token-value": value })
         return len(token_document['used-by'])
 
-    def calc_user_tokens(self, user_id: int) -> int:
+    async def calc_user_tokens(self, user_id: int) -> int:
         user_tokens = self.token_collection.find( {"owner": user_id} )
         num = 0
-        if user_tokens:            
-            for token in user_tokens:
-                num += len(token["used-by"])
+        async for token in user_tokens:
+            num += len(token["used-by"])
         return num
 
 
-    def get_user_attribute(self, user_id: int, key: str):
-        self.check_if_user_exists(user_id=user_id, raise_exception=True)
-        user_dict = self.user_collection.find_one({"_id": user_id})
+    async def get_user_attribute(self, user_id: int, key: str):
+        await self.check_if_user_exists(user_id=user_id, raise_exception=True)
+        user_dict = await self.get_user_document(user_id)
 
         if key not in user_dict:
             return None
         return user_dict[key]
     
-    def set_user_attribute(self, user_id: int, key: str, value: any, array: bool = False):
-        self.check_if_user_exists(user_id=user_id, raise_exception=True)
+    async def set_user_attribute(self, user_id: int, key: str, value: any, array: bool = False):
+        await self.check_if_user_exists(user_id=user_id, raise_exception=True)
         if not array:
-            self.user_collection.update_one({"_id": user_id}, {"$set": {key: value}})
+            await self.user_collection.update_one({"_id": user_id}, {"$set": {key: value}})
+            self._patch_cached_user(user_id, "$set", key, copy.deepcopy(value))
         else:
-            self.user_collection.update_one({"_id": user_id}, {"$push": {key: value}})
+            await self.user_collection.update_one({"_id": user_id}, {"$push": {key: value}})
+            self._patch_cached_user(user_id, "$push", key, copy.deepcopy(value))
+        if key.split(".")[0] in SEGMENT_FIELDS + MENU_STATE_FIELDS:
+            await self._update_user_state(user_id)
+
+    async def _update_user_state(self, user_id: int) -> str:
+        """Recomputes `segments` and `menu-state` of a user, writing them only if they changed.
+
+        Returns:
+            str: the menu state
+        """
+        document = await self.get_user_document(user_id)
+        if document is None:
+            return _menu_state(None)
+        farms = await self.get_farm_map(user_id)
+        state = {"segments": _user_segments({**document, "farms": farms}),
+                 "menu-state": _menu_state({**document, "farms": farms})}
+        changed = {key: value for key, value in state.items() if document.get(key) != value}
+        if changed:
+            await self.user_collection.update_one({"_id": user_id}, {"$set": changed})
+            for key, value in changed.items():
+                self._patch_cached_user(user_id, "$set", key, copy.deepcopy(value))
+        return state["menu-state"]
+
+    async def get_segment(self, name: str) -> list[int]:
+        return [user["_id"] async for user in self.user_collection.find({"segments": name}, {"_id": 1})]
+
+    async def get_segment_info(self, name: str) -> dict:
+        segment = await self.segment_collection.find_one({"_id": name}) or {}
+        return {"count": await self.user_collection.count_documents({"segments": name}),
+                "refreshed": segment.get("refreshed")}
+
+    async def refresh_segments(self, batch_size: int = 1000) -> int:
+        """Recomputes the segments and menu state of every user, fixing whatever the incremental updates missed.
+
+        `pressed-register` is only ever raised from the activity logs: `log_activity` sets it directly,
+        and the logs can miss a press that expired or is still in the activity buffer.
+        Returns the number of corrected users.
+        """
+        not_pressed = {user_id async for user_id in self.iter_register_not_pressed()}
+        updates = []
+        corrected = 0
+        projection = {field: 1 for field in SEGMENT_FIELDS + MENU_STATE_FIELDS + ["segments", "menu-state"]}
+        users = self.user_collection.find({}, projection, batch_size=batch_size).sort("_id", ASCENDING)
+        async for document in self._with_farms(users, batch_size):
+            pressed = document.get("pressed-register") or document["_id"] not in not_pressed
+            state = {"segments": _user_segments({**document, "pressed-register": pressed}),
+                     "menu-state": _menu_state(document),
+                     "pressed-register": pressed}
+            if any(document.get(key) != value for key, value in state.items()):
+                updates.append(UpdateOne({"_id": document["_id"]}, {"$set": state}))
+            if len(updates) >= batch_size:
+                await self.user_collection.bulk_write(updates, ordered=False)
+                corrected += len(updates)
+                updates = []
+        if updates:
+            await self.user_collection.bulk_write(updates, ordered=False)
+            corrected += len(updates)
+        refreshed = datetime.now()
+        await self.segment_collection.bulk_write(
+            [UpdateOne({"_id": name}, {"$set": {"refreshed": refreshed}}, upsert=True) for name in SEGMENTS]
+        )
+        return corrected
     # def log_message_to_user(self, user_id: int, message: str):
     #     self.check_if_user_exists(user_id=user_id, raise_exception=True)
-    def save_coupon(self, text, value):
-        if not self.bot_collection.find_one( {"_id": "coupons"} ):
-            self.bot_collection.insert_one({"_id": "coupons", 'values': [{text: float(value)}]})
+    async def save_coupon(self, text, value, max_uses: int = None):
+        try:
+            await self.coupon_collection.insert_one({
+                "code": text,
+                "value": float(value),
+                "uses": 0,
+                "max-uses": max_uses,
+                "time-created": datetime.now(),
+            })
             return True
-        else:
-            coupons_doc = self.bot_collection.find_one( {"_id": "coupons"} )
-            coupons = [list(coupon.keys())[0] for coupon in coupons_doc["values"]]
-            if text in coupons:
-                return False
-            else:
-                self.bot_collection.update_one({"_id": "coupons"}, {"$push": {'values': {text: float(value)} }})
-                return True
+        except DuplicateKeyError:
+            return False
+        finally:
+            # after the write, so a concurrent verify_coupon can't cache the code as missing again
+            _coupon_cache.pop(text, None)
 
-    def verify_coupon(self, coupon: str):
-        coupons_doc = self.bot_collection.find_one( {"_id": "coupons"} )
-        if not coupons_doc:
+    async def verify_coupon(self, coupon: str):
+        cached = _coupon_cache.get(coupon)
+        if cached and cached[1] > time.monotonic():
+            coupon_doc = cached[0]
+        else:
+            coupon_doc = await self.coupon_collection.find_one({"code": coupon})
+            _coupon_cache[coupon] = (coupon_doc, time.monotonic() + COUPON_CACHE_TTL)
+        if not coupon_doc:
             return False
-        coupons = [list(coupon.keys())[0] for coupon in coupons_doc["values"]]
-        if coupon in coupons:
-            return True
-        else: return False
+        return coupon_doc.get("max-uses") is None or coupon_doc["uses"] < coupon_doc["max-uses"]
     
-    def apply_coupon(self, coupon: str, original: float) -> float:
-        coupons_doc = self.bot_collection.find_one( {"_id": "coupons"} )
-        coupons = coupons_doc["values"]
-        for item in coupons:
-            coupon_value = item.get(coupon)
-            if coupon_value:
-                new_value = original - coupon_value
-                return new_value
-        return original
-
-    def log_payment( self,
+    async def apply_coupon(self, coupon: str, original: float) -> float | None:
+        """Counts one use of `coupon` and returns the discounted price.
+
+        The capacity check and the increment happen in a single update, so a code with
+        `max-uses` can't be redeemed more often than that. Returns None if the code is
+        unknown or used up.
+        """
+        coupon_doc = await self.coupon_collection.find_one_and_update(
+            {"code": coupon, "$expr": {"$or": [{"$eq": [{"$ifNull": ["$max-uses", None]}, None]},
+                                               {"$lt": ["$uses", "$max-uses"]}]}},
+            {"$inc": {"uses": 1}},
+            projection={"value": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        _coupon_cache.pop(coupon, None)
+        if not coupon_doc:
+            return None
+        return original - coupon_doc["value"]
+
+    async def claim_coupon_use(self, user_id: int) -> bool:
+        """Sets `used-coupon` of a user in one conditional update. False if it was already set."""
+        result = await self.user_collection.update_one(
+            {"_id": user_id, "used-coupon": {"$ne": True}}, {"$set": {"used-coupon": True}}
+        )
+        if not result.modified_count:
+            return False
+        self._patch_cached_user(user_id, "$set", "used-coupon", True)
+        return True
+
+    async def migrate_coupons(self) -> int:
+        """Moves the coupons of the legacy `{"_id": "coupons"}` document into couponCollection."""
+        legacy = await self.bot_collection.find_one({"_id": "coupons", "values": {"$exists": True}})
+        if not legacy:
+            return 0
+        migrated = 0
+        for item in legacy["values"]:
+            for code, value in item.items():
+                migrated += await self.save_coupon(code, value)
+        await self._remove_legacy_fields([legacy], ["values"])
+        return migrated
+
+    async def log_payment( self,
                      user_id: int,
                      used_coupon: str = None,
                      reason: str = 'subscription',
                      amount: float = 500000.0,
                      verified: bool = False,
                      code: str = ""):
-        current_time = datetime.now().strftime("%Y%m%d %H:%M")
+        current_time = datetime.now()
         payment_dict = {
             'code': code,
             'time-approved': current_time,
@@ -317,62 +1079,99 @@ class Database:
             'coupon': used_coupon,
             'verified': verified
         }
-        self.set_user_attribute(user_id, 'payments', payment_dict, True)
+        await self.set_user_attribute(user_id, 'payments', payment_dict, True)
 
-    def add_coupon_to_payment_dict(self, user_id: int, code: str, coupon: str) -> None:
+    async def add_coupon_to_payment_dict(self, user_id: int, code: str, coupon: str) -> None:
         filter_query = {'_id': user_id,
                         'payments': {'$elemMatch': {'code': code} } }
         update_query = {'$set': { 'payments.$.coupon': coupon } }
-        self.user_collection.update_one(filter_query, update_query)
+        await self.user_collection.update_one(filter_query, update_query)
+        self._forget_cached_user(user_id)
 
-    def modify_final_price_in_payment_dict(self, user_id: int, code: str, final_price: float) -> None:
+    async def modify_final_price_in_payment_dict(self, user_id: int, code: str, final_price: float) -> None:
         filter_query = {'_id': user_id,
                         'payments': {'$elemMatch': {'code': code} } }
         update_query = {'$set': { 'payments.$.amount': final_price } }
-        self.user_collection.update_one(filter_query, update_query)
+        await self.user_collection.update_one(filter_query, update_query)
+        self._forget_cached_user(user_id)
 
-    def get_final_price(self, user_id: int, code: str):
-        document = self.user_collection.find_one( {'_id': user_id,
-                                        'payments': {'$elemMatch': {'code': code} }} )
+    async def get_final_price(self, user_id: int, code: str):
+        document = await self.get_user_document(user_id)
         payment = next((payment for payment in document['payments'] if payment['code'] == code), None)
         return payment['amount']
 
-    def verify_payment(self, user_id: int, code: str):
+    async def verify_payment(self, user_id: int, code: str):
         filter_query = {'_id': user_id,
                         'payments': {'$elemMatch': {'code': code} } }
         update_query = {'$set': { 'payments.$.verified': True } }
-        self.user_collection.update_one(filter_query, update_query)
-        self.set_user_attribute(user_id, 'has-verified-payments', True)
+        await self.user_collection.update_one(filter_query, update_query)
+        self._forget_cached_user(user_id)
+        await self.set_user_attribute(user_id, 'has-verified-payments', True)
         
-    def process_coupon_use(self):
+    async def process_coupon_use(self):
         pass
 
-    def log_new_message(
+    async def log_new_message(
         self,
         user_id,
         username: str = "",
         message: str = "",
         function: str = "",
     ):
-        current_time = datetime.now().strftime("%Y%m%d %H:%M")
-        dialog_dict = {
-            "_id": user_id,
-            "username": username,
-            "message": [f"{current_time} - {function} - {message}"],
-            "function": [function]
-        }
+        current_time = datetime.now()
+        await self.dialog_collection.update_one(
+            {"userID": user_id, "day": _day(current_time), "count": {"$lt": DIALOG_BUCKET_SIZE}},
+            {
+                "$push": {"messages": {"timestamp": current_time, "function": function, "message": message}},
+                "$inc": {"count": 1},
+                "$set": {"username": username},
+            },
+            upsert=True,
+        )
 
-        if not self.check_if_dialog_exists(user_id=user_id):
-            self.dialog_collection.insert_one(dialog_dict)
-        else:
-            self.dialog_collection.update_one(
-                {"_id": user_id}, {
-                    "$push": {"message": f"{current_time} - {function} - {message}", "function": function}})
-    
+    async def get_last_messages(self, user_id: int, n: int = 20) -> list[dict]:
+        """Returns the last `n` messages sent to a user, oldest first."""
+        messages = []
+        cursor = self.dialog_collection.find({"userID": user_id}, {"messages": 1}).sort([("day", -1), ("_id", -1)])
+        async for bucket in cursor:
+            messages[:0] = bucket["messages"]
+            if len(messages) >= n:
+                break
+        return messages[-n:] if n else []
+
+    async def migrate_dialogs(self) -> int:
+        """Splits the legacy per-user `message` arrays of dialogCollection into daily buckets."""
+        migrated = 0
+        async for legacy in self.dialog_collection.find({"message": {"$exists": True}}):
+            days = {}
+            for entry in legacy["message"]:
+                timestamp, function, message = (entry.split(" - ", 2) + ["", ""])[:3]
+                # unparseable timestamps are kept as they are, in a bucket without a day
+                timestamp = _parse_timestamp(timestamp) or timestamp
+                day = _day(timestamp) if isinstance(timestamp, datetime) else None
+                days.setdefault(day, []).append({"timestamp": timestamp, "function": function, "message": message})
+            buckets = [
+                {
+                    "userID": legacy["_id"],
+                    "day": day,
+                    "username": legacy.get("username", ""),
+                    "count": len(messages[i:i + DIALOG_BUCKET_SIZE]),
+                    "messages": messages[i:i + DIALOG_BUCKET_SIZE],
+                }
+                for day, messages in sorted(days.items(), key=lambda item: item[0] or datetime.min)
+                for i in range(0, len(messages), DIALOG_BUCKET_SIZE)
+            ]
+            if buckets:
+                await self.dialog_collection.insert_many(buckets)
+            await self.dialog_collection.delete_one({"_id": legacy["_id"]})
+            migrated += 1
+        return migrated
 
-    def log_sent_messages(self, users: list, function: str = "") -> None:
-        current_time = datetime.now().strftime("%Y%m%d %H:%M")
-        usernames = [self.user_collection.find_one({"_id": user})["username"] for user in users]
+    async def log_sent_messages(self, users: list, function: str = "") -> None:
+        current_time = datetime.now()
+        cursor = self.user_collection.find({"_id": {"$in": users}}, {"username": 1})
+        usernames = {document["_id"]: document.get("username") async for document in cursor}
+        usernames = [usernames.get(user) for user in users]
         users = [str(user) for user in users]
         log_dict = {
             "time-sent": current_time,
@@ -381,119 +1180,266 @@ class Database:
             "number-of-receivers": len(users),
             "receivers": dict(zip(users, usernames))
         }
-        self.bot_collection.insert_one(log_dict)
+        await self.bot_collection.insert_one(log_dict)
 
-    def log_member_changes(
+    async def log_member_changes(
         self,
         members: int = 0,
-        time: str = "",
+        time: datetime = None,
     ):
-        bot_members_dict = {
-            "num-members": [members],
-            "time-stamp": [time]
-        }
+        await self.member_count_collection.insert_one({"timestamp": time or datetime.now(), "members": members})
 
-        if self.bot_collection.count_documents({}) == 0:
-            self.bot_collection.insert_one(bot_members_dict)
-        else:
-            self.bot_collection.update_one({}, {"$push": {"num-members": members, "time-stamp": time}})
+    async def get_member_counts(self, start: datetime, end: datetime = None, max_points: int = 30) -> list[dict]:
+        """Member count points between `start` and `end`, downsampled on the server.
+
+        Points are grouped into at most `max_points` time buckets and each bucket is represented
+        by its latest point.
+        """
+        pipeline = [
+            {"$match": {"timestamp": time_range(start, end or datetime.now())}},
+            {"$bucketAuto": {
+                "groupBy": "$timestamp",
+                "buckets": max_points,
+                "output": {"timestamp": {"$max": "$timestamp"}, "members": {"$last": "$members"}},
+            }},
+            {"$project": {"_id": 0, "timestamp": 1, "members": 1}},
+        ]
+        return [point async for point in self.member_count_collection.aggregate(pipeline)]
 
-    def log_activity(self, user_id: int, user_activity: str, provided_value: str = ""):
+    async def migrate_member_counts(self) -> int:
+        """Turns the legacy `num-members`/`time-stamp` arrays of botCollection into member count points.
+
+        Points whose time-stamp matches none of `TIMESTAMP_FORMATS` (e.g. the empty default) are skipped.
+        """
+        from utils.logger import logger
+        migrated = 0
+        async for legacy in self.bot_collection.find({"num-members": {"$exists": True}}):
+            points = []
+            for members, time in zip(legacy["num-members"], legacy["time-stamp"]):
+                timestamp = time if isinstance(time, datetime) else _parse_timestamp(time) if isinstance(time, str) else None
+                if timestamp is None:
+                    logger.warning(f"skipped the member count {members} of {legacy['_id']}, time-stamp {time!r}")
+                    continue
+                points.append({"timestamp": timestamp, "members": members})
+            if points:
+                await self.member_count_collection.insert_many(points)
+            await self._remove_legacy_fields([legacy], ["num-members", "time-stamp"])
+            migrated += len(points)
+        return migrated
+
+    async def _remove_legacy_fields(self, documents: list[dict], fields: list[str]) -> None:
+        """Unsets `fields` of botCollection documents, deleting the ones that have nothing else left.
+
+        `log_member_changes` used to push into whichever document came first, so a coupons or an
+        activity log document can also hold the member count arrays, and the other way round.
+        """
+        shared = [document["_id"] for document in documents if set(document) - {"_id", *fields}]
+        alone = [document["_id"] for document in documents if document["_id"] not in shared]
+        if shared:
+            await self.bot_collection.update_many({"_id": {"$in": shared}}, {"$unset": {field: "" for field in fields}})
+        if alone:
+            await self.bot_collection.delete_many({"_id": {"$in": alone}})
+
+    async def log_activity(self, user_id: int, user_activity: str, provided_value: str = ""):
+        uow = _unit_of_work.get()
+        if uow is not None and uow.effective_user is not None and uow.effective_user.id == user_id:
+            username = uow.effective_user.username
+        else:
+            username = (await self.get_user_document(user_id))["username"]
         activity = {
             "user_activity": user_activity,
             "type": "activity logs",
             "value": provided_value,
             "userID": user_id,
-            "username": self.user_collection.find_one({"_id": user_id})["username"],
-            "timestamp": datetime.now().strftime("%Y%m%d %H:%M")
+            "username": username,
+            "timestamp": datetime.now()
         }
-        self.bot_collection.insert_one(activity)
+        activity_buffer.add(activity)
+        if user_activity == "start register":
+            await self.user_collection.update_one(
+                {"_id": user_id}, {"$set": {"pressed-register": True}, "$pull": {"segments": "register-not-pressed"}}
+            )
+            self._forget_cached_user(user_id)
+        if activity_buffer.should_flush():
+            activity_buffer.flush_in_background(self.flush_activity_logs)
+
+    async def flush_activity_logs(self) -> int:
+        token = current_operation.set("flush_activity_logs")
+        try:
+            return await activity_buffer.flush(self._flush_activity_buckets)
+        finally:
+            current_operation.reset(token)
+
+    async def _write_activity_buckets(self, events: list[dict]) -> None:
+        await self.activity_collection.bulk_write(_activity_bucket_updates(events), ordered=False)
+
+    async def _flush_activity_buckets(self, events: list[dict]) -> int:
+        """`_write_activity_buckets` for the activity buffer, returns the number of events written.
+
+        The bucket upserts are unordered, so when some of them are rejected (e.g. a duplicate key)
+        the others are still written. Only the events of the rejected buckets are lost.
+        """
+        try:
+            await self._write_activity_buckets(events)
+        except BulkWriteError as e:
+            from utils.logger import logger
+            errors = e.details.get("writeErrors", [])
+            rejected = sum(error["op"]["u"]["$inc"]["count"] for error in errors)
+            logger.error(f"{rejected} activity logs in {len(errors)} buckets were rejected: "
+                         f"{[(error['code'], error['errmsg']) for error in errors]}")
+            return len(events) - rejected
+        return len(events)
+
+    async def migrate_activity_logs(self, batch_size: int = 5000) -> int:
+        """Moves the "activity logs" documents of botCollection into activityCollection buckets.
+
+        Each batch is written to the buckets before it is deleted from botCollection, so the
+        migration can be stopped and started again.
+        """
+        migrated = 0
+        while True:
+            batch = await self.bot_collection.find({"type": "activity logs"}).limit(batch_size).to_list(None)
+            if not batch:
+                break
+            await self._write_activity_buckets(batch)
+            await self._remove_legacy_fields(batch, ACTIVITY_LOG_FIELDS)
+            migrated += len(batch)
+        for index in ["userID_activity_timestamp", "activity_userID"]:
+            if index in await self.bot_collection.index_information():
+                await self.bot_collection.drop_index(index)
+        return migrated
 
-    def get_farms(self, user_id):
-        if not self.check_if_user_is_registered(user_id=user_id):
+    async def migrate_timestamps(self, batch_size: int = 1000) -> int:
+        """Converts the string timestamps written before datetimes into datetimes, in `_id` order batches.
+
+        Strings that match none of `TIMESTAMP_FORMATS` are left as they are.
+        """
+        def convert(value):
+            return (_parse_timestamp(value) or value) if isinstance(value, str) else value
+
+        def convert_user(user: dict) -> dict:
+            fields = {}
+            if "first-seen" in user:
+                fields["first-seen"] = convert(user["first-seen"])
+            if user.get("payments"):
+                fields["payments"] = [{**payment, "time-approved": convert(payment.get("time-approved"))}
+                                      for payment in user["payments"]]
+            return fields
+
+        def convert_bucket(bucket: dict, array: str) -> dict:
+            items = [{**item, "timestamp": convert(item.get("timestamp"))} for item in bucket.get(array) or []]
+            return {"day": convert(bucket.get("day")), array: items}
+
+        string = {"$type": "string"}
+        migrations = [
+            (self.user_collection, {"$or": [{"first-seen": string}, {"payments.time-approved": string}]}, convert_user),
+            (self.activity_collection, {"$or": [{"day": string}, {"events.timestamp": string}]},
+             lambda bucket: convert_bucket(bucket, "events")),
+            (self.dialog_collection, {"$or": [{"day": string}, {"messages.timestamp": string}]},
+             lambda bucket: convert_bucket(bucket, "messages")),
+            (self.token_collection, {"time-created": string}, lambda token: {"time-created": convert(token["time-created"])}),
+            (self.coupon_collection, {"time-created": string}, lambda coupon: {"time-created": convert(coupon["time-created"])}),
+            (self.sms_collection, {"timestamp": string}, lambda sms: {"timestamp": convert(sms["timestamp"])}),
+            (self.bot_collection, {"time-sent": string}, lambda log: {"time-sent": convert(log["time-sent"])}),
+        ]
+        converted = 0
+        for collection, query, fields in migrations:
+            last_id = None
+            while True:
+                page = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+                batch = await collection.find(page).sort("_id", ASCENDING).limit(batch_size).to_list(None)
+                if not batch:
+                    break
+                await collection.bulk_write([UpdateOne({"_id": document["_id"]}, {"$set": fields(document)})
+                                             for document in batch], ordered=False)
+                converted += len(batch)
+                last_id = batch[-1]["_id"]
+        return converted
+
+    async def get_farms(self, user_id):
+        if not await self.check_if_user_is_registered(user_id=user_id):
             return []
-        user = self.user_collection.find_one( {"_id": user_id} )
-        # provinces = user.get("provinces")
-        # cities = user.get("cities")
-        # villages = user.get("villages")
-        # areas = user.get("areas")
-        # locations = user.get("locations")
-        # equality = len(provinces) == len(cities) == len(villages) == len(areas) == len(locations)
-        farms = user.get("farms")
-        return farms
+        return await self.get_farm_map(user_id)
     
-    def get_users_with_location(self):
-        pipeline = [
-                {"$match": {"$and": [
-                        { "farms": { "$exists": True } },
-                        { "farms": { "$ne": None } },
-                        { "farms": { "$ne": {} } }
-                        ]
-                    }
-                },
-                {"$addFields": {
-                    "farmsArray": { "$objectToArray": "$farms" }
-                    }
-                },
-                {"$redact": {
-                    "$cond": {
-                        "if": {
-                        "$anyElementTrue": {
-                            "$map": {
-                            "input": "$farmsArray",
-                            "as": "farm",
-                            "in": {
-                                "$and": [
-                                { "$ne": ["$$farm.v.location.latitude", None] },
-                                { "$ne": ["$$farm.v.location.longitude", None] }
-                                ]
-                            }
-                            }
-                        }
-                        },
-                        "then": "$$KEEP",
-                        "else": "$$PRUNE"
-                    }
-                    }
-                },
-                {"$project": {
-                    "_id": 1
-                    }
-                }
-                ]
+    async def get_forecast_farms(self, batch_size: int = 1000) -> list[dict]:
+        """Farms of registered users that have a location or a village, for the daily forecast fanout.
 
-        cursor = self.user_collection.aggregate(pipeline) # users who have atleast one farm with no location
-        users = [user["_id"] for user in cursor]
-        return users
+        One projected query over farmCollection, in user order and in the order each user's farms were added.
+        The farms are streamed and each batch is filtered by one query for the registered users among its owners.
+        """
+        query = {"$or": [{"located": True}, {"village": {"$nin": [None, ""]}}]}
+        projection = {"_id": 0, "user_id": 1, "name": 1, "location": 1, "province": 1, "city": 1, "village": 1, "grid": 1}
+        cursor = self.farm_collection.find(query, projection, batch_size=batch_size).sort(
+            [("user_id", ASCENDING), ("_id", ASCENDING)])
+        registered = {field: {"$exists": True} for field in REQUIRED_FIELDS}
+        farms = []
+        batch = []
+        async for farm in cursor:
+            batch.append(farm)
+            if len(batch) >= batch_size:
+                farms += await self._registered_farms(batch, registered)
+                batch = []
+        if batch:
+            farms += await self._registered_farms(batch, registered)
+        return farms
 
-    def get_users_without_location(self):
-        pipeline = [
-            { "$addFields": { "farmsArray": { "$objectToArray": "$farms" } } },
-            { "$match": { "farmsArray.v.location.latitude": None, "farmsArray.v.location.longitude": None } },
-            { "$project": { "_id": 1 } }
-        ]
-        cursor = self.user_collection.aggregate(pipeline) # users who have atleast one farm with no location
-        users = [user["_id"] for user in cursor]
-        return users
+    async def _registered_farms(self, farms: list[dict], registered: dict) -> list[dict]:
+        user_ids = list({farm["user_id"] for farm in farms})
+        users = {user["_id"] async for user in self.user_collection.find({"_id": {"$in": user_ids}, **registered}, {"_id": 1})}
+        return [farm for farm in farms if farm["user_id"] in users]
+
+    async def get_users_with_location(self):
+        # users who have atleast one farm with a location
+        return await self.farm_collection.distinct("user_id", {"located": True})
 
-    def get_users_without_phone(self):
+    async def get_users_without_location(self):
+        # users who have no farms or atleast one farm with no location, kept in the without-location segment
+        return await self.get_segment("without-location")
+
+    async def get_users_without_phone(self):
         pipeline = [
             { "$match": {"$or": [ {"phone-number": None}, {"phone-number": ""} ] } },
             { "$project": { "_id": 1 } }
         ]
         cursor = self.user_collection.aggregate(pipeline) # users with no phone number
-        users = [user["_id"] for user in cursor]
+        users = [user["_id"] async for user in cursor]
         return users
 
-    def number_of_members(self) -> int:
-        members = self.user_collection.distinct("_id")
-        return len(members)
+    async def number_of_members(self) -> int:
+        return await self.user_collection.count_documents({})
     
-    def number_of_blocks(self) -> int:
-        blocked_users = self.user_collection.count_documents({"blocked": True})
+    async def number_of_blocks(self) -> int:
+        blocked_users = await self.user_collection.count_documents({"blocked": True})
         return blocked_users
+
+    async def refresh_stats(self) -> dict:
+        """Computes the /stats counters in a single pass over the user collection.
+
+        `no-location` and `no-phone` match get_users_without_location and get_users_without_phone.
+        """
+        def count(*stages):
+            return [*stages, {"$count": "n"}]
+        pipeline = [
+            {"$project": {"blocked": 1, "phone-number": 1, "segments": 1}},
+            {"$facet": {
+                "members": count(),
+                "blocked": count({"$match": {"blocked": True}}),
+                "no-phone": count({"$match": {"$or": [{"phone-number": None}, {"phone-number": ""}]}}),
+                "no-location": count({"$match": {"segments": "without-location"}}),
+            }},
+        ]
+        facets = (await self.user_collection.aggregate(pipeline).to_list(None))[0]
+        stats = {key: value[0]["n"] if value else 0 for key, value in facets.items()}
+        stats["time"] = datetime.now()
+        _stats_snapshot.update(stats=stats, expires=time.monotonic() + STATS_TTL)
+        return stats
+
+    async def get_stats(self) -> dict:
+        if _stats_snapshot["stats"] and _stats_snapshot["expires"] > time.monotonic():
+            return _stats_snapshot["stats"]
+        return await self.refresh_stats()
     
-    def populate_user_collection(
+    async def populate_user_collection(
             self,
             user_id,
             username: str = "",
@@ -505,7 +1451,7 @@ class Database:
             phone_number: str = "",
             name: str = "",
             location: dict = {},
-            first_seen: str = datetime.now().strftime("%Y-%m-%d %H:%M")
+            first_seen: datetime | None = None
         ):
             user_dict = {
                 "_id": user_id,
@@ -518,14 +1464,16 @@ class Database:
                 "phone-number": phone_number,
                 "name": name,
                 "locations": [location],
-                "first-seen": first_seen
+                "first-seen": first_seen or datetime.now()
                 # "first-seen": datetime.now().strftime("%Y-%m-%d %H:%m:%s"),
             }
 
-            if not self.check_if_user_exists(user_id=user_id):
-                self.user_collection.insert_one(user_dict)
-                print(f"added {user_id} to userCollection")
-    def populate_mongodb_from_pickle(self):
+            if not await self.check_if_user_exists(user_id=user_id):
+                await self.user_collection.insert_one(user_dict)
+                self._forget_cached_user(user_id)
+                from utils.logger import logger
+                logger.info(f"added {user_id} to userCollection")
+    async def populate_mongodb_from_pickle(self):
         with open("bot_data.pickle", "rb") as f:
             user_data = pickle.load(f)["user_data"]
         for key in user_data:
@@ -539,63 +1487,41 @@ class Database:
             name = user_data[key].get("name", "")
             location = user_data[key].get("location", {})
             first_seen = user_data[key].get("join-date")
-            self.populate_user_collection(key, username, product, province, city, village, area, phone_number, name, location, first_seen)
-
-
-    def to_excel(self, output_file: str) -> None:
-        user_df = pd.DataFrame(columns=['id', 'username', 'phone', 'first-seen', 'name', 'blocked', 'farm name', 'product', 'province', 'city', 'village','area', 'latitude', 'longitude', 'location method'])
-        users = self.user_collection.distinct("_id")
-        i = 0
-        for user_id in users:
-            document = self.user_collection.find_one({"_id": user_id})
-            farms = self.get_farms(user_id=user_id)
-            if not farms:
-                user_df.loc[i] = pd.Series({
-                'id': user_id,
-                'username': document.get('username'),
-                'phone': document.get('phone-number'),
-                'first-seen': document.get('first-seen'),
-                'name': document.get('name'),
-                'blocked': document.get('blocked'),
-            })
-            elif len(farms) == 1:
-                farm_name = list(farms.keys())[0]
-                user_df.loc[i] = pd.Series({
-                    'id': user_id,
-                    'username': document.get('username'),
-                    'phone': document.get('phone-number'),
-                    'first-seen': document.get('first-seen'),
-                    'name': document.get('name'),
-                    'blocked': document.get('blocked'),
-                    'farm name': farm_name,
-                    'area': farms[farm_name].get('area'),
-                    'product': farms[farm_name].get('product'),
-                    'province': farms[farm_name].get('province'),
-                    'city': farms[farm_name].get('city'),
-                    'village': farms[farm_name].get('village'),
-                    'latitude': farms[farm_name]['location'].get('latitude'),
-                    'longitude': farms[farm_name]['location'].get('longitude'),
-                    'location method': farms[farm_name].get('location-method'),
-                })
-                i += 1
-            elif len(farms) > 1:
-                for key in farms:
-                    user_df.loc[i] = pd.Series({
-                        'id': user_id,
-                        'username': document.get('username'),
-                        'phone': document.get('phone-number'),
-                        'first-seen': document.get('first-seen'),
-                        'name': document.get('name'),
-                        'blocked': document.get('blocked'),
-                        'farm name': key,
-                        'area': farms[key].get('area'),
-                        'product': farms[key].get('product'),
-                        'province': farms[key].get('province'),
-                        'city': farms[key].get('city'),
-                        'village': farms[key].get('village'),
-                        'latitude': farms[key]['location'].get('latitude'),
-                        'longitude': farms[key]['location'].get('longitude'),
-                        'location method': farms[key].get('location-method'),
-                    })
-                    i += 1
-        user_df.to_excel(output_file)
+            if isinstance(first_seen, str):
+                first_seen = _parse_timestamp(first_seen)
+            await self.populate_user_collection(key, username, product, province, city, village, area, phone_number, name, location, first_seen)
+
+
+    async def to_excel(self, output_file: str, progress: Callable = None, chunk_size: int = 2000) -> int:
+        """Streams every member into `output_file` (.xlsx, or .csv) with one projected cursor.
+
+        Rows are written in chunks on a worker thread so the event loop stays free, and
+        `progress(exported_users, total_users)` is awaited after each chunk.
+        Returns the number of exported users.
+        """
+        total = await self.user_collection.estimated_document_count()
+        if output_file.endswith(".csv"):
+            file = open(output_file, "w", newline="", encoding="utf-8-sig")
+            append_row = csv.writer(file).writerow
+        else:
+            file = openpyxl.Workbook(write_only=True)
+            append_row = file.create_sheet().append
+        exported = 0
+        rows = [EXPORT_COLUMNS]
+        try:
+            users = self.user_collection.find({}, EXPORT_PROJECTION, batch_size=chunk_size).sort("_id", ASCENDING)
+            async for document in self._with_farms(users, chunk_size):
+                rows.extend(_export_rows(document))
+                exported += 1
+                if exported % chunk_size == 0:
+                    await asyncio.to_thread(_append_rows, append_row, rows)
+                    rows = []
+                    if progress:
+                        await progress(exported, total)
+            await asyncio.to_thread(_append_rows, append_row, rows)
+            if isinstance(file, openpyxl.Workbook):
+                await asyncio.to_thread(file.save, output_file)
+        finally:
+            if not isinstance(file, openpyxl.Workbook):
+                file.close()
+        return exported
@@ -0,0 +1,16 @@
+"""Converts forecast GeoJSON drops to the columnar format the bot loads. Run from `src/`:
+
+    python ingest_forecasts.py data/Iran20240101_weather.geojson data/pesteh20240101_Advise_Bef.geojson ...
+
+The bot ingests new drops in data/ by itself; running this right after a drop saves the parse.
+"""
+import sys
+
+from utils.forecast_format import ingest
+from utils.logger import logger
+
+if __name__ == "__main__":
+    if not sys.argv[1:]:
+        sys.exit("usage: python ingest_forecasts.py FILE.geojson ...")
+    for path in sys.argv[1:]:
+        logger.info(f"ingested {path} into {ingest(path)}")
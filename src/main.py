@@ -8,6 +8,7 @@ from telegram.ext import (
     filters,
     CallbackQueryHandler,
     ContextTypes,
+    Application,
     ApplicationBuilder
 )
 from telegram.constants import ParseMode
@@ -19,6 +20,8 @@ import json
 import traceback
 
 import database
+from utils.mongo_monitoring import AttributedJobQueue, instrument_handlers
+from utils.forecast_store import FORECAST_POLL_INTERVAL, forecast_store
 
 from utils.regular_jobs import *
 from utils.keyboards import *
@@ -29,7 +32,7 @@ from utils.delete_conv import delete_conv_handler
 from utils.register_conv import register_conv_handler
 from utils.view_conv import view_conv_handler
 from utils.set_location_conv import set_location_handler
-from utils.admin import broadcast_handler, backup_send, stats_buttons, bot_stats
+from utils.admin import broadcast_handler, backup_send, stats_buttons, bot_stats, db_stats
 from utils.commands import invite, start, change_day, harvest_off_conv_handler, harvest_on_conv_handler, invite_conv
 from utils.payment_funcs import payment_link, verify_payment, off_conv_handler, verify_conv_handler, create_coupon
 from utils.harvest_conv import harvest_conv_handler
@@ -59,12 +62,33 @@ MENU_CMDS = ['✍️ ثبت نام', '📤 دعوت از دیگران', '🖼 م
 db = database.Database()
 ADMIN_LIST = db.get_admins()
 ###################################################################
+class UnitOfWorkApplication(Application):
+    """Handles every update inside a `database.UnitOfWork` so the user document is read once."""
+    async def process_update(self, update: object) -> None:
+        with database.UnitOfWork(effective_user=getattr(update, "effective_user", None)) as uow:
+            await super().process_update(update)
+        if uow.saved_round_trips:
+            logger.info(f"update {getattr(update, 'update_id', None)}: {uow.round_trips} user reads, "
+                        f"{uow.saved_round_trips} round trips saved by the unit of work")
+###################################################################
+async def on_startup(application: Application) -> None:
+    await db.ensure_indexes()
+    await db.check_indexes()
+    database.activity_buffer.start_periodic_flush(db.flush_activity_logs)
+    await forecast_store.refresh()
+    await db.refresh_grid_cells()
+
+async def flush_on_shutdown(application: Application) -> None:
+    database.activity_buffer.stop_periodic_flush()
+    flushed = await db.flush_activity_logs()
+    logger.info(f"flushed {flushed} activity logs on shutdown, {database.activity_buffer.dropped} were dropped")
+###################################################################
 ####################### MENU NAVIGATION ###########################
 async def home_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     reply_text = "return to the main menu"
-    db.log_activity(user.id, "navigated to home view")
-    if db.check_if_user_has_pesteh(user.id):
+    await db.log_activity(user.id, "navigated to home view")
+    if await db.check_if_user_has_pesteh(user.id):
         reply_markup = home_keyboard_pesteh_kar()
     else:
         reply_markup = start_keyboard_not_pesteh()
@@ -74,19 +98,19 @@ async def home_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def farm_management_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     reply_text = "manage the farms"
-    db.log_activity(user.id, "navigated to farm management view")
+    await db.log_activity(user.id, "navigated to farm management view")
     await update.message.reply_text(reply_text, reply_markup=manage_farms_keyboard())
 
 async def weather_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     reply_text = "the meteorology menu"
-    db.log_activity(user.id, "navigated to weather view")
+    await db.log_activity(user.id, "navigated to weather view")
     await update.message.reply_text(reply_text, reply_markup=start_keyboard_pesteh_kar())
 
 async def info_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     reply_text = "You can get information specific to your garden by selecting the below options"
-    db.log_activity(user.id, "navigated to farm info view")
+    await db.log_activity(user.id, "navigated to farm info view")
     await update.message.reply_text(reply_text, reply_markup=request_info_keyboard())
 
 async def payment_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -118,12 +142,12 @@ and many othere practical advices
 
 ✅✅ If you are not satisfied with the service at any time, the paid fee will be returned.
 """
-    db.log_activity(user.id, "navigated to payment view")
+    await db.log_activity(user.id, "navigated to payment view")
     await update.message.reply_text(reply_text, parse_mode=ParseMode.HTML, reply_markup=payment_keyboard())
 
 async def contact_us(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.log_activity(user.id, "viewed contact us message")
+    await db.log_activity(user.id, "viewed contact us message")
     text = """
 contact us:
 
@@ -131,7 +155,7 @@ the admin: @agriiadmin
 phone number: 02164063410
 address: Tehran, West side of Sharif University, Bontech Technology Tower
 """
-    await update.message.reply_text(text, reply_markup=db.find_start_keyboard(user.id))
+    await update.message.reply_text(text, reply_markup=await db.find_start_keyboard(user.id))
 
 ###################################################################
 ###################################################################
@@ -165,7 +189,7 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
 
 def main():
     proxy_url = 'http://127.0.0.1:8889'
-    application = ApplicationBuilder().token(TOKEN).build()
+    application = ApplicationBuilder().token(TOKEN).application_class(UnitOfWorkApplication).job_queue(AttributedJobQueue()).post_init(on_startup).post_shutdown(flush_on_shutdown).build()
     # application = ApplicationBuilder().token(TOKEN).proxy_url(proxy_url).get_updates_proxy_url(proxy_url).build()
     # Add handlers to the application
     application.add_error_handler(error_handler)
@@ -200,16 +224,21 @@ def main():
     application.add_handler(set_location_handler)
     application.add_handler(broadcast_handler)
     application.add_handler(CommandHandler("stats", bot_stats))
+    application.add_handler(CommandHandler("dbstats", db_stats))
     application.add_handler(CommandHandler("today", backup_send))
-    application.add_handler(CallbackQueryHandler(stats_buttons, pattern="^(member_count|member_count_change|excel_download|block_count|no_location_count|no_phone_count)$"))
+    application.add_handler(CallbackQueryHandler(stats_buttons, pattern="^(member_count|member_count_change|member_count_change_long|excel_download|block_count|no_location_count|no_phone_count)$"))
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CallbackQueryHandler(change_day))
+    instrument_handlers(application)
 
     # Schedule periodic messages
     job_queue = application.job_queue
     
     job_queue.run_repeating(get_member_count, interval=7200, first=60)
+    job_queue.run_repeating(refresh_segments, interval=datetime.timedelta(days=1), first=datetime.time(3, 30))
+    job_queue.run_repeating(check_indexes, interval=datetime.timedelta(days=1), first=datetime.time(4, 0))
+    job_queue.run_repeating(refresh_forecasts, interval=FORECAST_POLL_INTERVAL, first=FORECAST_POLL_INTERVAL)
     job_queue.run_repeating(send_todays_data,
         interval=datetime.timedelta(days=1),
         # first=10,
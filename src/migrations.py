@@ -0,0 +1,74 @@
+"""One-shot data migrations. Run from `src/` with the same environment as the bot:
+
+    python migrations.py activity_buckets dialog_buckets member_counts coupons farms farm_locations segments timestamps
+"""
+import asyncio
+import sys
+
+import database
+from utils.logger import logger
+
+
+async def activity_buckets(db: database.Database):
+    migrated = await db.migrate_activity_logs()
+    logger.info(f"moved {migrated} activity logs from botCollection to activityCollection")
+
+
+async def dialog_buckets(db: database.Database):
+    migrated = await db.migrate_dialogs()
+    logger.info(f"split the dialogs of {migrated} users into daily buckets")
+
+
+async def member_counts(db: database.Database):
+    migrated = await db.migrate_member_counts()
+    logger.info(f"moved {migrated} member counts to memberCountCollection")
+
+
+async def coupons(db: database.Database):
+    migrated = await db.migrate_coupons()
+    logger.info(f"moved {migrated} coupons to couponCollection")
+
+
+async def farms(db: database.Database):
+    migrated = await db.migrate_farms()
+    logger.info(f"moved {migrated} farms from the user documents to farmCollection")
+
+
+async def farm_locations(db: database.Database):
+    corrected = await db.refresh_farm_locations()
+    logger.info(f"computed the GeoJSON point of {corrected} farms")
+
+
+async def segments(db: database.Database):
+    corrected = await db.refresh_segments()
+    logger.info(f"computed the segments of {corrected} users")
+
+
+async def timestamps(db: database.Database):
+    converted = await db.migrate_timestamps()
+    logger.info(f"converted the string timestamps of {converted} documents to datetimes")
+
+
+MIGRATIONS = {
+    "activity_buckets": activity_buckets,
+    "dialog_buckets": dialog_buckets,
+    "member_counts": member_counts,
+    "coupons": coupons,
+    "farms": farms,
+    "farm_locations": farm_locations,
+    "segments": segments,
+    "timestamps": timestamps,
+}
+
+
+async def main(names: list[str]):
+    db = database.Database()
+    await db.ensure_indexes()
+    for name in names:
+        await MIGRATIONS[name](db)
+
+
+if __name__ == "__main__":
+    if not sys.argv[1:] or any(name not in MIGRATIONS for name in sys.argv[1:]):
+        sys.exit(f"usage: python migrations.py {{{','.join(MIGRATIONS)}}} ...")
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,91 @@
+import asyncio
+import os
+
+from utils.logger import logger
+
+ACTIVITY_BATCH_SIZE = int(os.environ.get("ACTIVITY_BATCH_SIZE", 200))
+ACTIVITY_FLUSH_INTERVAL = float(os.environ.get("ACTIVITY_FLUSH_INTERVAL", 5))
+ACTIVITY_MAX_PENDING = int(os.environ.get("ACTIVITY_MAX_PENDING", 10000))
+
+
+class ActivityBuffer:
+    """Write-behind buffer for activity logs.
+
+    Events are appended in memory and handed to `write` in one batch when `batch_size`
+    events are pending or every `flush_interval` seconds. `write` returns how many events it
+    wrote, the ones it rejected are counted in `dropped`. If the database can't keep up and
+    `max_pending` events are waiting, new events are dropped and counted in `dropped` too.
+    """
+    def __init__(self,
+                 batch_size: int = ACTIVITY_BATCH_SIZE,
+                 flush_interval: float = ACTIVITY_FLUSH_INTERVAL,
+                 max_pending: int = ACTIVITY_MAX_PENDING) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = []
+        self.writing = []
+        self.flushed = 0
+        self.dropped = 0
+        self._reported_drops = 0
+        self._lock = asyncio.Lock()
+        self._tasks = set()
+        self._flusher = None
+
+    def add(self, event: dict) -> bool:
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return False
+        self.pending.append(event)
+        return True
+
+    def events(self) -> list[dict]:
+        """Events that aren't in the database yet, pending or being written."""
+        return self.writing + self.pending
+
+    def should_flush(self) -> bool:
+        return len(self.pending) >= self.batch_size and not self._lock.locked()
+
+    def flush_in_background(self, flush) -> None:
+        task = asyncio.get_running_loop().create_task(flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def start_periodic_flush(self, flush) -> None:
+        self._flusher = asyncio.get_running_loop().create_task(self._flush_periodically(flush))
+
+    def stop_periodic_flush(self) -> None:
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+
+    async def _flush_periodically(self, flush) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await flush()
+
+    async def flush(self, write) -> int:
+        async with self._lock:
+            batch, self.pending = self.pending, []
+            if self.dropped > self._reported_drops:
+                logger.warning(f"activity buffer full: dropped {self.dropped - self._reported_drops} events "
+                               f"({self.dropped} since start)")
+                self._reported_drops = self.dropped
+            if not batch:
+                return 0
+            self.writing = batch
+            try:
+                written = await write(batch)
+            except Exception as e:
+                logger.error(f"failed to flush {len(batch)} activity logs: {e}")
+                room = self.max_pending - len(self.pending)
+                self.dropped += max(len(batch) - room, 0)
+                self.pending[:0] = batch[:max(room, 0)]
+                return 0
+            finally:
+                self.writing = []
+            self.flushed += written
+            # Rejected events are logged by `write`, only overflow is reported above
+            self.dropped += len(batch) - written
+            self._reported_drops += len(batch) - written
+            return written
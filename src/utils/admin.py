@@ -12,6 +12,7 @@ from telegram.ext import (
 )
 from telegram.error import BadRequest, Forbidden
 import os
+import datetime
 import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
@@ -52,10 +53,15 @@ db = database.Database()
 ADMIN_LIST = db.get_admins()
 ###################################################################
 
+async def segment_summary(name: str) -> str:
+    info = await db.get_segment_info(name)
+    refreshed = info["refreshed"].strftime("%Y-%m-%d %H:%M") if info["refreshed"] else "never"
+    return f"{info['count']} users (segment last refreshed: {refreshed})\n"
+
 # Start of /send conversation
 async def send(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    db.log_activity(user_id, "used /send")
+    await db.log_activity(user_id, "used /send")
     if user_id in ADMIN_LIST:
         await update.message.reply_text(
             "Who is the reciever of the message",
@@ -63,7 +69,7 @@ async def send(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return CHOOSE_RECEIVERS
     else:
-        db.log_activity(user_id, "used /send", f"{user_id} is not an admin")
+        await db.log_activity(user_id, "used /send", f"{user_id} is not an admin")
         return ConversationHandler.END
 
 async def choose_receivers(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -72,8 +78,8 @@ async def choose_receivers(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     message_text = update.message.text
     if message_text in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", message_text)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", message_text)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif not message_text:
         await update.message.reply_text(
@@ -82,66 +88,66 @@ async def choose_receivers(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return CHOOSE_RECEIVERS
     elif message_text == "/cancel":
-        db.log_activity(user.id, "/cancel")
-        await update.message.reply_text("The operation was cancelled!", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "/cancel")
+        await update.message.reply_text("The operation was cancelled!", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif message_text == "back":
-        db.log_activity(user.id, "back")
-        await update.message.reply_text("The operation was cancelled!", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "back")
+        await update.message.reply_text("The operation was cancelled!", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif message_text == "all the users":
-        db.log_activity(user.id, "chose /send to all users")
-        user_data["receiver_list"] = db.user_collection.distinct("_id")
+        await db.log_activity(user.id, "chose /send to all users")
+        user_data["receiver_list"] = await db.user_collection.distinct("_id")
         user_data["receiver_type"] = "to All Users"
         await update.message.reply_text("Please write down your message or press /cancel:",
                                   reply_markup=back_button())
         return BROADCAST
     elif message_text == "pistachio farmers":
-        db.log_activity(user.id, "chose /send to pesteh farmers")
-        user_data["receiver_list"] = db.get_all_pesteh_farmers()
+        await db.log_activity(user.id, "chose /send to pesteh farmers")
+        user_data["receiver_list"] = await db.get_segment("pesteh-farmers")
         user_data["receiver_type"] = "to pesteh farmers"
-        await update.message.reply_text("Please write down your message or press /cancel:",
+        await update.message.reply_text(await segment_summary("pesteh-farmers") + "Please write down your message or press /cancel:",
                                   reply_markup=back_button())
         return BROADCAST
     elif message_text == "They did not hit the register button":
-        db.log_activity(user.id, "chose /send to users who never pressed register")
-        user_data["receiver_list"] = db.register_not_pressed()
+        await db.log_activity(user.id, "chose /send to users who never pressed register")
+        user_data["receiver_list"] = await db.get_segment("register-not-pressed")
         user_data["receiver_type"] = "to users who started the bot but didn't press register btn"
-        await update.message.reply_text("Please write down your message or press /cancel:",
+        await update.message.reply_text(await segment_summary("register-not-pressed") + "Please write down your message or press /cancel:",
                                   reply_markup=back_button())
         return BROADCAST
     elif message_text == 'specify the id':
-        db.log_activity(user.id, "chose /send to custom user list")
+        await db.log_activity(user.id, "chose /send to custom user list")
         await update.message.reply_text("آیدی کاربران مورد نظر را با یک فاصله وارد کن یا /cancel را بزن. e.g.: \n103465015 1547226 7842159",
                                   reply_markup=back_button())
         return HANDLE_IDS
     elif message_text == "include the location":
-        db.log_activity(user.id, "chose /send to users with location")
-        users = db.get_users_with_location()
+        await db.log_activity(user.id, "chose /send to users with location")
+        users = await db.get_segment("with-location")
         user_data["receiver_list"] = users
         user_data["receiver_type"] = "to Users With Location"
-        await update.message.reply_text("Please write down your message or press /cancel::",
+        await update.message.reply_text(await segment_summary("with-location") + "Please write down your message or press /cancel::",
                                   reply_markup=back_button())
         return BROADCAST
     elif message_text == "without location":
-        db.log_activity(user.id, "chose /send to users without location")
-        users = db.get_users_without_location()
+        await db.log_activity(user.id, "chose /send to users without location")
+        users = await db.get_segment("without-location")
         user_data["receiver_list"] = users
         user_data["receiver_type"] = "to Users W/O Location"
-        await update.message.reply_text("Please write down your message or press /cancel:",
+        await update.message.reply_text(await segment_summary("without-location") + "Please write down your message or press /cancel:",
                                   reply_markup=back_button())
         return BROADCAST
     elif message_text == "without the phone number":
-        db.log_activity(user.id, "chose /send to users without phone number")
-        users = db.get_users_without_phone()
+        await db.log_activity(user.id, "chose /send to users without phone number")
+        users = await db.get_segment("without-phone")
         user_data["receiver_list"] = users
         user_data["receiver_type"] = "to Users W/O Phone Number"
-        await update.message.reply_text("Please write down your message or press /cancel::",
+        await update.message.reply_text(await segment_summary("without-phone") + "Please write down your message or press /cancel::",
                                   reply_markup=back_button())
         return BROADCAST
     else:
-        db.log_activity(user.id, "invalid receivers chosen")
-        await update.message.reply_text("The operation was cancelled!", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "invalid receivers chosen")
+        await update.message.reply_text("The operation was cancelled!", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
 
 async def handle_ids(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -149,15 +155,15 @@ async def handle_ids(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_data = context.user_data
     if ids in MENU_CMDS or not ids:
-        db.log_activity(user.id, "error - answer in menu_cmd list", ids)
-        await update.message.reply_text("The operation was cancelled please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", ids)
+        await update.message.reply_text("The operation was cancelled please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif ids == "back":
-        db.log_activity(user.id, "back")
+        await db.log_activity(user.id, "back")
         await update.message.reply_text("Choose the message receiver", reply_markup=choose_role())
         return CHOOSE_RECEIVERS
     else:
-        db.log_activity(user.id, "entered custom list of users", ids)
+        await db.log_activity(user.id, "entered custom list of users", ids)
         user_ids = [int(user_id) for user_id in ids.split(" ")]
         user_data["receiver_list"] = user_ids
         user_data["receiver_type"] = "Admin Chose Receivers"
@@ -176,11 +182,11 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     i = 0
     receivers = []
     if message_text == "/cancel":
-        await update.message.reply_text("The operation was cancelled!", reply_markup=db.find_start_keyboard(user.id))
+        await update.message.reply_text("The operation was cancelled!", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif message_text in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", message_text)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", message_text)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif message_text == "back":
         await update.message.reply_text(
@@ -196,9 +202,9 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 else:
                     await context.bot.copy_message(chat_id=user_id, from_chat_id=chat_id, message_id=message_id)
                 # await context.bot.send_message(user_id, message)
-                username = db.user_collection.find_one({"_id": user_id})["username"]
-                db.set_user_attribute(user_id, "blocked", False)
-                db.log_new_message(
+                username = (await db.get_user_document(user_id))["username"]
+                await db.set_user_attribute(user_id, "blocked", False)
+                await db.log_new_message(
                     user_id=user_id,
                     username=username,
                     message=message_text,
@@ -209,15 +215,15 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except Forbidden:
                 logger.error(f"user {user_id} blocked the bot")
                 await context.bot.send_message(chat_id=user.id, text=f"{user_id} blocked the bot")
-                db.set_user_attribute(user_id, "blocked", True)
+                await db.set_user_attribute(user_id, "blocked", True)
             except BadRequest:
                 logger.error(f"chat with {user_id} not found.")
                 await context.bot.send_message(chat_id=user.id, text=f"{user_id} was not found")
-        db.log_sent_messages(receivers, f"broadcast {user_data['receiver_type']}")
+        await db.log_sent_messages(receivers, f"broadcast {user_data['receiver_type']}")
         for id in ADMIN_LIST:
             try:
                 await context.bot.send_message(id, f"The message was sent to {i} people out of {len(receiver_list)} people."
-                                    , reply_markup=db.find_start_keyboard(id))
+                                    , reply_markup=await db.find_start_keyboard(id))
             except BadRequest or Forbidden:
                 logger.warning(f"admin {id} has deleted the bot")
         return ConversationHandler.END
@@ -247,6 +253,22 @@ async def bot_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Select the desired statistic", reply_markup=stats_keyboard()
         )
 
+async def db_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_LIST:
+        return
+    pool = database.pool_monitor.snapshot()
+    text = "MongoDB connection pool\n" + "\n".join(
+        f"{key}: {value:.1f}" if isinstance(value, float) else f"{key}: {value}" for key, value in pool.items()
+    )
+    commands = database.command_monitor.snapshot()
+    for title, stats in [("handlers / jobs", commands["operations"]), ("collections", commands["collections"])]:
+        top = sorted(stats.items(), key=lambda item: item[1]["total-ms"], reverse=True)[:15]
+        text += f"\n\nround trips by {title} (count, total ms, p95 ms)\n" + "\n".join(
+            f"{name}: {row['count']}, {row['total-ms']:.0f}, {row['p95-ms']:.1f}" for name, row in top
+        )
+    await update.message.reply_text(text[:4096])
+
 async def stats_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     stat = update.callback_query
     try:
@@ -254,17 +276,20 @@ async def stats_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except BadRequest:
         logger.error(f"query.answer() caused BadRequest error. user: {stat.message.chat.id}")
     id = update.effective_user.id
+    if stat.data in ["member_count", "block_count", "no_location_count", "no_phone_count"]:
+        stats = await db.get_stats()
+        as_of = stats["time"].strftime("%Y-%m-%d %H:%M")
     if stat.data == "member_count":
-        member_count = db.number_of_members() - db.number_of_blocks()
-        await context.bot.send_message(chat_id=id, text=f"number of members: {member_count}")
-    elif stat.data == "member_count_change":
-        members_doc = db.bot_collection.find_one()
-        if len(members_doc["time-stamp"]) < 15:
-            plt.plot(members_doc["time-stamp"], members_doc["num-members"], "r-")
+        member_count = stats["members"] - stats["blocked"]
+        await context.bot.send_message(chat_id=id, text=f"number of members: {member_count}\n(as of {as_of})")
+    elif stat.data in ["member_count_change", "member_count_change_long"]:
+        if stat.data == "member_count_change":
+            points = await db.get_member_counts(start=datetime.datetime.now() - datetime.timedelta(hours=30), max_points=15)
         else:
-            plt.plot(
-                members_doc["time-stamp"][-15:], members_doc["num-members"][-15:], "r-"
-            )
+            points = await db.get_member_counts(start=datetime.datetime.now() - datetime.timedelta(days=90), max_points=30)
+        plt.plot(
+            [point["timestamp"].strftime("%Y-%m-%d %H:%M") for point in points], [point["members"] for point in points], "r-"
+        )
         plt.xlabel("Time")
         plt.ylabel("Members")
         plt.title("Bot Members Over Time")
@@ -277,8 +302,16 @@ async def stats_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
         os.remove("member-change.png")
     elif stat.data == "excel_download":
         try:
-            output_file = "member-data.xlsx"
-            db.to_excel(output_file=output_file)
+            output_file = "member-data.csv"
+            progress_message = await context.bot.send_message(chat_id=id, text="exporting members: 0%")
+            async def report_progress(exported, total):
+                percent = min(100, 100 * exported // max(total, 1))
+                if percent // 10 > report_progress.last // 10:
+                    report_progress.last = percent
+                    await progress_message.edit_text(f"exporting members: {percent}%")
+            report_progress.last = 0
+            exported = await db.to_excel(output_file=output_file, progress=report_progress)
+            await progress_message.edit_text(f"exported {exported} members")
             doc = open(output_file, "rb")
             await context.bot.send_document(chat_id=id, document=doc)
             doc.close()
@@ -286,14 +319,11 @@ async def stats_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except:
             logger.info("encountered error during excel download!")
     elif stat.data == "block_count":
-        blocked_count = db.number_of_blocks()
-        await context.bot.send_message(chat_id=id, text=f"block count: {blocked_count}")
+        await context.bot.send_message(chat_id=id, text=f"block count: {stats['blocked']}\n(as of {as_of})")
     elif stat.data == "no_location_count":
-        no_location_users = db.get_users_without_location()
-        await context.bot.send_message(chat_id=id, text=f"no locaton count: {len(no_location_users)}")
+        await context.bot.send_message(chat_id=id, text=f"no locaton count: {stats['no-location']}\n(as of {as_of})")
     elif stat.data == "no_phone_count":
-        no_phone_users = db.get_users_without_phone()
-        await context.bot.send_message(chat_id=id, text=f"no phone count: {len(no_phone_users)}")
+        await context.bot.send_message(chat_id=id, text=f"no phone count: {stats['no-phone']}\n(as of {as_of})")
 
 
 broadcast_handler = ConversationHandler(
@@ -48,13 +48,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_data = context.user_data
     context.job_queue.run_once(no_farm_reminder, when=datetime.timedelta(hours=1), chat_id=user.id, data=user.username)    
-    user_document = db.user_collection.find_one( { "_id": user.id } )
+    user_document = await db.get_user_document(user.id)
     # Check if the user has already signed up
-    if not db.check_if_user_is_registered(user_id=user.id):
+    if not await db.check_if_user_is_registered(user_id=user.id):
         user_data["username"] = user.username
         user_data["blocked"] = False
-        first_seen = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-        db.add_new_user(user_id=user.id, username=user.username, first_seen=first_seen)
+        await db.add_new_user(user_id=user.id, username=user.username)
         logger.info(f"{user.username} (id: {user.id}) started the bot.")
         reply_text = """
 Hi dear gardener!
@@ -66,7 +65,7 @@ Landline phone: 02164063410
                 """
         args = context.args
         if args:
-            db.log_token_use(user.id, args[0])
+            await db.log_token_use(user.id, args[0])
         await update.message.reply_text(reply_text, reply_markup=register_keyboard())
         await update.message.reply_text("https://t.me/agriweath/48")
         context.job_queue.run_once(register_reminder, when=datetime.timedelta(hours=3), chat_id=user.id, data=user.username)    
@@ -81,18 +80,18 @@ Landline phone: 02164063410
 # تلفن ثابت: 02164063410
 #                 """
 #         await update.message.reply_text(reply_text, reply_markup=start_keyboard())
-        if not db.check_if_user_has_farms(user.id, user_document):
+        if not await db.check_if_user_has_farms(user.id, user_document):
             reply_text = "Please register your farm before accessing Abad's services"
             await update.message.reply_text(reply_text,
                                             reply_markup=start_keyboard_no_farms())
             
         else:
-            if not db.check_if_user_has_farms_with_location(user.id, user_document):
+            if not await db.check_if_user_has_farms_with_location(user.id, user_document):
                 reply_text = "Please register your farm's location before accessing Abad's services"
                 await update.message.reply_text(reply_text,
                                                 reply_markup=start_keyboard_no_location())
             else:
-                if not db.check_if_user_has_pesteh(user.id, user_document):
+                if not await db.check_if_user_has_pesteh(user.id, user_document):
                     reply_text = "Welcome to Abad!"
                     await update.message.reply_text(reply_text,
                                                     reply_markup=start_keyboard_not_pesteh())
@@ -103,15 +102,15 @@ Landline phone: 02164063410
 
 async def user_keyboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    await update.message.reply_text("Your keyboard is:", reply_markup=db.find_start_keyboard(user.id))
+    await update.message.reply_text("Your keyboard is:", reply_markup=await db.find_start_keyboard(user.id))
 
 # CREATE PERSONALIZED INVITE LINK FOR A USER
 async def invite(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.log_activity(user.id, "chose invite-link menu option")
+    await db.log_activity(user.id, "chose invite-link menu option")
     random_string = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(10))
-    db.set_user_attribute(user.id, "invite-links", random_string, array=True)
-    db.add_token(user.id, random_string)
+    await db.set_user_attribute(user.id, "invite-links", random_string, array=True)
+    await db.add_token(user.id, random_string)
     link = f"https://t.me/agriweathbot?start={random_string}"
     await update.message.reply_text(f"""
 Hey guys!
@@ -119,12 +118,12 @@ There is a robot that sends you meteorological advices according to your garden'
 I highly recommend you to use it.
                                         
 {link}
-""", reply_markup=db.find_start_keyboard(user.id))
+""", reply_markup=await db.find_start_keyboard(user.id))
 
 # invite link generation with a conversation, not added to app handlers right now.
 async def invite_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.log_activity(user.id, "chose invite-link menu option")
+    await db.log_activity(user.id, "chose invite-link menu option")
     keyboard = [['see the previous links'], ['Create new invite link'], ['back']]
     await update.message.reply_text("Please choose:", reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True))
     return HANDLE_INV_LINK
@@ -133,27 +132,27 @@ async def handle_invite_link(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user = update.effective_user
     message_text = update.message.text
     if message_text in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", message_text)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", message_text)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif message_text=="back":
-        db.log_activity(user.id, "back")
-        await update.message.reply_text("The previous operation was cancelled.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "back")
+        await update.message.reply_text("The previous operation was cancelled.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif message_text=="see th previous links":
-        db.log_activity(user.id, "chose to view previous links")
-        links = db.get_user_attribute(user.id, "invite-links")
+        await db.log_activity(user.id, "chose to view previous links")
+        links = await db.get_user_attribute(user.id, "invite-links")
         if links:
-            await update.message.reply_text(links, reply_markup=db.find_start_keyboard(user.id))
+            await update.message.reply_text(links, reply_markup=await db.find_start_keyboard(user.id))
             return ConversationHandler.END
         else:
-            await update.message.reply_text("You have not made the invite link yet.", reply_markup=db.find_start_keyboard(user.id))
+            await update.message.reply_text("You have not made the invite link yet.", reply_markup=await db.find_start_keyboard(user.id))
             ConversationHandler.END
     elif message_text=="Creat new invite link":
-        db.log_activity(user.id, "chose to create an invite-link")
+        await db.log_activity(user.id, "chose to create an invite-link")
         random_string = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(10))
-        db.set_user_attribute(user.id, "invite-links", random_string, array=True)
-        db.add_token(user.id, random_string)
+        await db.set_user_attribute(user.id, "invite-links", random_string, array=True)
+        await db.add_token(user.id, random_string)
         link = f"https://t.me/agriweathbot?start={random_string}"
         await update.message.reply_text(f"""
 Hey guys!
@@ -162,11 +161,11 @@ I highly recommend you to use it.
                                         
 {link}
 """,    
-            reply_markup=db.find_start_keyboard(user.id))
+            reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     else: 
-        db.log_activity(user.id, "error - option not valid", message_text)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - option not valid", message_text)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
 
 
@@ -184,8 +183,9 @@ async def change_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # logger.info(f"data:{query.data}, user: {user_id}\n---------")
     farm_name = query.data.split("\n")[0]
     day_chosen = query.data.split("\n")[1]
-    advise_3days = db.user_collection.find_one({"_id": user_id})["farms"][farm_name].get("advise")
-    advise_sp_3days = db.user_collection.find_one({"_id": user_id})["farms"][farm_name].get("sp-advise")
+    farm = (await db.get_farm_map(user_id))[farm_name]
+    advise_3days = farm.get("advise")
+    advise_sp_3days = farm.get("sp-advise")
     if day_chosen=="today_advise":
         day = "امروز"
         if not advise_3days:
@@ -195,7 +195,7 @@ async def change_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if pd.isna(advise):
             advise = "There is no advice for this date"
         date = jdate
-        db.log_activity(user_id, "chose advice date", "day1")
+        await db.log_activity(user_id, "chose advice date", "day1")
     elif day_chosen=="day2_advise":
         day = "فردا"
         if not advise_3days:
@@ -205,7 +205,7 @@ async def change_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if pd.isna(advise):
             advise = "There is no advice for this date"
         date = jday2
-        db.log_activity(user_id, "chose advice date", "day2")
+        await db.log_activity(user_id, "chose advice date", "day2")
     elif day_chosen=="day3_advise":
         day = "پس‌فردا"
         if not advise_3days:
@@ -215,7 +215,7 @@ async def change_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if pd.isna(advise):
             advise = "There is no advice for this date"
         date = jday3
-        db.log_activity(user_id, "chose advice date", "day3")
+        await db.log_activity(user_id, "chose advice date", "day3")
     elif day_chosen=="today_sp_advise":
         day = "امروز"
         if not advise_sp_3days:
@@ -225,7 +225,7 @@ async def change_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if pd.isna(advise):
             advise = "There is no advice for this date"
         date = jdate
-        db.log_activity(user_id, "chose sp-advice date", "day1")
+        await db.log_activity(user_id, "chose sp-advice date", "day1")
     elif day_chosen=="day2_sp_advise":
         day = "فردا"
         if not advise_sp_3days:
@@ -235,7 +235,7 @@ async def change_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if pd.isna(advise):
             advise = "There is no advice for this date"
         date = jday2
-        db.log_activity(user_id, "chose sp-advice date", "day2")
+        await db.log_activity(user_id, "chose sp-advice date", "day2")
     elif day_chosen=="day3_sp_advise":
         day = "پس‌فردا"
         if not advise_sp_3days:
@@ -245,7 +245,7 @@ async def change_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if pd.isna(advise):
             advise = "There is no advice for this date"
         date = jday3
-        db.log_activity(user_id, "chose sp-advice date", "day3")
+        await db.log_activity(user_id, "chose sp-advice date", "day3")
     
     advise = f"""
 The harvest advice for your garden called <b>#{farm_name.replace(" ", "_")}</b> for #{day} date <b>{date}</b>:
@@ -254,101 +254,101 @@ The harvest advice for your garden called <b>#{farm_name.replace(" ", "_")}</b>
 """
     try:
         await query.edit_message_text(advise, reply_markup=keyboard, parse_mode=ParseMode.HTML)
-        db.log_activity(user_id, "received advice for other date")
+        await db.log_activity(user_id, "received advice for other date")
     except Forbidden or BadRequest:
         logger.info("encountered error trying to respond to CallbackQueryHandler")
-        db.log_activity(user_id, "error - couldn't receive advice for other date")
+        await db.log_activity(user_id, "error - couldn't receive advice for other date")
     except:
         logger.info("Unexpected error") # Could be message not modified?
-        db.log_activity(user_id, "error - couldn't receive advice for other date")
+        await db.log_activity(user_id, "error - couldn't receive advice for other date")
 
 async def ask_harvest_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.log_activity(user.id, "harvest_off")
-    user_farms = db.get_farms(user.id)
+    await db.log_activity(user.id, "harvest_off")
+    user_farms = await db.get_farms(user.id)
     if user_farms:
         await context.bot.send_message(
             chat_id=user.id,
             text="Choose one of your gardens.",
-            reply_markup=farms_list_reply(db, user.id),
+            reply_markup=await farms_list_reply(db, user.id),
         )
         return HARVEST_OFF
     else:
-        db.log_activity(user.id, "error - no farm for harvest_off")
+        await db.log_activity(user.id, "error - no farm for harvest_off")
         await context.bot.send_message(
             chat_id=user.id,
             text="You have not registered any garden yet",
-            reply_markup=db.find_start_keyboard(user.id),
+            reply_markup=await db.find_start_keyboard(user.id),
         )
         return ConversationHandler.END
     
 async def harvest_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     farm = update.message.text
-    user_farms = db.get_farms(user.id)
+    user_farms = await db.get_farms(user.id)
     if farm == '↩️ back':
-        db.log_activity(user.id, "back")
-        await update.message.reply_text("The operation was cancelled", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "back")
+        await update.message.reply_text("The operation was cancelled", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif farm not in list(user_farms.keys()):
-        db.log_activity(user.id, "error - chose farm for harvest_off" , farm)
-        await update.message.reply_text("Please try again. The garden's name was incorrect", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - chose farm for harvest_off" , farm)
+        await update.message.reply_text("Please try again. The garden's name was incorrect", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif farm in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", farm)
-        await update.message.reply_text("The previous operaion was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", farm)
+        await update.message.reply_text("The previous operaion was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
-    db.log_activity(user.id, "chose farm for harvest_off", farm)
-    db.set_user_attribute(user.id, f"farms.{farm}.harvest-off", True)
+    await db.log_activity(user.id, "chose farm for harvest_off", farm)
+    await db.update_farm(user.id, farm, {"harvest-off": True})
     reply_text = f"""
 Sending harvest advices for the garden <b>#{farm.replace(" ", "_")}</b> was stopped. 
 Incase your interested in receiving harvest advices again. press /harvest_on.
 """
-    await context.bot.send_message(chat_id=user.id, text= reply_text, reply_markup=db.find_start_keyboard(user.id), parse_mode=ParseMode.HTML)
+    await context.bot.send_message(chat_id=user.id, text= reply_text, reply_markup=await db.find_start_keyboard(user.id), parse_mode=ParseMode.HTML)
     return ConversationHandler.END
 
 async def ask_harvest_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.log_activity(user.id, "harvest_on")
-    user_farms = db.get_farms(user.id)
+    await db.log_activity(user.id, "harvest_on")
+    user_farms = await db.get_farms(user.id)
     if user_farms:
         await context.bot.send_message(
             chat_id=user.id,
             text="Choose one of your gardens",
-            reply_markup=farms_list_reply(db, user.id),
+            reply_markup=await farms_list_reply(db, user.id),
         )
         return HARVEST_ON
     else:
-        db.log_activity(user.id, "error - no farm for harvest_on")
+        await db.log_activity(user.id, "error - no farm for harvest_on")
         await context.bot.send_message(
             chat_id=user.id,
             text="You have not registered any garden yet",
-            reply_markup=db.find_start_keyboard(user.id),
+            reply_markup=await db.find_start_keyboard(user.id),
         )
         return ConversationHandler.END
     
 async def harvest_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     farm = update.message.text
-    user_farms = db.get_farms(user.id)
+    user_farms = await db.get_farms(user.id)
     if farm == '↩️ back':
-        db.log_activity(user.id, "back")
-        await update.message.reply_text("The operation was cancelled", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "back")
+        await update.message.reply_text("The operation was cancelled", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif farm not in list(user_farms.keys()):
-        db.log_activity(user.id, "error - chose farm for harvest_on" , farm)
-        await update.message.reply_text("Please try again. The garden's name was incorrect", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - chose farm for harvest_on" , farm)
+        await update.message.reply_text("Please try again. The garden's name was incorrect", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif farm in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", farm)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", farm)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
-    db.log_activity(user.id, "chose farm for harvest_on", farm)
-    db.set_user_attribute(user.id, f"farms.{farm}.harvest-off", False)
+    await db.log_activity(user.id, "chose farm for harvest_on", farm)
+    await db.update_farm(user.id, farm, {"harvest-off": False})
     reply_text = f"""
 harvest advices will be sent for the <b>#{farm.replace(" ", "_")}</b> garden.
 """
-    await context.bot.send_message(chat_id=user.id, text= reply_text, reply_markup=db.find_start_keyboard(user.id), parse_mode=ParseMode.HTML)
+    await context.bot.send_message(chat_id=user.id, text= reply_text, reply_markup=await db.find_start_keyboard(user.id), parse_mode=ParseMode.HTML)
     return ConversationHandler.END
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
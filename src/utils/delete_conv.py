@@ -47,17 +47,17 @@ ADMIN_LIST = db.get_admins()
 # START OF DELETE CONVERSATION
 async def delete_farm_keyboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.log_activity(user.id, "start delete process")
-    user_farms = db.get_farms(user.id)
+    await db.log_activity(user.id, "start delete process")
+    user_farms = await db.get_farms(user.id)
     if user_farms:
         await update.message.reply_text(
             "Choose one of your farms",
-            reply_markup=farms_list_reply(db, user.id),
+            reply_markup=await farms_list_reply(db, user.id),
         )
         return CONFIRM_DELETE
     else:
         await update.message.reply_text(
-            "You have not registered any garden yet", reply_markup=db.find_start_keyboard(user.id)
+            "You have not registered any garden yet", reply_markup=await db.find_start_keyboard(user.id)
         )
         return ConversationHandler.END
 
@@ -66,27 +66,27 @@ async def confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     farm = update.message.text
     user_data["farm_to_delete"] = farm
     user = update.effective_user
-    user_farms = db.get_farms(user.id)
-    user_farms_names = list(db.get_farms(user.id).keys())
+    user_farms = await db.get_farms(user.id)
+    user_farms_names = list((await db.get_farms(user.id)).keys())
     if farm in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", farm)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", farm)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     if farm not in user_farms_names and farm != "↩️ back":
-        db.log_activity(user.id, "error - wrong farm to delete", farm)
+        await db.log_activity(user.id, "error - wrong farm to delete", farm)
         await context.bot.send_message(
             chat_id=user.id,
             text="Choose one of your farms",
-            reply_markup=farms_list_reply(db, user.id),
+            reply_markup=await farms_list_reply(db, user.id),
         )
         return CONFIRM_DELETE
     if farm == "↩️ back":
-        db.log_activity(user.id, "back")
+        await db.log_activity(user.id, "back")
         await context.bot.send_message(
-            chat_id=user.id, text="The operation was cancelled!", reply_markup=db.find_start_keyboard(user.id)
+            chat_id=user.id, text="The operation was cancelled!", reply_markup=await db.find_start_keyboard(user.id)
         )
         return ConversationHandler.END
-    db.log_activity(user.id, "chose farm to delete", farm)
+    await db.log_activity(user.id, "chose farm to delete", farm)
     location = user_farms.get(farm)["location"]
     text = f"""Are you sure you want to delete <b>{farm}</b> with the following specifications?
 Crop: {user_farms[farm].get("product")}
@@ -118,37 +118,35 @@ async def delete_farm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     answer = update.message.text
     acceptable = ["yes", "no", "back"]
     if answer not in acceptable:
-        db.log_activity(user.id, "error - wrong delete confirmation", answer)
+        await db.log_activity(user.id, "error - wrong delete confirmation", answer)
         await context.bot.send_message(
-            chat_id=user.id, text="The operation was not successful", reply_markup=db.find_start_keyboard(user.id)
+            chat_id=user.id, text="The operation was not successful", reply_markup=await db.find_start_keyboard(user.id)
         )
         return ConversationHandler.END
     elif answer == "back":
-        db.log_activity(user.id, "back")
+        await db.log_activity(user.id, "back")
         await context.bot.send_message(
             chat_id=user.id,
             text="Choose one of your farms",
-            reply_markup=farms_list_reply(db, user.id),
+            reply_markup=await farms_list_reply(db, user.id),
         )
         return CONFIRM_DELETE
     elif answer == "no":
-        db.log_activity(user.id, "stopped delete")
+        await db.log_activity(user.id, "stopped delete")
         await context.bot.send_message(
-            chat_id=user.id, text="The operation was cancelled", reply_markup=db.find_start_keyboard(user.id)
+            chat_id=user.id, text="The operation was cancelled", reply_markup=await db.find_start_keyboard(user.id)
         )
         return ConversationHandler.END
     elif answer == "yes":
-        db.log_activity(user.id, "confirmed delete")
+        await db.log_activity(user.id, "confirmed delete")
         try:
-            db.user_collection.update_one(
-                {"_id": user.id}, {"$unset": {f"farms.{farm}": ""}}
-            )
+            await db.delete_farm(user.id, farm)
             text = f"{farm} was successfully deleted."
             await context.bot.send_message(
                 chat_id=user.id,
                 text=text,
                 parse_mode=ParseMode.HTML,
-                reply_markup=db.find_start_keyboard(user.id),
+                reply_markup=await db.find_start_keyboard(user.id),
             )
             return ConversationHandler.END
         except KeyError:
@@ -57,21 +57,21 @@ ADMIN_LIST = db.get_admins()
 # START OF EDIT CONVERSATION
 async def edit_farm_keyboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.log_activity(user.id, "start edit")
-    user_farms = db.get_farms(user.id)
+    await db.log_activity(user.id, "start edit")
+    user_farms = await db.get_farms(user.id)
     if user_farms:
         # await context.bot.send_message(chat_id=user.id, text="یکی از باغ های خود را ویرایش کنید", reply_markup=farms_list(db, user.id, view=False, edit=True))
         await context.bot.send_message(
             chat_id=user.id,
             text="choose the farm:",
-            reply_markup=farms_list_reply(db, user.id),
+            reply_markup=await farms_list_reply(db, user.id),
         )
         return CHOOSE_ATTR
     else:
         await context.bot.send_message(
             chat_id=user.id,
             text="You have not registered any garden yet",
-            reply_markup=db.find_start_keyboard(user.id),
+            reply_markup=await db.find_start_keyboard(user.id),
         )
         return ConversationHandler.END
 
@@ -82,26 +82,26 @@ async def choose_attr_to_edit(update: Update, context: ContextTypes.DEFAULT_TYPE
     user = update.effective_user
     user_data = context.user_data
     user_data["selected_farm"] = farm
-    user_farms = list(db.get_farms(user.id).keys())
+    user_farms = list((await db.get_farms(user.id)).keys())
     if farm in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", farm)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", farm)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     if farm not in user_farms and farm != "↩️ back":
-        db.log_activity(user.id, "error - chose wrong farm", farm)
+        await db.log_activity(user.id, "error - chose wrong farm", farm)
         await context.bot.send_message(
             chat_id=user.id,
             text="Edit one of your farms",
-            reply_markup=farms_list_reply(db, user.id),
+            reply_markup=await farms_list_reply(db, user.id),
         )
         return CHOOSE_ATTR
     if farm == "↩️ back":
-        db.log_activity(user.id, "back")
+        await db.log_activity(user.id, "back")
         await context.bot.send_message(
-            chat_id=user.id, text="The operation was cancelled!", reply_markup=db.find_start_keyboard(user.id)
+            chat_id=user.id, text="The operation was cancelled!", reply_markup=await db.find_start_keyboard(user.id)
         )
         return ConversationHandler.END
-    db.log_activity(user.id, "chose farm to edit", farm)
+    await db.log_activity(user.id, "chose farm to edit", farm)
     message_id = update.effective_message.message_id
     try:
         # await context.bot.edit_message_text(chat_id=user.id, message_id=message_id, text=f"انتخاب مولفه برای ویرایش در {farm}", reply_markup=edit_keyboard())
@@ -123,26 +123,26 @@ async def edit_farm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # attr = update.callback_query.data
     attr = update.message.text
     if attr == "back to the farms list":
-        db.log_activity(user.id, "back")
+        await db.log_activity(user.id, "back")
         # await context.bot.edit_message_text(chat_id=user.id, message_id=message_id, text="یکی از باغ های خود را انتخاب کنید",
         #                                reply_markup=farms_list_reply(db, user.id))
         await context.bot.send_message(
             chat_id=user.id,
             text="Choose one of your farms",
-            reply_markup=farms_list_reply(db, user.id),
+            reply_markup=await farms_list_reply(db, user.id),
         )
         return CHOOSE_ATTR
     if attr == "change the crop":
-        db.log_activity(user.id, "chose edit product")
+        await db.log_activity(user.id, "chose edit product")
         user_data["attr"] = attr
-        farm_doc = db.user_collection.find_one({"_id": user.id})["farms"][farm]
+        farm_doc = (await db.get_farm_map(user.id))[farm]
         if farm_doc["product"].startswith("Pistachio"):
             await context.bot.send_message(chat_id=user.id, text="Please choose the new garden's crop", reply_markup=get_product_keyboard())
         else:
             await context.bot.send_message(chat_id=user.id, text="Please write down the new crop")
         return HANDLE_EDIT
     elif attr == "change the province":
-        db.log_activity(user.id, "chose edit province")
+        await db.log_activity(user.id, "chose edit province")
         user_data["attr"] = attr
         await context.bot.send_message(
             chat_id=user.id,
@@ -151,26 +151,26 @@ async def edit_farm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return HANDLE_EDIT
     elif attr == "change the town":
-        db.log_activity(user.id, "chose edit city")
+        await db.log_activity(user.id, "chose edit city")
         user_data["attr"] = attr
         await context.bot.send_message(chat_id=user.id, text="Please enter the new town", reply_markup=back_button())
         return HANDLE_EDIT
     elif attr == "change the village":
-        db.log_activity(user.id, "chose edit village")
+        await db.log_activity(user.id, "chose edit village")
         user_data["attr"] = attr
         await context.bot.send_message(
             chat_id=user.id, text="Please enter the new village", reply_markup=back_button()
         )
         return HANDLE_EDIT
     elif attr == "change the area":
-        db.log_activity(user.id, "chose edit area")
+        await db.log_activity(user.id, "chose edit area")
         user_data["attr"] = attr
         await context.bot.send_message(
             chat_id=user.id, text="Please enter the new area", reply_markup=back_button()
         )
         return HANDLE_EDIT
     elif attr == "change the location":
-        db.log_activity(user.id, "chose edit location")
+        await db.log_activity(user.id, "chose edit location")
         user_data["attr"] = attr
         reply_text = """
 Please enter your location using one of the methods below.
@@ -196,8 +196,8 @@ Please enter your location using one of the methods below.
         )
         return HANDLE_EDIT
     else:
-        db.log_activity(user.id, "error - chose wrong value to edit", attr)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - chose wrong value to edit", attr)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
 
 async def handle_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -205,53 +205,53 @@ async def handle_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_data = context.user_data
     attr = user_data["attr"]
     farm = user_data["selected_farm"]
-    user_farms = db.get_farms(user.id)
+    user_farms = await db.get_farms(user.id)
     ## handle the new value of attr
     if attr == "change the crop":
         new_product = update.message.text
         if new_product in MENU_CMDS:
-            db.log_activity(user.id, "error - answer in menu_cmd list", new_city)
-            await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+            await db.log_activity(user.id, "error - answer in menu_cmd list", new_city)
+            await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
             return ConversationHandler.END
         if new_product == "back":
-            db.log_activity(user.id, "back")
+            await db.log_activity(user.id, "back")
             await context.bot.send_message(chat_id=user.id, text = "Choose one of the options below to edit:", reply_markup=edit_keyboard_reply())
             return EDIT_FARM
         if not new_product:
-            db.log_activity(user.id, "error - edit product", new_product)
+            await db.log_activity(user.id, "error - edit product", new_product)
             await update.message.reply_text(
                 "Please choose the new garden's crop",
                 reply_markup=get_product_keyboard(),
             )
             return HANDLE_EDIT
-        db.set_user_attribute(user.id, f"farms.{farm}.product", new_product)
+        await db.update_farm(user.id, farm, {"product": new_product})
         reply_text = f"The new crop {farm} was successfully registered."
-        db.log_activity(user.id, "finish edit product")
+        await db.log_activity(user.id, "finish edit product")
         await context.bot.send_message(
-            chat_id=user.id, text=reply_text, reply_markup=db.find_start_keyboard(user.id)
+            chat_id=user.id, text=reply_text, reply_markup=await db.find_start_keyboard(user.id)
         )
         return ConversationHandler.END
     elif attr == "change the province":
         new_province = update.message.text
         if new_province in MENU_CMDS:
-            db.log_activity(user.id, "error - answer in menu_cmd list", new_city)
-            await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+            await db.log_activity(user.id, "error - answer in menu_cmd list", new_city)
+            await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
             return ConversationHandler.END
         if new_province == "back":
             await context.bot.send_message(chat_id=user.id, text = "Choose one of the below options for edit.", reply_markup=edit_keyboard_reply())
             return EDIT_FARM
         if not new_province:
-            db.log_activity(user.id, "error - edit province", new_province)
+            await db.log_activity(user.id, "error - edit province", new_province)
             await update.message.reply_text(
                 "Please choose the new province",
                 reply_markup=get_province_keyboard(),
             )
             return HANDLE_EDIT
-        db.set_user_attribute(user.id, f"farms.{farm}.province", new_province)
+        await db.update_farm(user.id, farm, {"province": new_province})
         reply_text = f"The new province {farm} was successfully registered."
-        db.log_activity(user.id, "finish edit province")
+        await db.log_activity(user.id, "finish edit province")
         await context.bot.send_message(
-            chat_id=user.id, text=reply_text, reply_markup=db.find_start_keyboard(user.id)
+            chat_id=user.id, text=reply_text, reply_markup=await db.find_start_keyboard(user.id)
         )
         return ConversationHandler.END
     elif attr == "change town":
@@ -260,18 +260,18 @@ async def handle_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await context.bot.send_message(chat_id=user.id, text = "Choose one of the below options to edit.", reply_markup=edit_keyboard_reply())
             return EDIT_FARM
         if new_city in MENU_CMDS:
-            db.log_activity(user.id, "error - answer in menu_cmd list", new_city)
-            await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+            await db.log_activity(user.id, "error - answer in menu_cmd list", new_city)
+            await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
             return ConversationHandler.END
         if not new_city:
-            db.log_activity(user.id, "error - edit city")
+            await db.log_activity(user.id, "error - edit city")
             await update.message.reply_text("Please enter the new town")
             return HANDLE_EDIT
-        db.set_user_attribute(user.id, f"farms.{farm}.city", new_city)
+        await db.update_farm(user.id, farm, {"city": new_city})
         reply_text = f"The new town {farm} was successfully registered."
-        db.log_activity(user.id, "finish edit city")
+        await db.log_activity(user.id, "finish edit city")
         await context.bot.send_message(
-            chat_id=user.id, text=reply_text, reply_markup=db.find_start_keyboard(user.id)
+            chat_id=user.id, text=reply_text, reply_markup=await db.find_start_keyboard(user.id)
         )
         return ConversationHandler.END
     elif attr == "change the village":
@@ -280,18 +280,18 @@ async def handle_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await context.bot.send_message(chat_id=user.id, text = "Choose one of the options below to edit", reply_markup=edit_keyboard_reply())
             return EDIT_FARM
         if new_village in MENU_CMDS:
-            db.log_activity(user.id, "error - answer in menu_cmd list", new_village)
-            await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+            await db.log_activity(user.id, "error - answer in menu_cmd list", new_village)
+            await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
             return ConversationHandler.END
         if not new_village:
-            db.log_activity(user.id, "error - edit village")
+            await db.log_activity(user.id, "error - edit village")
             await update.message.reply_text("please enter the new village")
             return HANDLE_EDIT
-        db.set_user_attribute(user.id, f"farms.{farm}.village", new_village)
+        await db.update_farm(user.id, farm, {"village": new_village})
         reply_text = f"The new village {farm} was successfully registered."
-        db.log_activity(user.id, "finish edit village")
+        await db.log_activity(user.id, "finish edit village")
         await context.bot.send_message(
-            chat_id=user.id, text=reply_text, reply_markup=db.find_start_keyboard(user.id)
+            chat_id=user.id, text=reply_text, reply_markup=await db.find_start_keyboard(user.id)
         )
         return ConversationHandler.END
     elif attr == "change the area":
@@ -300,49 +300,43 @@ async def handle_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await context.bot.send_message(chat_id=user.id, text = "Choose one of the options below to edit:", reply_markup=edit_keyboard_reply())
             return EDIT_FARM
         if new_area in MENU_CMDS:
-            db.log_activity(user.id, "error - answer in menu_cmd list", new_area)
-            await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+            await db.log_activity(user.id, "error - answer in menu_cmd list", new_area)
+            await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
             return ConversationHandler.END
         if not new_area:
-            db.log_activity(user.id, "error - edit area")
+            await db.log_activity(user.id, "error - edit area")
             await update.message.reply_text("please enter the new area.")
             return HANDLE_EDIT
-        db.set_user_attribute(user.id, f"farms.{farm}.area", new_area)
+        await db.update_farm(user.id, farm, {"area": new_area})
         reply_text = f"The new area {farm} was successfully registered."
-        db.log_activity(user.id, "finish edit area")
+        await db.log_activity(user.id, "finish edit area")
         await context.bot.send_message(
-            chat_id=user.id, text=reply_text, reply_markup=db.find_start_keyboard(user.id)
+            chat_id=user.id, text=reply_text, reply_markup=await db.find_start_keyboard(user.id)
         )
         return ConversationHandler.END
     elif attr == "change the location":
         new_location = update.message.location
         text = update.message.text
         if text == "back":
-            db.log_activity(user.id, "back")
+            await db.log_activity(user.id, "back")
             await context.bot.send_message(chat_id=user.id, text = "Choose one of the below options to edit:", reply_markup=edit_keyboard_reply())
             return EDIT_FARM
         if text == "send the location (google map or Neshan)":
-            db.log_activity(user.id, "chose to edit location with link")
-            db.set_user_attribute(
-                user.id, f"farms.{farm}.location-method", "Link via edit"
-            )
+            await db.log_activity(user.id, "chose to edit location with link")
+            await db.update_farm(user.id, farm, {"location-method": "Link via edit"})
             await update.message.reply_text("Please send your garden's location.", reply_markup=back_button())
             return HANDLE_EDIT_LINK
         if new_location:
             logger.info(f"{update.effective_user.id} chose: new_location sent successfully")
-            db.set_user_attribute(
-                user.id, f"farms.{farm}.location.longitude", new_location.longitude
-            )
-            db.set_user_attribute(
-                user.id, f"farms.{farm}.location.latitude", new_location.latitude
-            )
-            db.set_user_attribute(
-                user.id, f"farms.{farm}.location-method", "User sent location via edit"
-            )
+            await db.update_farm(user.id, farm, {
+                "location.longitude": new_location.longitude,
+                "location.latitude": new_location.latitude,
+                "location-method": "User sent location via edit",
+            })
             reply_text = f"The new location {farm} was successfully registered."
-            db.log_activity(user.id, "finish edit location", f"long: {new_location.longitude}, lat: {new_location.latitude}")
+            await db.log_activity(user.id, "finish edit location", f"long: {new_location.longitude}, lat: {new_location.latitude}")
             await context.bot.send_message(
-                chat_id=user.id, text=reply_text, reply_markup=db.find_start_keyboard(user.id)
+                chat_id=user.id, text=reply_text, reply_markup=await db.find_start_keyboard(user.id)
             )
             return ConversationHandler.END
         if not new_location and text != "I choose using the map in telegram":
@@ -353,17 +347,15 @@ async def handle_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
 Sending the new location of the garden was not successfully done.
 Are you having trouble sending the location? ؟ message @agriiadmin now for guidance.
             """
-            db.log_activity(user.id, "error - edit location", text)
+            await db.log_activity(user.id, "error - edit location", text)
             await context.bot.send_message(
                 chat_id=user.id, text=reply_text, reply_markup=edit_keyboard_reply()
             )
-            db.set_user_attribute(
-                user.id, f"farms.{farm}.location-method", "Unsuccessful via edit"
-            )
+            await db.update_farm(user.id, farm, {"location-method": "Unsuccessful via edit"})
             context.job_queue.run_once(no_location_reminder, when=datetime.timedelta(hours=1),chat_id=user.id, data=user.username)    
             return EDIT_FARM
         elif text == "I choose from the app in telegram":
-            db.log_activity(user.id, "chose to send location from map")
+            await db.log_activity(user.id, "chose to send location from map")
             logger.info(
                 f"{update.effective_user.id} chose: az google map entekhab mikonam"
             )
@@ -383,15 +375,15 @@ async def handle_edit_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
     farm = user_data["selected_farm"]
     if text in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", text)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", text)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     if not text:
-        db.log_activity(user.id, "error - no location link")
+        await db.log_activity(user.id, "error - no location link")
         await update.message.reply_text("Please send the location link of your garden.", reply_markup=back_button())
         return HANDLE_EDIT_LINK
     elif text == "back":
-        db.log_activity(user.id, "back")
+        await db.log_activity(user.id, "back")
         reply_text = "Please send your garden's location using one of the below options."
         keyboard = [
         [KeyboardButton("send location's link (google map or Neshan)")],
@@ -408,9 +400,9 @@ async def handle_edit_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return HANDLE_EDIT
     reply_text = "Sending the location was successfully done. Please wait for admin's approval. Thanks!"
-    db.set_user_attribute(user.id, f"farms.{farm}.link-status", "To be verified")
-    db.log_activity(user.id, "finish edit location with link")
-    await update.message.reply_text(reply_text, reply_markup=db.find_start_keyboard(user.id))
+    await db.update_farm(user.id, farm, {"link-status": "To be verified"})
+    await db.log_activity(user.id, "finish edit location with link")
+    await update.message.reply_text(reply_text, reply_markup=await db.find_start_keyboard(user.id))
     context.job_queue.run_once(no_location_reminder, when=datetime.timedelta(hours=1),chat_id=user.id, data=user.username)    
     for admin in ADMIN_LIST:
         try:
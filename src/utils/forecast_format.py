@@ -0,0 +1,131 @@
+"""Columnar on-disk format of the forecast files.
+
+Each GeoJSON drop is ingested once into a `<name>.columns/` directory next to it:
+
+    coords.npy   float32 (n, 2), longitude and latitude of the grid points
+    values.npy   float32 (n, numeric columns), e.g. tmin_Time=..., rain_Time=...
+    codes.npy    int32 (n, text columns), indexes into `vocabulary`, -1 where the value is missing
+    meta.json    column names and the vocabulary of the text (advice) columns, written last
+
+The arrays are memory-mapped on load, so loading doesn't depend on the size of the grid.
+"""
+import json
+import os
+import shutil
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+COLUMNAR_SUFFIX = ".columns"
+
+
+def columnar_path(path: str) -> str:
+    return os.path.splitext(path)[0] + COLUMNAR_SUFFIX
+
+
+class ForecastTable:
+    """A loaded forecast file. The arrays are read-only."""
+    def __init__(self, coords: np.ndarray, values: np.ndarray, codes: np.ndarray,
+                 numeric: list[str], text: list[str], vocabulary: list[str]) -> None:
+        self.coords = coords
+        self.values = values
+        self.codes = codes
+        self.numeric = numeric
+        self.text = text
+        self.vocabulary = vocabulary
+        self._numeric_positions = {name: i for i, name in enumerate(numeric)}
+        self._text_positions = {name: i for i, name in enumerate(text)}
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    @property
+    def longitudes(self) -> np.ndarray:
+        return self.coords[:, 0]
+
+    @property
+    def latitudes(self) -> np.ndarray:
+        return self.coords[:, 1]
+
+    def _decode(self, code: int):
+        return self.vocabulary[code] if code >= 0 else None
+
+    def column(self, name: str) -> np.ndarray:
+        """All values of one column, decoded to an object array for text columns."""
+        if name in self._numeric_positions:
+            return self.values[:, self._numeric_positions[name]]
+        codes = self.codes[:, self._text_positions[name]]
+        vocabulary = np.array(self.vocabulary + [None], dtype=object)
+        return vocabulary[codes]  # -1 picks the trailing None
+
+    def row(self, position: int) -> pd.Series:
+        """One grid point as a Series keyed by the original column names, like `GeoDataFrame.iloc`."""
+        values = dict(zip(self.numeric, self.values[position].tolist()))
+        values.update(zip(self.text, (self._decode(code) for code in self.codes[position].tolist())))
+        return pd.Series(values, dtype=object)
+
+
+def table_from_frame(frame) -> ForecastTable:
+    """Converts a GeoDataFrame of grid points. Numeric columns are stored as float32, others dictionary-encoded."""
+    coords = np.column_stack([frame.geometry.x, frame.geometry.y]).astype(np.float32)
+    columns = [name for name in frame.columns if name != frame.geometry.name]
+    numeric = [name for name in columns if pd.api.types.is_numeric_dtype(frame[name])]
+    text = [name for name in columns if name not in numeric]
+    values = frame[numeric].to_numpy(dtype=np.float32).reshape(len(frame), len(numeric))
+    if text:
+        stacked = frame[text].to_numpy(dtype=object).ravel()
+        stacked = np.array([None if pd.isna(value) else str(value) for value in stacked], dtype=object)
+        codes, vocabulary = pd.factorize(stacked, use_na_sentinel=True)
+        codes = codes.astype(np.int32).reshape(len(frame), len(text))
+        vocabulary = list(vocabulary)
+    else:
+        codes = np.empty((len(frame), 0), dtype=np.int32)
+        vocabulary = []
+    return ForecastTable(coords, values, codes, numeric, text, vocabulary)
+
+
+def write_table(table: ForecastTable, path: str) -> None:
+    """Writes `table` to the directory `path`, replacing an older version of it."""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, "coords.npy"), table.coords)
+    np.save(os.path.join(tmp, "values.npy"), table.values)
+    np.save(os.path.join(tmp, "codes.npy"), table.codes)
+    meta = {"version": FORMAT_VERSION, "numeric": table.numeric, "text": table.text, "vocabulary": table.vocabulary}
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    # Tables that are already loaded keep their memory maps of the replaced files.
+    old = f"{path}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.rename(path, old)
+    os.rename(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def read_table(path: str) -> ForecastTable:
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta["version"] != FORMAT_VERSION:
+        raise ValueError(f"{path} has format version {meta['version']}, expected {FORMAT_VERSION}")
+    arrays = [np.load(os.path.join(path, name), mmap_mode="r") for name in ("coords.npy", "values.npy", "codes.npy")]
+    return ForecastTable(*arrays, meta["numeric"], meta["text"], meta["vocabulary"])
+
+
+def version(path: str) -> int | None:
+    """mtime of the columnar file at `path`, None if it doesn't exist."""
+    try:
+        return os.stat(os.path.join(path, "meta.json")).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def ingest(geojson_path: str) -> str:
+    """Converts a GeoJSON drop to the columnar format unless it is already up to date. Returns the columnar path."""
+    path = columnar_path(geojson_path)
+    converted = version(path)
+    if converted is None or converted < os.stat(geojson_path).st_mtime_ns:
+        write_table(table_from_frame(gpd.read_file(geojson_path)), path)
+    return path
@@ -0,0 +1,194 @@
+import asyncio
+import datetime
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .forecast_format import ForecastTable, columnar_path, ingest, read_table, version
+from .grid_index import GridIndex
+from .logger import logger
+
+FORECAST_DIR = os.environ.get("FORECAST_DIR", "data")
+FORECAST_POLL_INTERVAL = int(os.environ.get("FORECAST_POLL_INTERVAL", 60))
+FORECAST_FILES = {
+    "weather": "Iran{date}_weather.geojson",
+    "sp": "Iran{date}_AdviseSP.geojson",
+    "pre-harvest": "pesteh{date}_Advise_Bef.geojson",
+    "post-harvest": "pesteh{date}_Advise_Aft.geojson",
+}
+
+
+class ForecastNotAvailable(LookupError):
+    pass
+
+
+@dataclass(frozen=True)
+class ForecastSnapshot:
+    """One loaded forecast file, shared by every caller."""
+    kind: str
+    date: str
+    path: str
+    mtime_ns: int
+    table: ForecastTable
+    index: GridIndex
+
+    def nearest(self, longitude, latitude) -> tuple:
+        """Row of the grid point nearest to the location and its distance. The row is None beyond the threshold."""
+        position, distance = self.index.nearest(longitude, latitude)
+        return (None if position is None else self.table.row(position)), distance
+
+    def nearest_farm(self, farm: dict, longitude, latitude) -> tuple:
+        """`nearest` for a farm at (longitude, latitude), gathered from the grid cell stored with the farm if it's current."""
+        cell = _stored_cell(farm.get("grid"), self.index.grid_id, longitude, latitude)
+        if cell is None:
+            return self.nearest(longitude, latitude)
+        return (None if cell["row"] is None else self.table.row(cell["row"])), cell["distance"]
+
+
+def _stored_cell(grid: dict | None, grid_id: str, longitude, latitude) -> dict | None:
+    """The cell of a farm's `grid` field in grid `grid_id`, None if there is none for the farm's current location."""
+    grid = grid or {}
+    cell = (grid.get("cells") or {}).get(grid_id)
+    if cell is None or grid.get("location") != [longitude, latitude]:
+        return None
+    return cell
+
+
+def _stored_cells(grids, grid_ids) -> tuple[np.ndarray, np.ndarray, dict]:
+    """The farms' `grid` fields as arrays: the stored longitudes and latitudes, NaN where there is none,
+    and `(rows, distances, stored)` of the cells of each of `grid_ids`, `stored` being False where a farm has none.
+    """
+    longitudes = np.full(len(grids), np.nan)
+    latitudes = np.full(len(grids), np.nan)
+    cells = {grid_id: (np.full(len(grids), -1, dtype=np.int64), np.full(len(grids), np.inf), np.zeros(len(grids), dtype=bool))
+             for grid_id in grid_ids}
+    for i, grid in enumerate(grids):
+        grid = grid or {}
+        if grid.get("location") is None:
+            continue
+        longitudes[i], latitudes[i] = grid["location"]
+        for grid_id, cell in (grid.get("cells") or {}).items():
+            if grid_id in cells:
+                rows, distances, stored = cells[grid_id]
+                rows[i] = -1 if cell["row"] is None else cell["row"]
+                distances[i] = cell["distance"]
+                stored[i] = True
+    return longitudes, latitudes, cells
+
+
+def join_farms(farms: pd.DataFrame, snapshots: dict[str, ForecastSnapshot]) -> pd.DataFrame:
+    """Resolves every farm against each snapshot in one vectorized pass.
+
+    `farms` needs longitude, latitude and grid columns, NaN coordinates for farms without a location.
+    For each kind of `snapshots` the result gets `{kind}_row`, `{kind}_distance` and `{kind}_within`
+    columns, the row being -1 where no grid point is within the threshold. Farms with a current stored
+    cell are gathered from it and the others are searched with one `nearest_many` per distinct grid.
+    """
+    table = farms.copy()
+    longitudes = table["longitude"].to_numpy(dtype=float)
+    latitudes = table["latitude"].to_numpy(dtype=float)
+    located = ~np.isnan(longitudes) & ~np.isnan(latitudes)
+    stored_longitudes, stored_latitudes, cells = _stored_cells(
+        table["grid"].tolist(), {snapshot.index.grid_id for snapshot in snapshots.values()})
+    # farms located by their village have no stored location and never match
+    current_location = located & (stored_longitudes == longitudes) & (stored_latitudes == latitudes)
+    # files on the same grid, e.g. the weather and the advice of one day, are resolved once
+    resolved = {}
+    for kind, snapshot in snapshots.items():
+        grid_id = snapshot.index.grid_id
+        if grid_id not in resolved:
+            stored_rows, stored_distances, stored = cells[grid_id]
+            current = current_location & stored
+            rows = np.where(current, stored_rows, -1)
+            distances = np.where(current, stored_distances, np.inf)
+            search = located & ~current
+            if search.any():
+                rows[search], distances[search] = snapshot.index.nearest_many(longitudes[search], latitudes[search])
+            resolved[grid_id] = rows, distances
+        rows, distances = resolved[grid_id]
+        table[f"{kind}_row"] = rows
+        table[f"{kind}_distance"] = distances
+        table[f"{kind}_within"] = rows >= 0
+    return table
+
+
+def forecast_path(kind: str, date: str) -> str:
+    return os.path.join(FORECAST_DIR, FORECAST_FILES[kind].format(date=date))
+
+
+def _load(kind: str, date: str, current: ForecastSnapshot | None) -> ForecastSnapshot | None:
+    """Ingests the GeoJSON drop if it is new and memory-maps its columnar file. Runs in a worker thread."""
+    source = forecast_path(kind, date)
+    if os.path.exists(source):
+        ingest(source)
+    path = columnar_path(source)
+    mtime_ns = version(path)
+    if mtime_ns is None:
+        return None
+    if current is not None and current.mtime_ns == mtime_ns:
+        return current
+    table = read_table(path)
+    return ForecastSnapshot(kind, date, path, mtime_ns, table, GridIndex(table.longitudes, table.latitudes))
+
+
+class ForecastStore:
+    """Process-wide cache of the parsed forecast files.
+
+    The handlers serve today's files between 07:00 and 20:30 and yesterday's otherwise, so
+    `refresh` keeps both dates of every kind loaded and the rollover is a dictionary lookup.
+    `refresh` polls FORECAST_DIR, ingests new or rewritten drops into the columnar format off
+    the event loop, memory-maps them and swaps the whole mapping at once. Readers never see a
+    half-loaded state and never parse a file.
+    """
+    def __init__(self) -> None:
+        self._snapshots = {}
+        self._lock = asyncio.Lock()
+
+    def get(self, kind: str, date: str) -> ForecastSnapshot:
+        snapshot = self._snapshots.get((kind, date))
+        if snapshot is None:
+            raise ForecastNotAvailable(forecast_path(kind, date))
+        return snapshot
+
+    def grids(self) -> dict[str, GridIndex]:
+        """Indexes of the loaded files keyed by grid id, one per distinct grid."""
+        return {snapshot.index.grid_id: snapshot.index for snapshot in self._snapshots.values()}
+
+    async def load(self, kind: str, date: str) -> ForecastSnapshot:
+        """Like `get`, but loads the file if it hasn't been loaded yet. For jobs that run before the next poll."""
+        if (kind, date) not in self._snapshots:
+            await self.refresh(extra=[(kind, date)])
+        return self.get(kind, date)
+
+    async def refresh(self, now: datetime.datetime = None, extra: list = ()) -> int:
+        """Loads the forecast files of today and yesterday that are new or changed on disk.
+
+        Returns the number of files loaded.
+        """
+        now = now or datetime.datetime.now()
+        dates = [now.strftime("%Y%m%d"), (now - datetime.timedelta(days=1)).strftime("%Y%m%d")]
+        wanted = [(kind, date) for date in dates for kind in FORECAST_FILES] + list(extra)
+        async with self._lock:
+            snapshots = {}
+            loaded = 0
+            for kind, date in wanted:
+                current = self._snapshots.get((kind, date))
+                try:
+                    snapshot = await asyncio.to_thread(_load, kind, date, current)
+                except Exception as e:
+                    # Most likely a drop that is still being copied, retried on the next poll.
+                    logger.warning(f"could not load the {kind} forecast of {date}: {e}")
+                    snapshot = current
+                if snapshot is None:
+                    continue
+                if snapshot is not current:
+                    loaded += 1
+                    logger.info(f"loaded {snapshot.path} into the forecast store")
+                snapshots[(kind, date)] = snapshot
+            self._snapshots = snapshots
+        return loaded
+
+
+forecast_store = ForecastStore()
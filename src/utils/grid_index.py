@@ -0,0 +1,46 @@
+import hashlib
+
+import numpy as np
+import shapely
+from shapely import STRtree
+
+GRID_THRESHOLD = 0.1  # degrees
+
+
+class GridIndex:
+    """Nearest grid point lookups over the points of one forecast file.
+
+    The STRtree is built once, each query is O(log n). Rows are positions in the
+    forecast table and a grid point only counts as a match within `threshold` degrees, as before.
+    """
+    def __init__(self, longitudes, latitudes, threshold: float = GRID_THRESHOLD) -> None:
+        self.threshold = threshold
+        self.size = len(longitudes)
+        self._tree = STRtree(shapely.points(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float)))
+        # Identifies the grid definition, files of other days on the same grid share it
+        coords = np.column_stack([np.asarray(longitudes, dtype=np.float32), np.asarray(latitudes, dtype=np.float32)])
+        self.grid_id = hashlib.sha1(coords.tobytes() + str(threshold).encode()).hexdigest()[:16]
+
+    def nearest_many(self, longitudes, latitudes) -> tuple[np.ndarray, np.ndarray]:
+        """Positional rows and distances of the nearest grid points of many locations.
+
+        Locations without a grid point within the threshold, or without coordinates,
+        get row -1. Their distance is still reported when it is known.
+        """
+        locations = shapely.points(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+        rows = np.full(len(locations), -1, dtype=np.int64)
+        distances = np.full(len(locations), np.inf)
+        if not len(locations) or not self.size:
+            return rows, distances
+        (found, nearest), found_distances = self._tree.query_nearest(
+            locations, return_distance=True, all_matches=False
+        )
+        distances[found] = found_distances
+        within = found_distances <= self.threshold
+        rows[found[within]] = nearest[within]
+        return rows, distances
+
+    def nearest(self, longitude, latitude) -> tuple[int | None, float]:
+        """Positional row of the nearest grid point, or None if it is farther than the threshold."""
+        rows, distances = self.nearest_many([float(longitude)], [float(latitude)])
+        return (int(rows[0]) if rows[0] >= 0 else None), float(distances[0])
@@ -1,8 +1,6 @@
 import datetime
 import jdatetime
-import geopandas as gpd
 import pandas as pd
-from shapely.geometry import Point
 from telegram import Update
 from telegram.ext import (
     CommandHandler,
@@ -13,10 +11,10 @@ from telegram.ext import (
 )
 from telegram.error import Forbidden, BadRequest
 
-from fiona.errors import DriverError
 import warnings
 import database
 from .logger import logger
+from .forecast_store import ForecastNotAvailable, forecast_store
 from .keyboards import (
     farms_list_reply,
     view_advise_keyboard
@@ -35,42 +33,42 @@ db = database.Database()
 async def req_pre_harvest(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_data = context.user_data
-    db.log_activity(user.id, "request pre harvest")
-    if db.check_if_user_has_pesteh(user.id):
+    await db.log_activity(user.id, "request pre harvest")
+    if await db.check_if_user_has_pesteh(user.id):
         user_data["harvest_data"] = "PRE"
         await context.bot.send_message(
             chat_id=user.id,
             text="Choose one of your gardens",
-            reply_markup=farms_list_reply(db, user.id, True),
+            reply_markup=await farms_list_reply(db, user.id, True),
         )
         return RECV_HARVEST
     else:
-        db.log_activity(user.id, "error - no farm for pre harvest advise")
+        await db.log_activity(user.id, "error - no farm for pre harvest advise")
         await context.bot.send_message(
             chat_id=user.id,
             text="You have not registered any Pistachio garden yet.",
-            reply_markup=db.find_start_keyboard(user.id),
+            reply_markup=await db.find_start_keyboard(user.id),
         )
         return ConversationHandler.END
     
 async def req_post_harvest(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_data = context.user_data
-    db.log_activity(user.id, "request post harvest")
-    if db.check_if_user_has_pesteh(user.id):
+    await db.log_activity(user.id, "request post harvest")
+    if await db.check_if_user_has_pesteh(user.id):
         user_data["harvest_data"] = "POST"
         await context.bot.send_message(
             chat_id=user.id,
             text="Choose one of your gardens",
-            reply_markup=farms_list_reply(db, user.id, True),
+            reply_markup=await farms_list_reply(db, user.id, True),
         )
         return RECV_HARVEST
     else:
-        db.log_activity(user.id, "error - no farm for post harvest advise")
+        await db.log_activity(user.id, "error - no farm for post harvest advise")
         await context.bot.send_message(
             chat_id=user.id,
             text="You have not registered any Pistachio garden yet",
-            reply_markup=db.find_start_keyboard(user.id),
+            reply_markup=await db.find_start_keyboard(user.id),
         )
         return ConversationHandler.END
     
@@ -79,30 +77,30 @@ async def recv_harvest_advice(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_data = context.user_data
     harvest_type = user_data.get("harvest_data", "")
     farm = update.message.text
-    user_farms = db.get_farms(user.id)
+    user_farms = await db.get_farms(user.id)
     
     if farm == '↩️ back':
-        db.log_activity(user.id, "back")
-        await update.message.reply_text("The operation was cancelled", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "back")
+        await update.message.reply_text("The operation was cancelled", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif farm not in list(user_farms.keys()):
-        db.log_activity(user.id, "error - chose farm for harvest advice" , farm)
-        await update.message.reply_text("Please try again. garden's name was invalid", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - chose farm for harvest advice" , farm)
+        await update.message.reply_text("Please try again. garden's name was invalid", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif farm in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", farm)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", farm)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
-    db.log_activity(user.id, f"chose farm for {harvest_type} harvest advice", farm)
+    await db.log_activity(user.id, f"chose farm for {harvest_type} harvest advice", farm)
     longitude = user_farms[farm]["location"]["longitude"]
     latitude = user_farms[farm]["location"]["latitude"]
     if user_farms[farm].get("link-status") == "To be verified":
         reply_text = "The location link you sent has not been verified yet.\n Please be patient until nabat's admin confirmation ."
-        await context.bot.send_message(chat_id=user.id, text=reply_text,reply_markup=db.find_start_keyboard(user.id))
+        await context.bot.send_message(chat_id=user.id, text=reply_text,reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif not longitude:
         await context.bot.send_message(chat_id=user.id, text="Your grden's location has not been registered. Please register your garden's location before asking for harvest advices.",
-                                 reply_markup=db.find_start_keyboard(user.id))
+                                 reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     
     yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y%m%d")
@@ -126,39 +124,35 @@ async def recv_harvest_advice(update: Update, context: ContextTypes.DEFAULT_TYPE
     try:
         if datetime.time(7, 0).strftime("%H%M") <= datetime.datetime.now().strftime("%H%M") < datetime.time(20, 30).strftime("%H%M"): 
             if harvest_type == "PRE":
-                harvest_data = gpd.read_file(f"data/pesteh{today}_Advise_Bef.geojson")
+                harvest_data = forecast_store.get("pre-harvest", today)
                 advice = "پیش از برداشت"
             elif harvest_type == "POST":
-                harvest_data = gpd.read_file(f"data/pesteh{today}_Advise_Aft.geojson")
+                harvest_data = forecast_store.get("post-harvest", today)
                 advice = "پس از برداشت"
             else:
-                db.log_activity(user.id, "error - harvest type not found", harvest_type)
-                await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+                await db.log_activity(user.id, "error - harvest type not found", harvest_type)
+                await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
                 return ConversationHandler.END
         else:
             if harvest_type == "PRE":
-                harvest_data = gpd.read_file(f"data/pesteh{yesterday}_Advise_Bef.geojson")
+                harvest_data = forecast_store.get("pre-harvest", yesterday)
                 advice = "before harvest"
             elif harvest_type == "POST":
-                harvest_data = gpd.read_file(f"data/pesteh{yesterday}_Advise_Aft.geojson")
+                harvest_data = forecast_store.get("post-harvest", yesterday)
                 advice = "after harvest"
             else:
-                db.log_activity(user.id, "error - harvest type not found", harvest_type)
-                await update.message.reply_text("The previous operation was cancelled please try again.", reply_markup=db.find_start_keyboard(user.id))
+                await db.log_activity(user.id, "error - harvest type not found", harvest_type)
+                await update.message.reply_text("The previous operation was cancelled please try again.", reply_markup=await db.find_start_keyboard(user.id))
                 return ConversationHandler.END
-    except DriverError:
+    except ForecastNotAvailable:
         logger.info(f"{user.id} requested harvest advice. file was not found!")
-        await context.bot.send_message(chat_id=user.id, text="Unfortunately your garden's information does not exist right now.", reply_markup=db.find_start_keyboard(user.id))
+        await context.bot.send_message(chat_id=user.id, text="Unfortunately your garden's information does not exist right now.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
-    threshold = 0.1  # degrees
-    point = Point(longitude, latitude)
-    idx_min_dist = harvest_data.geometry.distance(point).idxmin()
-    closest_coords = harvest_data.geometry.iloc[idx_min_dist].coords[0]
-    row = harvest_data.iloc[idx_min_dist]
+    row, _ = harvest_data.nearest_farm(user_farms[farm], longitude, latitude)
     
-    if point.distance(Point(closest_coords)) <= threshold:
+    if row is not None:
         advise_3days = [row[f'Time={today}'], row[f'Time={day2}'], row[f'Time={day3}']]
-        db.set_user_attribute(user.id, f"farms.{farm}.advise", {"today": advise_3days[0], "day2": advise_3days[1], "day3":advise_3days[2]})
+        await db.update_farm(user.id, farm, {"advise": {"today": advise_3days[0], "day2": advise_3days[1], "day3":advise_3days[2]}})
         try:
             if pd.isna(advise_3days[0]):
                     advise = f"""
@@ -181,12 +175,12 @@ async def recv_harvest_advice(update: Update, context: ContextTypes.DEFAULT_TYPE
             await context.bot.send_message(chat_id=user.id, text=advise, reply_markup=view_advise_keyboard(farm), parse_mode=ParseMode.HTML)
             return RECV_HARVEST
         except Forbidden:
-            db.set_user_attribute(user.id, "blocked", True)
+            await db.set_user_attribute(user.id, "blocked", True)
             logger.info(f"user:{user.id} has blocked the bot!")
         except BadRequest:
             logger.info(f"user:{user.id} chat was not found!")
     else:
-        await context.bot.send_message(chat_id=user.id, text="Currently there is no harvest advice for your garden", reply_markup=db.find_start_keyboard(user.id))
+        await context.bot.send_message(chat_id=user.id, text="Currently there is no harvest advice for your garden", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
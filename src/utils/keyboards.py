@@ -9,13 +9,16 @@ def stats_keyboard():
         InlineKeyboardButton("member count", callback_data='member_count'),
         InlineKeyboardButton("changes of member count", callback_data='member_count_change')
     ],
+    [
+        InlineKeyboardButton("member count, last 3 months", callback_data='member_count_change_long'),
+    ],
     [
         InlineKeyboardButton("block count", callback_data='block_count'),
         InlineKeyboardButton("member count without location", callback_data='no_location_count'),
         
     ],
     [
-        # InlineKeyboardButton("دانلود فایل اکسل", callback_data='excel_download'),
+        InlineKeyboardButton("download members (csv)", callback_data='excel_download'),
         InlineKeyboardButton("member count without phone", callback_data='no_phone_count'),
     ],
     # [
@@ -25,8 +28,8 @@ def stats_keyboard():
     reply_markup = InlineKeyboardMarkup(keyboard)
     return reply_markup
 
-def farms_list_inline(database: db, user_id, view: bool = True, edit: bool = False):
-    farms = database.get_farms(user_id=user_id)
+async def farms_list_inline(database: db, user_id, view: bool = True, edit: bool = False):
+    farms = await database.get_farms(user_id=user_id)
     if not farms:
         return None
     keys_list = list(farms.keys())
@@ -39,8 +42,8 @@ def farms_list_inline(database: db, user_id, view: bool = True, edit: bool = Fal
         keyboard = [ [InlineKeyboardButton(key, callback_data=f"{key}")] for key in keys_list ]
         return InlineKeyboardMarkup(keyboard)
     
-def farms_list_reply(database: db, user_id, pesteh_kar: bool = None):
-    farms = database.get_farms(user_id=user_id)
+async def farms_list_reply(database: db, user_id, pesteh_kar: bool = None):
+    farms = await database.get_farms(user_id=user_id)
     if not farms:
         return None
     keys_list = list(farms.keys())
@@ -0,0 +1,233 @@
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from pymongo import monitoring
+from telegram.ext import ConversationHandler, JobQueue
+
+# Name of the PTB handler callback or job running in the current task. Motor copies the
+# context to its executor threads, so CommandMonitor sees it when a command starts.
+current_operation: ContextVar[str] = ContextVar("current_operation", default="unattributed")
+_round_trip_budget: ContextVar["RoundTripBudget"] = ContextVar("round_trip_budget", default=None)
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool metrics of the shared client.
+
+    Motor checks connections out on its executor threads and pymongo publishes the
+    events on the same thread, so the checkout wait is measured with a thread-local
+    start time.
+    """
+    def __init__(self, window: int = 1000) -> None:
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.waits = deque(maxlen=window)
+        self.open = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkouts = 0
+        self.failed_checkouts = 0
+        self.cleared = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = list(self.waits)
+            return {
+                "open": self.open,
+                "in-use": self.in_use,
+                "max-in-use": self.max_in_use,
+                "checkouts": self.checkouts,
+                "failed-checkouts": self.failed_checkouts,
+                "pool-cleared": self.cleared,
+                "wait-ms-avg": 1000 * sum(waits) / len(waits) if waits else 0.0,
+                "wait-ms-p95": 1000 * percentile(waits, 0.95),
+                "wait-ms-max": 1000 * max(waits, default=0.0),
+            }
+
+    def _checkout_wait(self) -> float:
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = self._checkout_wait()
+        with self._lock:
+            self.waits.append(wait)
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def connection_check_out_failed(self, event):
+        wait = self._checkout_wait()
+        with self._lock:
+            self.waits.append(wait)
+            self.failed_checkouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.cleared += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+class LatencyStats:
+    def __init__(self, window: int = 1000) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.latencies = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.latencies.append(seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "total-ms": 1000 * self.total,
+            "p95-ms": 1000 * percentile(self.latencies, 0.95),
+        }
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """Attributes every MongoDB command to the handler or job that issued it and to its collection."""
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._started = {}
+        self.by_operation = {}
+        self.by_collection = {}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "operations": {name: stats.snapshot() for name, stats in self.by_operation.items()},
+                "collections": {name: stats.snapshot() for name, stats in self.by_collection.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.by_operation.clear()
+            self.by_collection.clear()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.database_name
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = (current_operation.get(), collection)
+        budget = _round_trip_budget.get()
+        if budget is not None:
+            budget.commands.append(f"{event.command_name} {collection}")
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        seconds = event.duration_micros / 1e6
+        with self._lock:
+            operation, collection = self._started.pop((event.connection_id, event.request_id),
+                                                      (current_operation.get(), "unknown"))
+            self.by_operation.setdefault(operation, LatencyStats()).add(seconds)
+            self.by_collection.setdefault(collection, LatencyStats()).add(seconds)
+
+
+def attributed(callback, name: str = None):
+    """Wraps a handler or job callback so the commands it issues are attributed to `name`."""
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        token = current_operation.set(name)
+        try:
+            return await callback(*args, **kwargs)
+        finally:
+            current_operation.reset(token)
+    return wrapper
+
+
+def instrument_handlers(application) -> None:
+    """Attributes the commands of every registered handler, including conversation states, to its callback."""
+    def instrument(handler):
+        if isinstance(handler, ConversationHandler):
+            for state_handlers in [handler.entry_points, handler.fallbacks, *handler.states.values()]:
+                for child in state_handlers:
+                    instrument(child)
+        elif not hasattr(handler.callback, "__wrapped__"):
+            handler.callback = attributed(handler.callback)
+
+    for group in application.handlers.values():
+        for handler in group:
+            instrument(handler)
+
+
+class AttributedJobQueue(JobQueue):
+    """JobQueue that attributes the commands of each job to its callback."""
+    @staticmethod
+    async def job_callback(job_queue, job) -> None:
+        token = current_operation.set(job.callback.__name__)
+        try:
+            await JobQueue.job_callback(job_queue, job)
+        finally:
+            current_operation.reset(token)
+
+
+class RoundTripBudget:
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.commands = []
+
+
+@contextmanager
+def round_trip_budget(limit: int):
+    """Fails with AssertionError if the code in the block sends more than `limit` MongoDB commands.
+
+    For tests, e.g.
+        with round_trip_budget(3):
+            await recv_weather(update, context)
+    """
+    budget = RoundTripBudget(limit)
+    token = _round_trip_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _round_trip_budget.reset(token)
+    if len(budget.commands) > limit:
+        raise AssertionError(f"{len(budget.commands)} round trips, budget was {limit}: {budget.commands}")
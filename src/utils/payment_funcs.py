@@ -57,7 +57,7 @@ ADMIN_LIST = db.get_admins()
 ## PAYMENT FUNCS
 async def payment_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.log_activity(user.id, "chose payment from menu")
+    await db.log_activity(user.id, "chose payment from menu")
     user_data = context.user_data
     keyboard = [[InlineKeyboardButton("payment portal", url=PAYMENT_PLANS[key]) for key in list(PAYMENT_PLANS.keys())]]
     code = ''.join(random.choice(string.digits) for _ in range(5))
@@ -81,22 +81,22 @@ owner: Nima Ganji
 """,
                                      reply_markup=InlineKeyboardMarkup(keyboard),
                                      parse_mode=ParseMode.HTML)
-    db.log_payment(user.id, code=code)
-    db.set_user_attribute(user.id, "payment-msg-id", user_data["payment-message"]["message_id"])
-    db.set_user_attribute(user.id, "used-coupon", False)
+    await db.log_payment(user.id, code=code)
+    await db.set_user_attribute(user.id, "payment-msg-id", user_data["payment-message"]["message_id"])
+    await db.set_user_attribute(user.id, "used-coupon", False)
 
 # start of /off conversation
 async def ask_coupon(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    pay_message_id = db.get_user_attribute(user.id, "payment-msg-id")
+    pay_message_id = await db.get_user_attribute(user.id, "payment-msg-id")
     if not pay_message_id:
-        db.log_activity(user.id, "used /off before starting payment process")
+        await db.log_activity(user.id, "used /off before starting payment process")
         await context.bot.send_message(chat_id=user.id, text="Please start the payment process from the bot menu in /start")
         return ConversationHandler.END
     else:
         await context.bot.send_message(chat_id=user.id, text="Please enter yolur discount code:",
                                        reply_markup=ReplyKeyboardRemove())
-        db.log_activity(user.id, "started /off conversation")
+        await db.log_activity(user.id, "started /off conversation")
         return HANDLE_COUPON
 
 async def handle_coupon(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -105,21 +105,24 @@ async def handle_coupon(update: Update, context: ContextTypes.DEFAULT_TYPE):
     coupon = update.message.text
     if not coupon:
         await context.bot.send_message(chat_id=user.id, text="Registration of discount code failed. You can try again /off")
-        db.log_activity(user.id, "error - coupon message has no text")
+        await db.log_activity(user.id, "error - coupon message has no text")
         return ConversationHandler.END
     elif coupon in MENU_CMDS:
-        db.log_activity(user.id, "error - coupon in menu_cmd list", coupon)
-        await update.message.reply_text("The previous operation was cancelled. Please try again. /off", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - coupon in menu_cmd list", coupon)
+        await update.message.reply_text("The previous operation was cancelled. Please try again. /off", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
-    elif db.verify_coupon(coupon):
-        if not db.get_user_attribute(user.id, "used-coupon"):
-            db.set_user_attribute(user.id, "used-coupon", True)
-            db.log_activity(user.id, "used a valid coupon", coupon)
-            final_price = db.apply_coupon(coupon, INITIAL_PRICE)
+    elif await db.verify_coupon(coupon):
+        if await db.claim_coupon_use(user.id):
+            final_price = await db.apply_coupon(coupon, INITIAL_PRICE)
+            if final_price is None:
+                await db.set_user_attribute(user.id, "used-coupon", False)
+                await context.bot.send_message(chat_id=user.id, text="The discount code is not valid")
+                return ConversationHandler.END
+            await db.log_activity(user.id, "used a valid coupon", coupon)
             keyboard = [[InlineKeyboardButton("payment portal", url=PAYMENT_PLANS[key]) for key in list(PAYMENT_PLANS.keys())]]
             code = user_data["code"]
-            db.add_coupon_to_payment_dict(user.id, code, coupon)
-            db.modify_final_price_in_payment_dict(user.id, code, final_price)
+            await db.add_coupon_to_payment_dict(user.id, code, coupon)
+            await db.modify_final_price_in_payment_dict(user.id, code, final_price)
             await context.bot.edit_message_text(chat_id=user.id, 
                                                 message_id=user_data.get("payment-message")["message_id"],
                                                 parse_mode=ParseMode.HTML,
@@ -142,7 +145,7 @@ owner: Nima Ganji
 ✅<b> After payment, register the image of your receipt along with the code {code} in the field of sending the receipt.</b>
 """)
             await context.bot.send_message(chat_id=user.id, text="The discount was applied", parse_mode=ParseMode.HTML,
-                                        reply_to_message_id=db.get_user_attribute(user.id, "payment-msg-id"),
+                                        reply_to_message_id=await db.get_user_attribute(user.id, "payment-msg-id"),
                                         reply_markup=payment_keyboard())
 #             await context.bot.send_message(chat_id=user.id, text=f"""
 # 💢 برای خرید سرویس VIP، می‌توانید از دو روش زیر اقدام کنید.
@@ -168,7 +171,7 @@ owner: Nima Ganji
             return ConversationHandler.END
         else:
             await context.bot.send_message(chat_id=user.id, text="You have already used this discount code.")
-            db.log_activity(user.id, "tried to use a coupon multiple times")
+            await db.log_activity(user.id, "tried to use a coupon multiple times")
     else:
         await context.bot.send_message(chat_id=user.id, text="The discount code is not valid")
         return ConversationHandler.END
@@ -176,13 +179,13 @@ owner: Nima Ganji
 ############ start of payment verification conversation ##################
 async def ask_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    msg_id = db.get_user_attribute(user.id, "payment-msg-id")
+    msg_id = await db.get_user_attribute(user.id, "payment-msg-id")
     if not msg_id:
         await context.bot.send_message(chat_id=user.id, text="Please start the purchase process through the <b>Buy subscription</b> button.",
                                        parse_mode=ParseMode.HTML,
                                        reply_markup=payment_keyboard())
         return ConversationHandler.END
-    db.log_activity(user.id, "chose ersal-e fish")
+    await db.log_activity(user.id, "chose ersal-e fish")
     await context.bot.send_message(chat_id=user.id, text="Please enter the payment code in the message.",
                                    reply_to_message_id=msg_id,
                                    reply_markup=ReplyKeyboardRemove())
@@ -192,23 +195,23 @@ async def ask_ss(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_data = context.user_data
     code = update.message.text
-    payments = db.get_user_attribute(user.id, "payments")
+    payments = await db.get_user_attribute(user.id, "payments")
     all_codes = [payment['code'] for payment in payments]
     if not payments:
         await context.bot.send_message(chat_id=user.id, text="Please make the payment first.")
-        db.log_activity(user.id, "error - tried to verify before starting payment process")
+        await db.log_activity(user.id, "error - tried to verify before starting payment process")
         return ConversationHandler.END
     elif not code or code in MENU_CMDS:
-        db.log_activity(user.id, "error - payment code in menu_cmd list", code)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - payment code in menu_cmd list", code)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif code not in all_codes:
         await context.bot.send_message(chat_id=user.id, text="The entered code is incorrect.")
-        db.log_activity(user.id, "error - payment code not valid", code)
+        await db.log_activity(user.id, "error - payment code not valid", code)
         return ConversationHandler.END
     else:
         await context.bot.send_message(chat_id=user.id, text="Please send the picture of your payment")
-        db.log_activity(user.id, "entered payment code", code)
+        await db.log_activity(user.id, "entered payment code", code)
         user_data["verification-code"] = code
         return HANDLE_SS
     
@@ -218,15 +221,15 @@ async def handle_ss(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ss = update.message.photo
     text = update.message.text
     if text in MENU_CMDS:
-        db.log_activity(user.id, "error - text in menu_cmd list", text)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - text in menu_cmd list", text)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif not ss:
-        db.log_activity(user.id, "error - no image was detected")
+        await db.log_activity(user.id, "error - no image was detected")
         await update.message.reply_text("NO image was recieved. If you want, use the send receipt button again", reply_markup=payment_keyboard())
         return ConversationHandler.END
     elif ss:
-        db.log_activity(user.id, "sent an image")
+        await db.log_activity(user.id, "sent an image")
         message_id = update.message.message_id
         await update.message.reply_text("The image of your receipt was recieved. Please wait for admin's confirm"
                                         ". The result of the review will be announced to you.",
@@ -236,9 +239,9 @@ async def handle_ss(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await context.bot.send_message(chat_id=admin, text=f"""confirm the payment request:
 user: {user.id} 
 username: {user.username}
-phone-number: {db.get_user_attribute(user.id, "phone-number")}
+phone-number: {await db.get_user_attribute(user.id, "phone-number")}
 code: {user_data["verification-code"]}
-final price: {db.get_final_price(user.id, user_data["verification-code"])}
+final price: {await db.get_final_price(user.id, user_data["verification-code"])}
 """ )
                 await context.bot.forward_message(chat_id=admin,
                                               from_chat_id=user.id,
@@ -247,8 +250,8 @@ final price: {db.get_final_price(user.id, user_data["verification-code"])}
                 logger.warning(f"admin {admin} has deleted the bot")
         return ConversationHandler.END
     else:
-        db.log_activity(user.id, "error - no valid input")
-        await update.message.reply_text("The previous operation was cancelled. please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - no valid input")
+        await update.message.reply_text("The previous operation was cancelled. please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
 
 async def verify_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -263,7 +266,7 @@ example:
 /verify 103465015 12345
 """)
         else:
-            db.verify_payment(int(args[0]), args[1])
+            await db.verify_payment(int(args[0]), args[1])
             await context.bot.send_message(chat_id=user.id, text="User's payment was confirmed.")
             await context.bot.send_message(chat_id=int(args[0]), text="Your payment has been successfully verified. Thank you for trusting us.")
 
@@ -272,16 +275,19 @@ async def create_coupon(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user.id in ADMIN_LIST:
         return ApplicationHandlerStop
     args = context.args
-    if not len(args)==2:
+    if not len(args) in [2, 3] or (len(args) == 3 and not args[2].isdecimal()):
         await context.bot.send_message(chat_id=user.id, text="""
 the usage instruction:
-/coupon text value(toman)
+/coupon text value(toman) [max uses]
 e.g the discount code "off-eslami", with the value of 50000 Toman is made like this:
 /coupon off-eslami 50000
+and a code that can be used only 100 times:
+/coupon off-eslami 50000 100
 """)
     else:
-        if db.save_coupon(args[0], args[1]):
-            await context.bot.send_message(chat_id=user.id, text=f"{args[0]} {args[1]} was saved.")
+        max_uses = int(args[2]) if len(args) == 3 else None
+        if await db.save_coupon(args[0], args[1], max_uses):
+            await context.bot.send_message(chat_id=user.id, text=f"{' '.join(args)} was saved.")
         else:
             await context.bot.send_message(chat_id=user.id, text="The code was duplicated")
 
@@ -30,8 +30,8 @@ ADMIN_LIST = db.get_admins()
 # START OF REGISTER CONVERSATION
 async def register(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.log_activity(user.id, "start register", f"{user.id} - username: {user.username}")
-    if db.check_if_user_is_registered(user_id=user.id):
+    await db.log_activity(user.id, "start register", f"{user.id} - username: {user.username}")
+    if await db.check_if_user_is_registered(user_id=user.id):
         await update.message.reply_text(
             "You have already signed up. You can register your gardens using /start "
         )
@@ -43,20 +43,20 @@ async def register(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def ask_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.log_activity(user.id, "entered name", f"{update.message.text}")
+    await db.log_activity(user.id, "entered name", f"{update.message.text}")
     user_data = context.user_data
     # Get the answer to the area question
     if update.message.text in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", update.message.text)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", update.message.text)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     if not update.message.text:
         await update.message.reply_text("Please enter your name and your family name \n /cancel")
-        db.log_activity(user.id, "error - enter name", f"{update.message.text}")
+        await db.log_activity(user.id, "error - enter name", f"{update.message.text}")
         return ASK_PHONE
     name = update.message.text.strip()
     user_data["name"] = name
-    db.set_user_attribute(user_id=user.id, key="name", value=name)
+    await db.set_user_attribute(user_id=user.id, key="name", value=name)
     await update.message.reply_text("Please enter your phone number: \n /cancel")
     return HANDLE_PHONE
 
@@ -66,16 +66,16 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get the answer to the area question
     phone = update.message.text
     if phone in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", phone)
-        await update.message.reply_text("The previous operation was cancelled. Please try again", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", phone)
+        await update.message.reply_text("The previous operation was cancelled. Please try again", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     if not phone or not phone.isdigit() or len(phone) != 11:
-        db.log_activity(user.id, "error - entered phone", phone)
+        await db.log_activity(user.id, "error - entered phone", phone)
         await update.message.reply_text("The number is not valid. Please try again:. \n /cancel")
         return HANDLE_PHONE
-    db.log_activity(user.id, "entered phone", phone)
+    await db.log_activity(user.id, "entered phone", phone)
     user_data["phone"] = phone
-    db.set_user_attribute(user_id=user.id, key="phone-number", value=phone)
+    await db.set_user_attribute(user_id=user.id, key="phone-number", value=phone)
     reply_text = """
 You can register your gardens using <b>('➕ add farm')</b>.
     """
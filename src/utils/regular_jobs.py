@@ -2,17 +2,17 @@ import database
 from .table_generator import table
 from .keyboards import view_advise_keyboard
 import pandas as pd
-import geopandas as gpd
-from shapely import Point
 import datetime
 import jdatetime
 from telegram.constants import ParseMode
 from telegram.error import BadRequest, Forbidden
 from telegram.ext import ContextTypes
-from fiona.errors import DriverError
 from .logger import logger
+from .forecast_store import ForecastNotAvailable, forecast_store, join_farms
 
 db = database.Database()
+# advice files joined with the weather grid in send_todays_data
+ADVICE_KINDS = ["sp", "pre-harvest", "post-harvest"]
 
 message = """
 🟢 Changes:
@@ -46,15 +46,15 @@ admin_list = db.get_admins()
 async def register_reminder(context: ContextTypes.DEFAULT_TYPE):
     user_id = context.job.chat_id
     username = context.job.data
-    if not db.check_if_user_is_registered(user_id):
+    if not await db.check_if_user_is_registered(user_id):
         try:
             await context.bot.send_message(chat_id=user_id, text=message_incomplete_reg)
-            db.log_new_message(user_id=user_id,
+            await db.log_new_message(user_id=user_id,
                                username=username,
                                message=message_incomplete_reg,
                                function="register reminder")
         except Forbidden:
-            db.set_user_attribute(user_id, "blocked", True)
+            await db.set_user_attribute(user_id, "blocked", True)
             logger.info(f"user:{user_id} has blocked the bot!")
         except BadRequest:
             logger.info(f"user:{user_id} chat was not found!")
@@ -63,15 +63,15 @@ async def register_reminder(context: ContextTypes.DEFAULT_TYPE):
 async def no_farm_reminder(context: ContextTypes.DEFAULT_TYPE):
     user_id = context.job.chat_id
     username = context.job.data
-    if db.check_if_user_is_registered(user_id) and not db.get_farms(user_id):
+    if await db.get_menu_state(user_id) == "no-farms":
         try:
             await context.bot.send_message(chat_id=user_id, text=message_no_farms)
-            db.log_new_message(user_id=user_id,
+            await db.log_new_message(user_id=user_id,
                                username=username,
                                message=message_no_farms,
                                function="no farm reminder")
         except Forbidden:
-            db.set_user_attribute(user_id, "blocked", True)
+            await db.set_user_attribute(user_id, "blocked", True)
             logger.info(f"user:{user_id} has blocked the bot!")
         except BadRequest:
             logger.info(f"user:{user_id} chat was not found!")
@@ -80,24 +80,46 @@ async def no_farm_reminder(context: ContextTypes.DEFAULT_TYPE):
 async def no_location_reminder(context: ContextTypes.DEFAULT_TYPE):
     user_id = context.job.chat_id
     username = context.job.data
-    farms = db.get_farms(user_id)
-    if farms:
-        if all([farm[1].get('location')['longitude'] == None for farm in farms.items()]):
-            try:
-                await context.bot.send_message(chat_id=user_id, text=message_no_location)
-                db.log_new_message(user_id=user_id,
-                                   username=username,
-                                   message=message_no_location,
-                                   function="no location reminder")
-            except Forbidden:
-                db.set_user_attribute(user_id, "blocked", True)
-                logger.info(f"user:{user_id} has blocked the bot!")
-            except BadRequest:
-                logger.info(f"user:{user_id} chat was not found!")
+    if await db.get_menu_state(user_id) == "no-location":
+        try:
+            await context.bot.send_message(chat_id=user_id, text=message_no_location)
+            await db.log_new_message(user_id=user_id,
+                               username=username,
+                               message=message_no_location,
+                               function="no location reminder")
+        except Forbidden:
+            await db.set_user_attribute(user_id, "blocked", True)
+            logger.info(f"user:{user_id} has blocked the bot!")
+        except BadRequest:
+            logger.info(f"user:{user_id} chat was not found!")
+
+
+def farm_table(farms: list[dict], villages: pd.DataFrame) -> pd.DataFrame:
+    """One row per farm with its coordinates, for `join_farms`.
+
+    Farms without a location get the coordinates of their village if villages.xlsx has exactly one match for it.
+    """
+    frame = pd.DataFrame({
+        "user_id": [farm["user_id"] for farm in farms],
+        "name": [farm["name"] for farm in farms],
+        "longitude": pd.Series([(farm.get("location") or {}).get("longitude") for farm in farms], dtype=float),
+        "latitude": pd.Series([(farm.get("location") or {}).get("latitude") for farm in farms], dtype=float),
+        "province": [farm.get("province") for farm in farms],
+        "city": [farm.get("city") for farm in farms],
+        "village": [farm.get("village") for farm in farms],
+        "grid": [farm.get("grid") for farm in farms],
+    })
+    keys = ["ProvincNam", "CityName", "NAME"]
+    unique_villages = villages.drop_duplicates(keys, keep=False)[keys + ["X", "Y"]]
+    frame = frame.merge(unique_villages, how="left", left_on=["province", "city", "village"], right_on=keys)
+    from_village = frame["longitude"].isna() & frame["village"].fillna("").astype(bool) & frame["X"].notna()
+    frame.loc[from_village, "longitude"] = frame.loc[from_village, "X"]
+    frame.loc[from_village, "latitude"] = frame.loc[from_village, "Y"]
+    logger.info(f"{int(from_village.sum())} farms were located by their village in villages.xlsx")
+    return frame[["user_id", "name", "longitude", "latitude", "grid"]]
 
 
 async def send_todays_data(context: ContextTypes.DEFAULT_TYPE):
-    ids = db.user_collection.distinct("_id")
     today = datetime.datetime.now().strftime("%Y%m%d")
     day2 = (datetime.datetime.now() + datetime.timedelta(days=1)).strftime("%Y%m%d")
     day3 = (datetime.datetime.now() + datetime.timedelta(days=2)).strftime("%Y%m%d")
@@ -128,66 +150,46 @@ async def send_todays_data(context: ContextTypes.DEFAULT_TYPE):
                 text=f"admin user {admin} has blocked the bot"
             )
     try:
-        # advise_pre_harvest = gpd.read_file(f"data/pesteh{today}_Advise_Bef.geojson")
-        # advise_post_harvest = gpd.read_file(f"data/pesteh{today}_Advise_Aft.geojson")
-        weather_data = gpd.read_file(f"data/Iran{today}_weather.geojson")
-        # advise_data_tomorrow = gpd.read_file(f"data/pesteh{tomorrow}_2.geojson")
-        # advise_data = advise_data.dropna(subset=['Adivse'])
-        for id in ids:
-            farms = db.get_farms(id)
-            if not farms:
-                logger.info(f"user {id} has no farms yet.")
-            else:
-                for farm in farms:
-                    try:
-                        longitude = farms[farm]["location"]["longitude"]
-                        latitude = farms[farm]["location"]["latitude"]
-                        if longitude is None and farms[farm]["village"]:
-                            province = farms[farm]["province"]
-                            city = farms[farm]["city"]
-                            village = farms[farm]["village"]
-                            row = villages.loc[
-                                (villages["ProvincNam"] == province)
-                                & (villages["CityName"] == city)
-                                & (villages["NAME"] == village)
-                                ]
-                            if row.empty:
-                                longitude = None
-                                latitude = None
-                            elif not row.empty and len(row) == 1:
-                                longitude = row["X"]
-                                latitude = row["Y"]
-                                logger.info(
-                                    f"village {village} was found in villages.xlsx, lon:{longitude}, lat: {latitude}")
-                        elif longitude is None:
-                            logger.info(f"\nLocation of farm:{farm} belonging to user:{id} was not found\n")
-                        if latitude is not None and longitude is not None:
-                            logger.info(f"Location of farm:{farm} belonging to user:{id} was found")
-                            # Find the nearest point to the user's lat/long
-                            point = Point(longitude, latitude)
-                            threshold = 0.1  # degrees
-                            idx_min_dist_weather = weather_data.geometry.distance(point).idxmin()
-                            closest_coords_weather = weather_data.geometry.iloc[idx_min_dist_weather].coords[0]
-                            # Send weather prediction to every farm
-                            if point.distance(Point(closest_coords_weather)) <= threshold:
-                                row = weather_data.iloc[idx_min_dist_weather]
-                                tmin_values, tmax_values, rh_values, spd_values, rain_values = [], [], [], [], []
-                                for key, value in row.items():
-                                    if "tmin_Time=" in key:
-                                        tmin_values.append(round(value, 1))
-                                    elif "tmax_Time=" in key:
-                                        tmax_values.append(round(value, 1))
-                                    elif "rh_Time=" in key:
-                                        rh_values.append(round(value, 1))
-                                    elif "spd_Time=" in key:
-                                        spd_values.append(round(value, 1))
-                                    elif "rain_Time=" in key:
-                                        rain_values.append(round(value, 1))
-                                caption = f"""
+        weather_data = await forecast_store.load("weather", today)
+        # The advice grids are resolved in the same join, `{kind}_row` columns with "_" for "-"
+        snapshots = {"weather": weather_data}
+        for kind in ADVICE_KINDS:
+            try:
+                snapshots[kind.replace("-", "_")] = await forecast_store.load(kind, today)
+            except ForecastNotAvailable:
+                logger.info(f"the {kind} advice of {today} isn't available, farms are joined without it")
+        # advise_pre_harvest = snapshots.get("pre_harvest")
+        # advise_post_harvest = snapshots.get("post_harvest")
+        farms = farm_table(await db.get_forecast_farms(), villages)
+        joined = join_farms(farms, snapshots)
+        for kind in snapshots:
+            logger.info(f"{int(joined[f'{kind}_within'].sum())} of {len(joined)} farms are on the {kind} grid")
+        for farm_row in joined.itertuples(index=False):
+            id, farm = farm_row.user_id, farm_row.name
+            longitude, latitude = farm_row.longitude, farm_row.latitude
+            try:
+                if pd.isna(longitude) or pd.isna(latitude):
+                    logger.info(f"\nLocation of farm:{farm} belonging to user:{id} was not found\n")
+                # Send weather prediction to every farm
+                elif farm_row.weather_within:
+                    row = weather_data.table.row(farm_row.weather_row)
+                    tmin_values, tmax_values, rh_values, spd_values, rain_values = [], [], [], [], []
+                    for key, value in row.items():
+                        if "tmin_Time=" in key:
+                            tmin_values.append(round(value, 1))
+                        elif "tmax_Time=" in key:
+                            tmax_values.append(round(value, 1))
+                        elif "rh_Time=" in key:
+                            rh_values.append(round(value, 1))
+                        elif "spd_Time=" in key:
+                            spd_values.append(round(value, 1))
+                        elif "rain_Time=" in key:
+                            rain_values.append(round(value, 1))
+                    caption = f"""
         Dear gardner 
         anticipation of the weather status of your garden named <b>#{farm.replace(" ", "_")}</b> will be like this for the next four days .
         """
-                                weather_report = f"""
+                    weather_report = f"""
         sent amounts
         the weather status of the garden named <{farm}> between {jdate}-{jday4} was as followed:
         the maximum temperature: {tmax_values} centigrade
@@ -196,112 +198,110 @@ async def send_todays_data(context: ContextTypes.DEFAULT_TYPE):
         the wind's speed: {spd_values} kilometre per hour
         the probability of rain : {rain_values} percent
         """
-                                table([jdate, jday2, jday3, jday4], tmin_values, tmax_values, rh_values, spd_values,
-                                      rain_values, "job-table.png")
-                                try:
-                                    with open('job-table.png', 'rb') as image_file:
-                                        await context.bot.send_photo(chat_id=id, photo=image_file, caption=caption,
-                                                                     reply_markup=db.find_start_keyboard(id),
-                                                                     parse_mode=ParseMode.HTML)
-                                    username = db.user_collection.find_one({"_id": id})["username"]
-                                    db.set_user_attribute(id, "blocked", False)
-                                    db.log_new_message(
-                                        user_id=id,
-                                        username=username,
-                                        message=weather_report,
-                                        function="send_weather_report",
-                                    )
-                                    logger.info(f"sent todays's weather info to {id}")
-                                    weather_report_count += 1
-                                    weather_report_receiver_id.append(id)
-                                except Forbidden:
-                                    db.set_user_attribute(id, "blocked", True)
-                                    logger.info(f"user:{id} has blocked the bot!")
-                                except BadRequest:
-                                    logger.info(f"user:{id} chat was not found!")
-                            else:
-                                logger.info(
-                                    f"user's location: ({longitude},{latitude}) | distance in weather file: {point.distance(Point(closest_coords_weather))} > {threshold}"
-                                )
-                            # Define some Conditions before sending advice:
-                    #                         if not farms[farm]["product"]:
-                    #                             continue
-                    #                         if not farms[farm]["product"].startswith("پسته"):
-                    #                             continue
-                    #                         if farms[farm].get("harvest-off"):
-                    #                             advise_post_count += 1
-                    #                             advise_post_receiver_id.append(id)
-                    #                             idx_min_dist_advise = advise_post_harvest.geometry.distance(point).idxmin()
-                    #                             closest_coords_advise = advise_post_harvest.geometry.iloc[idx_min_dist_advise].coords[0]
-                    #                             ps_msg = ""
-                    #                             row = advise_post_harvest.iloc[idx_min_dist_advise]
-                    #                         elif farms[farm].get("harvest-off") == False or farms[farm].get("harvest-off") == None:
-                    #                             advise_pre_count += 1
-                    #                             advise_pre_receiver_id.append(id)
-                    #                             idx_min_dist_advise = advise_pre_harvest.geometry.distance(point).idxmin()
-                    #                             closest_coords_advise = advise_pre_harvest.geometry.iloc[idx_min_dist_advise].coords[0]
-                    #                             ps_msg = "در صورتی که برداشت محصولتان تکمیل شده و تمایل به دریافت روزانه توصیه‌های پس از برداشت دارید از دستور /harvest_off استفاده کرده و باغ خود را انتخاب کنید."
-                    #                             row = advise_pre_harvest.iloc[idx_min_dist_advise]
-                    #                         ################################################
-                    #                         # Send advice to all other farms
-                    #                         if point.distance(Point(closest_coords_advise)) <= threshold:
-
-                    #                             advise_3days = [row[f'Time={today}'], row[f'Time={day2}'], row[f'Time={day3}']]
-                    #                             # advise_3days_no_nan = ["" for text in advise_3days if pd.isna(text)]
-                    #                             # logger.info(f"{advise_3days}\n\n{advise_3days_no_nan}\n----------------------------")
-                    #                             db.set_user_attribute(id, f"farms.{farm}.advise", {"today": advise_3days[0], "day2": advise_3days[1], "day3":advise_3days[2]})
-                    #                             ############### NEW WAY
-                    #                             try:
-                    #                                 if pd.isna(advise_3days[0]):
-                    #                                     advise = f"""
-                    # باغدار عزیز
-                    # توصیه زیر با توجه به وضعیت آب و هوایی باغ شما با نام <b>#{farm.replace(" ", "_")}</b> برای #{advise_tags[0]} مورخ <b>{jdates[0]}</b> ارسال می‌شود:
-
-                    # <pre>توصیه‌ای برای این تاریخ موجود نیست</pre>
-
-                    # <i>می‌توانید با استفاده از دکمه‌های زیر توصیه‌‌های مرتبط با فردا و پس‌فردا را مشاهده کنید.</i>
-
-                    # ----------------------------------------------------
-                    # {ps_msg}
-                    #     """
-                    #                                 else:
-                    #                                     advise = f"""
-                    # باغدار عزیز
-                    # توصیه زیر با توجه به وضعیت آب و هوایی باغ شما با نام <b>#{farm.replace(" ", "_")}</b> برای #{advise_tags[0]} مورخ <b>{jdates[0]}</b> ارسال می‌شود:
-
-                    # <pre>{advise_3days[0]}</pre>
-
-                    # <i>می‌توانید با استفاده از دکمه‌های زیر توصیه‌‌های مرتبط با فردا و پس‌فردا را مشاهده کنید.</i>
-
-                    # ----------------------------------------------------
-                    # {ps_msg}
-                    #     """
-                    #                                 await context.bot.send_message(chat_id=id, text=advise, reply_markup=view_advise_keyboard(farm), parse_mode=ParseMode.HTML)
-                    #                                 username = db.user_collection.find_one({"_id": id})[
-                    #                                     "username"
-                    #                                 ]
-                    #                                 db.log_new_message(
-                    #                                     user_id=id,
-                    #                                     username=username,
-                    #                                     message=advise,
-                    #                                     function="send_advice",
-                    #                                     )
-                    #                                 # advise_count += 1
-                    #                                 # advise_receiver_id.append(id)
-                    #                             except Forbidden:
-                    #                                 db.set_user_attribute(id, "blocked", True)
-                    #                                 logger.info(f"user:{id} has blocked the bot!")
-                    #                             except BadRequest:
-                    #                                 logger.info(f"user:{id} chat was not found!")
-
-                    except KeyError:
-                        for admin in admin_list:
-                            time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-                            await context.bot.send_message(
-                                chat_id=admin, text=f"KeyError caused by user: {id} farm: {farm}"
-                            )
-
-        db.log_sent_messages(weather_report_receiver_id, "send_weather_report")
+                    table([jdate, jday2, jday3, jday4], tmin_values, tmax_values, rh_values, spd_values,
+                          rain_values, "job-table.png")
+                    try:
+                        with open('job-table.png', 'rb') as image_file:
+                            await context.bot.send_photo(chat_id=id, photo=image_file, caption=caption,
+                                                         reply_markup=await db.find_start_keyboard(id),
+                                                         parse_mode=ParseMode.HTML)
+                        username = (await db.get_user_document(id))["username"]
+                        await db.set_user_attribute(id, "blocked", False)
+                        await db.log_new_message(
+                            user_id=id,
+                            username=username,
+                            message=weather_report,
+                            function="send_weather_report",
+                        )
+                        logger.info(f"sent todays's weather info to {id}")
+                        weather_report_count += 1
+                        weather_report_receiver_id.append(id)
+                    except Forbidden:
+                        await db.set_user_attribute(id, "blocked", True)
+                        logger.info(f"user:{id} has blocked the bot!")
+                    except BadRequest:
+                        logger.info(f"user:{id} chat was not found!")
+                else:
+                    logger.info(
+                        f"user's location: ({longitude},{latitude}) | distance in weather file: {farm_row.weather_distance} > {weather_data.index.threshold}"
+                    )
+                # Define some Conditions before sending advice:
+                #                         if not farms[farm]["product"]:
+                #                             continue
+                #                         if not farms[farm]["product"].startswith("پسته"):
+                #                             continue
+                #                         if farms[farm].get("harvest-off"):
+                #                             advise_post_count += 1
+                #                             advise_post_receiver_id.append(id)
+                #                             within, advise_row = farm_row.post_harvest_within, farm_row.post_harvest_row
+                #                             ps_msg = ""
+                #                             row = advise_post_harvest.table.row(advise_row) if within else None
+                #                         elif farms[farm].get("harvest-off") == False or farms[farm].get("harvest-off") == None:
+                #                             advise_pre_count += 1
+                #                             advise_pre_receiver_id.append(id)
+                #                             within, advise_row = farm_row.pre_harvest_within, farm_row.pre_harvest_row
+                #                             ps_msg = "در صورتی که برداشت محصولتان تکمیل شده و تمایل به دریافت روزانه توصیه‌های پس از برداشت دارید از دستور /harvest_off استفاده کرده و باغ خود را انتخاب کنید."
+                #                             row = advise_pre_harvest.table.row(advise_row) if within else None
+                #                         ################################################
+                #                         # Send advice to all other farms
+                #                         if within:
+
+                #                             advise_3days = [row[f'Time={today}'], row[f'Time={day2}'], row[f'Time={day3}']]
+                #                             # advise_3days_no_nan = ["" for text in advise_3days if pd.isna(text)]
+                #                             # logger.info(f"{advise_3days}\n\n{advise_3days_no_nan}\n----------------------------")
+                #                             db.set_user_attribute(id, f"farms.{farm}.advise", {"today": advise_3days[0], "day2": advise_3days[1], "day3":advise_3days[2]})
+                #                             ############### NEW WAY
+                #                             try:
+                #                                 if pd.isna(advise_3days[0]):
+                #                                     advise = f"""
+                # باغدار عزیز
+                # توصیه زیر با توجه به وضعیت آب و هوایی باغ شما با نام <b>#{farm.replace(" ", "_")}</b> برای #{advise_tags[0]} مورخ <b>{jdates[0]}</b> ارسال می‌شود:
+
+                # <pre>توصیه‌ای برای این تاریخ موجود نیست</pre>
+
+                # <i>می‌توانید با استفاده از دکمه‌های زیر توصیه‌‌های مرتبط با فردا و پس‌فردا را مشاهده کنید.</i>
+
+                # ----------------------------------------------------
+                # {ps_msg}
+                #     """
+                #                                 else:
+                #                                     advise = f"""
+                # باغدار عزیز
+                # توصیه زیر با توجه به وضعیت آب و هوایی باغ شما با نام <b>#{farm.replace(" ", "_")}</b> برای #{advise_tags[0]} مورخ <b>{jdates[0]}</b> ارسال می‌شود:
+
+                # <pre>{advise_3days[0]}</pre>
+
+                # <i>می‌توانید با استفاده از دکمه‌های زیر توصیه‌‌های مرتبط با فردا و پس‌فردا را مشاهده کنید.</i>
+
+                # ----------------------------------------------------
+                # {ps_msg}
+                #     """
+                #                                 await context.bot.send_message(chat_id=id, text=advise, reply_markup=view_advise_keyboard(farm), parse_mode=ParseMode.HTML)
+                #                                 username = db.user_collection.find_one({"_id": id})[
+                #                                     "username"
+                #                                 ]
+                #                                 db.log_new_message(
+                #                                     user_id=id,
+                #                                     username=username,
+                #                                     message=advise,
+                #                                     function="send_advice",
+                #                                     )
+                #                                 # advise_count += 1
+                #                                 # advise_receiver_id.append(id)
+                #                             except Forbidden:
+                #                                 db.set_user_attribute(id, "blocked", True)
+                #                                 logger.info(f"user:{id} has blocked the bot!")
+                #                             except BadRequest:
+                #                                 logger.info(f"user:{id} chat was not found!")
+
+            except KeyError:
+                for admin in admin_list:
+                    time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+                    await context.bot.send_message(
+                        chat_id=admin, text=f"KeyError caused by user: {id} farm: {farm}"
+                    )
+
+        await db.log_sent_messages(weather_report_receiver_id, "send_weather_report")
         logger.info(f"sent weather report to {weather_report_count} people")
 
         # db.log_sent_messages(advise_post_receiver_id, "send_post_harvest_advice_to_users")
@@ -330,7 +330,7 @@ async def send_todays_data(context: ContextTypes.DEFAULT_TYPE):
 
             except BadRequest or Forbidden:
                 logger.warning(f"admin {admin} has deleted the bot")
-    except DriverError:
+    except ForecastNotAvailable:
         for admin in admin_list:
             time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
             await context.bot.send_message(
@@ -349,9 +349,25 @@ async def send_up_notice(context: ContextTypes.DEFAULT_TYPE):
 
 
 async def get_member_count(context: ContextTypes.DEFAULT_TYPE):
-    members = db.number_of_members()
-    blockde_members = db.number_of_blocks()
-    member_count = members - blockde_members
-    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    stats = await db.refresh_stats()
+    member_count = stats["members"] - stats["blocked"]
+    current_time = datetime.datetime.now()
     logger.info(f"Performed member count: {member_count}")
-    db.log_member_changes(members=member_count, time=current_time)
+    await db.log_member_changes(members=member_count, time=current_time)
+
+
+async def refresh_segments(context: ContextTypes.DEFAULT_TYPE):
+    corrected = await db.refresh_segments()
+    logger.info(f"Refreshed /send segments, {corrected} users were corrected")
+
+
+async def check_indexes(context: ContextTypes.DEFAULT_TYPE):
+    await db.check_indexes(unused_after=database.INDEX_STATS_MIN_AGE)
+
+
+async def refresh_forecasts(context: ContextTypes.DEFAULT_TYPE):
+    known_grids = set(forecast_store.grids())
+    await forecast_store.refresh()
+    if set(forecast_store.grids()) - known_grids:
+        updated = await db.refresh_grid_cells()
+        logger.info(f"A new forecast grid was loaded, resolved the grid cells of {updated} farms")
@@ -68,15 +68,15 @@ async def ask_farm_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("The operation was cancelled!")
         return ConversationHandler.END
     elif target_id in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", target_id)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", target_id)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif not target_id:
         await update.message.reply_text(
              "Please write the desired user ID or press /cancel :",
         )
         return ASK_FARM_NAME
-    elif len(target_id.split('\n'))==1 and not db.check_if_user_exists(int(target_id)):
+    elif len(target_id.split('\n'))==1 and not await db.check_if_user_exists(int(target_id)):
         await update.message.reply_text("This user does not exist in the database. Please try again. \n/cancel")
         return ASK_FARM_NAME
     user_data["target"] = target_id.split("\n")
@@ -95,7 +95,7 @@ async def ask_longitude(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     farm_name = update.message.text
     if len(farm_name.split("\n"))==1:
-        farm_names = list(db.get_farms(int(user_data['target'][0])))
+        farm_names = list(await db.get_farms(int(user_data['target'][0])))
         if farm_name not in farm_names:
             await update.message.reply_text(f"The garden's name is wrong. Try again. \n/cancel")
             return ASK_LONGITUDE
@@ -107,15 +107,15 @@ async def ask_longitude(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("The operation was cancelled!")
         return ConversationHandler.END
     elif farm_name in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", farm_name)
-        await update.message.reply_text("The previous operation was cancelled. Pease try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", farm_name)
+        await update.message.reply_text("The previous operation was cancelled. Pease try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif not farm_name:
         await update.message.reply_text(f"What is the garden's name? \n/cancel")
         return ASK_LONGITUDE
     elif len(user_data['target']) != len(farm_name.split('\n')):
-        db.log_activity(user.id, "error - farm_name list not equal to IDs", farm_name)
-        await update.message.reply_text("The number of id's and the name of the gardens are not the same. Please start again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - farm_name list not equal to IDs", farm_name)
+        await update.message.reply_text("The number of id's and the name of the gardens are not the same. Please start again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     user_data["farm_name"] = farm_name.split('\n')
     await update.message.reply_text("""
@@ -135,8 +135,8 @@ async def ask_latitude(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("The operation was cancelled!")
         return ConversationHandler.END
     elif longitude in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", longitude)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", longitude)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif not longitude:
         await update.message.reply_text("""
@@ -155,27 +155,32 @@ https://goo.gl/maps/3Nx2zh3pevaz9vf16
     else:
         links = longitude.split("\n")
         if len(user_data['target']) != len(links):
-            db.log_activity(user.id, "error - links list not equal to IDs", farm_name)
-            await update.message.reply_text("The number of links and ids are not the same. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+            await db.log_activity(user.id, "error - links list not equal to IDs", farm_name)
+            await update.message.reply_text("The number of links and ids are not the same. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
             return ConversationHandler.END
         elif not all(link.startswith("https://goo.gl") for link in links):
-            db.log_activity(user.id, "error - links not valid", farm_name)
-            await update.message.reply_text("The links are not acceptable. Please start again.", reply_markup=db.find_start_keyboard(user.id))
+            await db.log_activity(user.id, "error - links not valid", farm_name)
+            await update.message.reply_text("The links are not acceptable. Please start again.", reply_markup=await db.find_start_keyboard(user.id))
             return ConversationHandler.END
         with requests.session() as s:
             final_url = [s.head(link, allow_redirects=True).url for link in links]
         result = [re.search("/@-?(\d+\.\d+),(\d+\.\d+)", url) for url in final_url]
+        missing = await db.update_farms([
+            (int(user_id), user_data['farm_name'][i], {"location.latitude": float(result[i].group(1)),
+                                                       "location.longitude": float(result[i].group(2))})
+            for i, user_id in enumerate(user_data['target'])
+        ])
         for i, user_id in enumerate(user_data['target']):
             try:
-                db.set_user_attribute(int(user_id), f"farms.{user_data['farm_name'][i]}.location.latitude", float(result[i].group(1)))
-                db.set_user_attribute(int(user_id), f"farms.{user_data['farm_name'][i]}.location.longitude", float(result[i].group(2)))
+                if (int(user_id), user_data['farm_name'][i]) in missing:
+                    raise KeyError(user_data['farm_name'][i])
                 await context.bot.send_message(chat_id=int(user_id), text=f"The location of your garden named{user_data['farm_name'][i]} is registered.")
                 await context.bot.send_location(chat_id=int(user_id), latitude=float(result[i].group(1)), longitude=float(result[i].group(2)))
                 await context.bot.send_message(chat_id=user.id, text=f"The location of the garden{user_id} named {user_data['farm_name'][i]} is registered.")
                 await context.bot.send_location(chat_id=user.id, latitude=float(result[i].group(1)), longitude=float(result[i].group(2)))
             except Forbidden:
                 await context.bot.send_message(chat_id=user.id, text=f"{user_id} blocked the bot")
-                db.set_user_attribute(user_id, "blocked", True)
+                await db.set_user_attribute(user_id, "blocked", True)
             except BadRequest:
                 await context.bot.send_message(chat_id=user.id, text=f"chat with {user_id} not found. was the user id correct?")
             except KeyError:
@@ -190,8 +195,8 @@ async def handle_lat_long(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("The operation was cancelled!")
         return ConversationHandler.END
     elif latitude in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", latitude)
-        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", latitude)
+        await update.message.reply_text("The previous operation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     elif not latitude:
         await update.message.reply_text(f"what's the latitude of {latitude}? \ndo you want to /cancel ?")
@@ -200,10 +205,14 @@ async def handle_lat_long(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("\n\n <b>The value of the entered Latitude is not acceptable. The geographic length and width should be integer or decimal. Please try again.</b> \n\n", parse_mode=ParseMode.HTML)
         return HANDLE_LAT_LONG
     user_data["lat"] = latitude
-    db.set_user_attribute(int(user_data["target"][0]), f"farms.{user_data['farm_name']}.location.longitude", float(user_data["long"]))
-    db.set_user_attribute(int(user_data["target"][0]), f"farms.{user_data['farm_name']}.location.latitude", float(user_data["lat"]))
-    db.set_user_attribute(int(user_data["target"][0]), f"farms.{user_data['farm_name']}.link-status", "Verified")
-    db.log_activity(user.id, "set a user's location", user_data["target"][0])
+    if not await db.update_farm(int(user_data["target"][0]), user_data['farm_name'], {
+        "location.longitude": float(user_data["long"]),
+        "location.latitude": float(user_data["lat"]),
+        "link-status": "Verified",
+    }):
+        await update.message.reply_text(f"{user_data['target'][0]} doesn't have a farm called {user_data['farm_name']}.")
+        return ConversationHandler.END
+    await db.log_activity(user.id, "set a user's location", user_data["target"][0])
     for admin in ADMIN_LIST:
         await context.bot.send_message(chat_id=admin, text=f"Location of farm {user_data['farm_name']} belonging to {user_data['target'][0]} was set")
         await context.bot.send_location(chat_id=admin, latitude=float(user_data["lat"]), longitude=float(user_data["long"]))
@@ -211,7 +220,7 @@ async def handle_lat_long(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await context.bot.send_message(chat_id=int(user_data["target"][0]), text=f"The location of your garden named {user_data['farm_name']} was registered.")
         await context.bot.send_location(chat_id=int(user_data["target"][0]), latitude=float(user_data["lat"]), longitude=float(user_data["long"]))
     except (BadRequest, Forbidden):
-        db.set_user_attribute(int(user_data["target"][0]), "blocked", True)
+        await db.set_user_attribute(int(user_data["target"][0]), "blocked", True)
         await context.bot.send_message(chat_id=user.id, text=f"Location wasn't set. User may have blocked the bot.")
     return ConversationHandler.END
 
@@ -90,12 +90,12 @@ async def check_status(context: ContextTypes.DEFAULT_TYPE):
             await context.bot.send_message(chat_id=103465015, text=text)
             raise ValueError("Unknown sms status code")
     else:
-        db.log_sms_message(user_id=user_id, msg=msg, msg_code=msg_code)
+        await db.log_sms_message(user_id=user_id, msg=msg, msg_code=msg_code)
 
 
 async def sms_no_farm(context: ContextTypes.DEFAULT_TYPE):
     user_id = context.job.chat_id
-    user_doc = db.user_collection.find_one({"_id": user_id})
+    user_doc = await db.get_user_document(user_id)
     name = user_doc.get("name", "کاربر")
     phone_num = user_doc.get("phone-number")
     msg = f"""
@@ -105,7 +105,7 @@ Contact us: 02164063410
 Need guidance 22
 Cancel 11
 """
-    if db.check_if_user_is_registered(user_id) and not db.get_farms(user_id):
+    if await db.check_if_user_is_registered(user_id) and not await db.get_farms(user_id):
         if phone_num:
             res = await send_sms_method(text=msg, receiver=phone_num)
             data = {
@@ -127,7 +127,7 @@ async def sms_incomplete_farm(context: ContextTypes.DEFAULT_TYPE):
     user_id = context.job.chat_id
     data = context.job.data
     timestamp_add_farm = data.get("timestamp")
-    user_doc = db.user_collection.find_one({"_id": user_id})
+    user_doc = await db.get_user_document(user_id)
     name = user_doc.get("name", "کاربر")
     phone_num = user_doc.get("phone-number")
     msg_from_status_check = data.get("msg")
@@ -147,8 +147,8 @@ Cancel 11
 
     """
     if phone_num:
-        if not db.check_if_user_has_farms_with_location(user_id=user_id, user_document=user_doc):
-            if not db.check_if_user_activity_exsits(user_id=user_id, activity="entered area", gte=timestamp_add_farm):
+        if not await db.check_if_user_has_farms_with_location(user_id=user_id, user_document=user_doc):
+            if not await db.check_if_user_activity_exsits(user_id=user_id, activity="entered area", gte=timestamp_add_farm):
                 if not msg_from_status_check:
                     msg = msg_before_location
                     msg_code = 2
@@ -45,20 +45,20 @@ db = database.Database()
 # START OF VIEW CONVERSATION
 async def view_farm_keyboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.log_activity(user.id, "chose view farms")
-    user_farms = db.get_farms(user.id)
+    await db.log_activity(user.id, "chose view farms")
+    user_farms = await db.get_farms(user.id)
     if user_farms:
         await context.bot.send_message(
             chat_id=user.id,
             text="Choose one of your farms",
-            reply_markup=farms_list_reply(db, user.id),
+            reply_markup=await farms_list_reply(db, user.id),
         )
         return VIEW_FARM
     else:
         await context.bot.send_message(
             chat_id=user.id,
             text="You have not registered any garden yet",
-            reply_markup=db.find_start_keyboard(user.id),
+            reply_markup=await db.find_start_keyboard(user.id),
         )
         return ConversationHandler.END
 
@@ -66,24 +66,24 @@ async def view_farm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     farm = update.message.text
     # farm = f"view{farm}"
     user = update.effective_user
-    user_farms = db.get_farms(user.id)
-    user_farms_names = list(db.get_farms(user.id).keys())
+    user_farms = await db.get_farms(user.id)
+    user_farms_names = list((await db.get_farms(user.id)).keys())
     if farm in MENU_CMDS:
-        db.log_activity(user.id, "error - answer in menu_cmd list", farm)
-        await update.message.reply_text("The previous opeation was cancelled. Please try again.", reply_markup=db.find_start_keyboard(user.id))
+        await db.log_activity(user.id, "error - answer in menu_cmd list", farm)
+        await update.message.reply_text("The previous opeation was cancelled. Please try again.", reply_markup=await db.find_start_keyboard(user.id))
         return ConversationHandler.END
     if farm not in user_farms_names and farm != "↩️ back":
-        db.log_activity(user.id, "error - chose wrong farm to view", farm)
+        await db.log_activity(user.id, "error - chose wrong farm to view", farm)
         await context.bot.send_message(
             chat_id=user.id,
             text="Choose one of your farms",
-            reply_markup=farms_list_reply(db, user.id),
+            reply_markup=await farms_list_reply(db, user.id),
         )
         return VIEW_FARM
     if farm == "↩️ back":
-        db.log_activity(user.id, "back")
+        await db.log_activity(user.id, "back")
         await context.bot.send_message(
-            chat_id=user.id, text="The operation was cancelled!", reply_markup=db.find_start_keyboard(user.id)
+            chat_id=user.id, text="The operation was cancelled!", reply_markup=await db.find_start_keyboard(user.id)
         )
         return ConversationHandler.END
     if not user_farms[farm].get("location") == {}:
@@ -106,16 +106,16 @@ the chosen address ⬇️
                 chat_id=user.id,
                 latitude=latitude,
                 longitude=longitude,
-                reply_markup=farms_list_reply(db, user.id),
+                reply_markup=await farms_list_reply(db, user.id),
             )
         else:
             await context.bot.send_message(
                 chat_id=user.id,
                 text=f"Unfortunately the location of <{farm}> has not been registered. "
                 "You can register your location using the 'edit farm' option.",
-                reply_markup=farms_list_reply(db, user.id),
+                reply_markup=await farms_list_reply(db, user.id),
             )
-        db.log_activity(user.id, "viewed a farm", farm)
+        await db.log_activity(user.id, "viewed a farm", farm)
     except KeyError:
         logger.info(f"key {farm} doesn't exist.")
         return ConversationHandler.END
@@ -0,0 +1,126 @@
+"""Fixtures that run `Database` against mongomock_motor.
+
+mongomock doesn't publish command events, so each collection call is reported to
+`database.command_monitor` the way pymongo's listener would. `round_trip_budget` and the
+per-handler stats then work in tests as they do against a server.
+
+Needs pytest and mongomock-motor on top of the bot's dependencies, run `python -m pytest` from the repository root.
+"""
+import asyncio
+import inspect
+import itertools
+import os
+import types
+from contextvars import ContextVar
+
+import mongomock
+import pytest
+from mongomock_motor import AsyncMongoMockClient, AsyncMongoMockCollection
+
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost")
+
+import database  # noqa: E402
+from utils.activity_buffer import ActivityBuffer  # noqa: E402
+
+# mongomock method -> the command a driver sends for it
+COMMANDS = {
+    "find": "find",
+    "find_one": "find",
+    "find_one_and_update": "findAndModify",
+    "find_one_and_replace": "findAndModify",
+    "find_one_and_delete": "findAndModify",
+    "insert_one": "insert",
+    "insert_many": "insert",
+    "update_one": "update",
+    "update_many": "update",
+    "replace_one": "update",
+    "delete_one": "delete",
+    "delete_many": "delete",
+    "bulk_write": "update",
+    "aggregate": "aggregate",
+    "count_documents": "aggregate",
+    "distinct": "distinct",
+}
+_in_command = ContextVar("in_command", default=False)
+_request_ids = itertools.count()
+
+
+def _publishing(method, command_name: str):
+    """Reports one command per outermost call, mongomock calls its own public methods internally."""
+    def wrapper(self, *args, **kwargs):
+        if _in_command.get():
+            return method(self, *args, **kwargs)
+        event = types.SimpleNamespace(command={command_name: self.name}, command_name=command_name,
+                                      database_name=self.database.name, connection_id=("mongomock", 0),
+                                      request_id=next(_request_ids), duration_micros=0)
+        database.command_monitor.started(event)
+        token = _in_command.set(True)
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _in_command.reset(token)
+            database.command_monitor.succeeded(event)
+    return wrapper
+
+
+def _bulk_write(self, requests, ordered=True, **kwargs):
+    """mongomock's bulk_write can't take the operations of newer pymongo releases, they're applied one by one."""
+    matched = modified = upserted = inserted = deleted = 0
+    for request in requests:
+        name = type(request).__name__
+        if name == "InsertOne":
+            self.insert_one(request._doc)
+            inserted += 1
+        elif name in ("UpdateOne", "UpdateMany", "ReplaceOne"):
+            method = {"UpdateOne": self.update_one, "UpdateMany": self.update_many, "ReplaceOne": self.replace_one}[name]
+            result = method(request._filter, request._doc, upsert=request._upsert)
+            matched += result.matched_count
+            modified += result.modified_count
+            upserted += result.upserted_id is not None
+        elif name in ("DeleteOne", "DeleteMany"):
+            method = self.delete_one if name == "DeleteOne" else self.delete_many
+            deleted += method(request._filter).deleted_count
+    return types.SimpleNamespace(matched_count=matched, modified_count=modified, upserted_count=upserted,
+                                 inserted_count=inserted, deleted_count=deleted)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def mongomock_commands():
+    patch = pytest.MonkeyPatch()
+    patch.setattr(mongomock.collection.Collection, "bulk_write", _bulk_write)
+    for method, command_name in COMMANDS.items():
+        patch.setattr(mongomock.collection.Collection, method,
+                      _publishing(getattr(mongomock.collection.Collection, method), command_name))
+    yield
+    patch.undo()
+
+
+@pytest.fixture
+def interleaved(monkeypatch):
+    """Makes every collection call yield to the event loop first, like a round trip to a server would.
+
+    mongomock_motor runs the calls synchronously, so concurrent handlers never interleave without it.
+    """
+    def yielding(method):
+        async def wrapper(*args, **kwargs):
+            await asyncio.sleep(0)
+            return await method(*args, **kwargs)
+        return wrapper
+
+    for name in COMMANDS:
+        method = getattr(AsyncMongoMockCollection, name, None)
+        if inspect.iscoroutinefunction(method):
+            monkeypatch.setattr(AsyncMongoMockCollection, name, yielding(method))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """A Database on an empty in-memory client, with a fresh activity buffer and coupon cache."""
+    monkeypatch.setattr(database, "activity_buffer", ActivityBuffer())
+    monkeypatch.setattr(database, "_coupon_cache", {})
+    return database.Database(AsyncMongoMockClient())
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+import database
+from utils.activity_buffer import ActivityBuffer
+
+pytestmark = pytest.mark.anyio
+
+
+def _event(user_id: int, activity: str = "start") -> dict:
+    return {"userID": user_id, "user_activity": activity, "value": "", "username": f"user{user_id}",
+            "timestamp": datetime(2023, 7, 1, 10), "type": "activity logs"}
+
+
+async def test_flush_hands_the_pending_events_to_write():
+    buffer = ActivityBuffer(batch_size=2)
+    written = []
+
+    async def write(batch):
+        written.extend(batch)
+        return len(batch)
+
+    buffer.add(_event(1))
+    assert not buffer.should_flush()
+    buffer.add(_event(2))
+    assert buffer.should_flush()
+    assert await buffer.flush(write) == 2
+    assert [event["userID"] for event in written] == [1, 2]
+    assert buffer.pending == [] and buffer.flushed == 2 and buffer.dropped == 0
+    assert await buffer.flush(write) == 0
+
+
+async def test_failed_flush_requeues_up_to_max_pending():
+    buffer = ActivityBuffer(max_pending=3)
+
+    async def failing(batch):
+        buffer.add(_event(9))  # logged while the write was in flight
+        raise ConnectionError("mongod is down")
+
+    for user_id in (1, 2, 3):
+        buffer.add(_event(user_id))
+    assert not buffer.add(_event(4))
+    assert await buffer.flush(failing) == 0
+    # the batch goes back in front of the event logged meanwhile, one of them doesn't fit
+    assert [event["userID"] for event in buffer.pending] == [1, 2, 9]
+    assert buffer.dropped == 2
+    assert buffer.writing == []
+
+
+async def test_rejected_events_are_counted_as_dropped():
+    buffer = ActivityBuffer()
+    for user_id in (1, 2, 3):
+        buffer.add(_event(user_id))
+
+    async def partial(batch):
+        return len(batch) - 1
+
+    assert await buffer.flush(partial) == 2
+    assert buffer.flushed == 2 and buffer.dropped == 1
+
+
+async def test_rejected_buckets_are_logged_and_the_rest_written(db, monkeypatch):
+    error = BulkWriteError({"writeErrors": [
+        {"index": 0, "code": 11000, "errmsg": "E11000 duplicate key", "op": {"u": {"$inc": {"count": 2}}}},
+    ]})
+
+    async def rejecting(events):
+        raise error
+
+    monkeypatch.setattr(db, "_write_activity_buckets", rejecting)
+    for event in (_event(1), _event(1, "start register"), _event(2)):
+        database.activity_buffer.add(event)
+    assert await db.flush_activity_logs() == 1
+    assert database.activity_buffer.dropped == 2
+
+
+async def test_activity_lookups_see_buffered_events(db):
+    await db.add_new_user(1, "user1")
+    await db.log_activity(1, "request weather")
+    since = datetime.now() - timedelta(minutes=1)
+    assert await db.check_if_user_activity_exsits(1, "request weather", since)
+    assert not await db.check_if_user_activity_exsits(1, "start register", since)
+    assert await db.flush_activity_logs() == 1
+    assert await db.check_if_user_activity_exsits(1, "request weather", since)
+    bucket = await db.activity_collection.find_one({"userID": 1})
+    assert bucket["count"] == 1 and bucket["events"][0]["user_activity"] == "request weather"
@@ -0,0 +1,78 @@
+import asyncio
+import types
+
+import pytest
+from telegram.ext import ConversationHandler
+
+from utils import payment_funcs
+
+pytestmark = pytest.mark.anyio
+
+
+class Bot:
+    def __init__(self) -> None:
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+
+    async def edit_message_text(self, chat_id, text, **kwargs):
+        self.sent.append("payment message edited")
+
+
+def _coupon_message(user_id: int, coupon: str, bot: Bot):
+    update = types.SimpleNamespace(effective_user=types.SimpleNamespace(id=user_id, username=f"user{user_id}"),
+                                   message=types.SimpleNamespace(text=coupon))
+    context = types.SimpleNamespace(bot=bot, user_data={"code": "pay-1", "payment-message": {"message_id": 1}})
+    return update, context
+
+
+async def test_single_use_coupon_is_redeemed_once(db, interleaved):
+    assert await db.save_coupon("ONCE", 100000, max_uses=1)
+    prices = await asyncio.gather(*[db.apply_coupon("ONCE", 499000) for _ in range(5)])
+    assert sorted(prices, key=lambda price: price is None) == [399000] + [None] * 4
+    assert not await db.verify_coupon("ONCE")
+
+
+async def test_claim_coupon_use_once_per_user(db, interleaved):
+    await db.add_new_user(1, "user1")
+    claims = await asyncio.gather(*[db.claim_coupon_use(1) for _ in range(5)])
+    assert claims.count(True) == 1
+    assert await db.get_user_attribute(1, "used-coupon")
+
+
+async def test_saving_a_coupon_invalidates_the_cached_miss(db):
+    await db.ensure_indexes()
+    assert not await db.verify_coupon("NEW")
+    assert await db.save_coupon("NEW", 1000)
+    assert await db.verify_coupon("NEW")
+    assert not await db.save_coupon("NEW", 2000)
+
+
+async def test_concurrent_coupon_messages_apply_one_discount(db, interleaved, monkeypatch):
+    monkeypatch.setattr(payment_funcs, "db", db)
+    await db.add_new_user(1, "user1")
+    await db.log_payment(1, code="pay-1")
+    await db.save_coupon("SUMMER", 100000)
+    bot = Bot()
+    await asyncio.gather(*[payment_funcs.handle_coupon(*_coupon_message(1, "SUMMER", bot)) for _ in range(3)])
+    assert (await db.coupon_collection.find_one({"code": "SUMMER"}))["uses"] == 1
+    assert bot.sent.count("The discount was applied") == 1
+    assert bot.sent.count("You have already used this discount code.") == 2
+    assert await db.get_final_price(1, "pay-1") == 399000
+
+
+async def test_used_up_coupon_releases_the_claim(db, monkeypatch):
+    monkeypatch.setattr(payment_funcs, "db", db)
+    await db.add_new_user(1, "user1")
+    await db.add_new_user(2, "user2")
+    await db.save_coupon("ONCE", 100000, max_uses=1)
+    assert await db.verify_coupon("ONCE")  # cached as usable
+    await db.apply_coupon("ONCE", 499000)
+    # the cache was cleared by the write, bypass it like a concurrent redemption would
+    monkeypatch.setattr(db, "verify_coupon", lambda coupon: asyncio.sleep(0, True))
+    bot = Bot()
+    state = await payment_funcs.handle_coupon(*_coupon_message(2, "ONCE", bot))
+    assert state == ConversationHandler.END
+    assert bot.sent == ["The discount code is not valid"]
+    assert not await db.get_user_attribute(2, "used-coupon")
@@ -0,0 +1,35 @@
+import pytest
+
+import database
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_update_farms_writes_derived_fields(db, monkeypatch):
+    await db.add_new_user(1, "user1")
+    await db.add_new_farm(1, "a", {"product": "گندم", "location": {"latitude": None, "longitude": None}})
+    await db.add_new_farm(1, "b", {"product": "گندم", "location": {"latitude": None, "longitude": None}})
+    stale_farm_fields = database._stale_farm_fields
+    calls = []
+    monkeypatch.setattr(database, "_stale_farm_fields", lambda farm: calls.append(farm["name"]) or stale_farm_fields(farm))
+    missing = await db.update_farms([
+        (1, "a", {"location": {"latitude": 30.0, "longitude": 56.0}}),
+        (1, "b", {"product": "پسته اکبری"}),
+        (1, "nope", {"area": 1}),
+    ])
+    assert missing == [(1, "nope")]
+    assert sorted(calls) == ["a", "b"]
+    farm = await db.farm_collection.find_one({"name": "a"})
+    assert farm["located"] and farm["geo"] == {"type": "Point", "coordinates": [56.0, 30.0]}
+    user = await db.get_user_document(1)
+    assert {"pesteh-farmers", "with-location"} <= set(user["segments"])
+
+
+async def test_update_farm_of_one_coordinate(db):
+    await db.add_new_user(1, "user1")
+    await db.add_new_farm(1, "a", {"location": {"latitude": 30.0, "longitude": 56.0}})
+    assert await db.update_farm(1, "a", {"location.latitude": 31.0})
+    farm = await db.farm_collection.find_one({"name": "a"})
+    assert farm["geo"]["coordinates"] == [56.0, 31.0]
+    assert farm["grid"]["location"] == [56.0, 31.0]
+    assert not await db.update_farm(1, "nope", {"area": 1})
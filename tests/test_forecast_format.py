@@ -0,0 +1,54 @@
+import os
+
+import geopandas as gpd
+import numpy as np
+import pytest
+
+from utils.forecast_format import columnar_path, ingest, read_table, table_from_frame, version, write_table
+
+
+@pytest.fixture
+def frame():
+    return gpd.GeoDataFrame({
+        "tmin_Time=20230701": [12.5, 14.0, np.nan],
+        "Time=20230701": ["irrigate", None, "irrigate"],
+        "Time=20230702": ["spray", "wait", None],
+    }, geometry=gpd.points_from_xy([50.0, 50.1, 50.2], [30.0, 30.1, 30.2]), crs="EPSG:4326")
+
+
+def test_write_read_round_trip(frame, tmp_path):
+    path = str(tmp_path / "Iran20230701_weather.columns")
+    write_table(table_from_frame(frame), path)
+    table = read_table(path)
+    assert len(table) == 3
+    assert table.numeric == ["tmin_Time=20230701"] and table.text == ["Time=20230701", "Time=20230702"]
+    assert table.longitudes.tolist() == pytest.approx([50.0, 50.1, 50.2])
+    assert table.column("Time=20230701").tolist() == ["irrigate", None, "irrigate"]
+    row = table.row(1)
+    assert row["tmin_Time=20230701"] == 14.0
+    assert row["Time=20230701"] is None and row["Time=20230702"] == "wait"
+    assert np.isnan(table.row(2)["tmin_Time=20230701"])
+    assert not table.values.flags.writeable
+
+
+def test_rewrite_replaces_the_table(frame, tmp_path):
+    path = str(tmp_path / "table.columns")
+    write_table(table_from_frame(frame), path)
+    old = read_table(path)
+    write_table(table_from_frame(frame.iloc[:1]), path)
+    assert len(read_table(path)) == 1
+    assert len(old) == 3  # tables already loaded keep their memory maps
+    assert sorted(os.listdir(tmp_path)) == ["table.columns"]
+
+
+def test_ingest_only_converts_new_drops(frame, tmp_path):
+    source = str(tmp_path / "Iran20230701_weather.geojson")
+    frame.to_file(source, driver="GeoJSON")
+    assert version(columnar_path(source)) is None
+    path = ingest(source)
+    converted = version(path)
+    assert path == columnar_path(source) and converted is not None
+    assert ingest(source) == path and version(path) == converted
+    os.utime(source, ns=(converted + 10**9, converted + 10**9))
+    ingest(source)
+    assert version(path) > converted
@@ -0,0 +1,95 @@
+import datetime
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.forecast_format import ForecastTable
+from utils.forecast_store import ForecastNotAvailable, ForecastSnapshot, ForecastStore, join_farms
+from utils.grid_index import GridIndex
+
+
+def _snapshot(kind: str, longitudes, latitudes) -> ForecastSnapshot:
+    coords = np.column_stack([longitudes, latitudes]).astype(np.float32)
+    values = np.arange(len(coords), dtype=np.float32).reshape(-1, 1)
+    table = ForecastTable(coords, values, np.empty((len(coords), 0), dtype=np.int32), ["tmin_Time=1"], [], [])
+    return ForecastSnapshot(kind, "20230701", f"{kind}.columns", 0, table, GridIndex(table.longitudes, table.latitudes))
+
+
+def _farms(rows: list[tuple]) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=["longitude", "latitude", "grid"])
+
+
+@pytest.fixture
+def weather():
+    return _snapshot("weather", [50.0, 51.0, 52.0], [30.0, 30.0, 30.0])
+
+
+def test_current_stored_cells_are_used(weather):
+    grid_id = weather.index.grid_id
+    # the stored cell wins even if a search would find another row
+    farms = _farms([(50.0, 30.0, {"location": [50.0, 30.0], "cells": {grid_id: {"row": 2, "distance": 0.05}}}),
+                    (51.0, 30.0, {"location": [51.0, 30.0], "cells": {grid_id: {"row": None, "distance": 0.5}}})])
+    joined = join_farms(farms, {"weather": weather})
+    assert joined["weather_row"].tolist() == [2, -1]
+    assert joined["weather_distance"].tolist() == [0.05, 0.5]
+    assert joined["weather_within"].tolist() == [True, False]
+
+
+def test_moved_unstored_and_village_farms_are_searched(weather):
+    grid_id = weather.index.grid_id
+    farms = _farms([
+        (51.0, 30.0, {"location": [50.0, 30.0], "cells": {grid_id: {"row": 0, "distance": 0.0}}}),  # moved
+        (52.0, 30.05, {"location": [52.0, 30.05], "cells": {"other-grid": {"row": 0, "distance": 0.0}}}),
+        (50.0, 30.0, None),  # located by its village
+        (np.nan, np.nan, None),
+        (55.0, 30.0, None),  # beyond the threshold
+    ])
+    joined = join_farms(farms, {"weather": weather})
+    assert joined["weather_row"].tolist() == [1, 2, 0, -1, -1]
+    assert joined["weather_within"].tolist() == [True, True, True, False, False]
+    assert joined["weather_distance"].iloc[3] == np.inf
+    assert joined["weather_distance"].iloc[4] == pytest.approx(3.0)
+
+
+def test_snapshots_on_one_grid_are_searched_once(weather, monkeypatch):
+    advice = _snapshot("pre-harvest", [50.0, 51.0, 52.0], [30.0, 30.0, 30.0])
+    other = _snapshot("sp", [50.5], [30.0])
+    calls = []
+    for snapshot in (weather, advice, other):
+        search = snapshot.index.nearest_many
+        monkeypatch.setattr(snapshot.index, "nearest_many",
+                            lambda *args, _search=search: calls.append(1) or _search(*args))
+    joined = join_farms(_farms([(50.0, 30.0, None), (50.52, 30.0, None)]),
+                        {"weather": weather, "pre_harvest": advice, "sp": other})
+    assert len(calls) == 2
+    assert joined["pre_harvest_row"].tolist() == joined["weather_row"].tolist() == [0, -1]
+    assert joined["sp_row"].tolist() == [-1, 0]
+
+
+def test_nearest_farm_falls_back_to_a_search(weather):
+    grid_id = weather.index.grid_id
+    stored = {"location": [51.0, 30.0], "cells": {grid_id: {"row": 2, "distance": 0.0}}}
+    row, distance = weather.nearest_farm({"grid": stored}, 51.0, 30.0)
+    assert row["tmin_Time=1"] == 2.0 and distance == 0.0
+    row, distance = weather.nearest_farm({"grid": stored}, 50.0, 30.0)
+    assert row["tmin_Time=1"] == 0.0 and distance == 0.0
+
+
+@pytest.mark.anyio
+async def test_refresh_loads_new_drops_and_keeps_unchanged_ones(tmp_path, monkeypatch):
+    monkeypatch.setattr("utils.forecast_store.FORECAST_DIR", str(tmp_path))
+    now = datetime.datetime(2023, 7, 2, 9)
+    frame = gpd.GeoDataFrame({"tmin_Time=20230702": [12.5, 14.0]},
+                             geometry=gpd.points_from_xy([50.0, 51.0], [30.0, 30.0]), crs="EPSG:4326")
+    frame.to_file(tmp_path / "Iran20230702_weather.geojson", driver="GeoJSON")
+    store = ForecastStore()
+    assert await store.refresh(now) == 1
+    snapshot = store.get("weather", "20230702")
+    assert snapshot.nearest(51.01, 30.0)[0]["tmin_Time=20230702"] == 14.0
+    with pytest.raises(ForecastNotAvailable):
+        store.get("weather", "20230701")
+    assert await store.refresh(now) == 0
+    assert store.get("weather", "20230702") is snapshot
+    assert list(store.grids()) == [snapshot.index.grid_id]
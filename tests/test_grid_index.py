@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from utils.grid_index import GridIndex
+
+
+@pytest.fixture
+def index():
+    # binary fractions, so the distances at the threshold are exact
+    return GridIndex([50.0, 50.5, 51.0], [30.0, 30.0, 30.0], threshold=0.125)
+
+
+def test_nearest_many_at_the_threshold(index):
+    rows, distances = index.nearest_many([50.5, 50.375, 50.3125, 52.0], [30.0, 30.0, 30.0, 30.0])
+    assert rows.tolist() == [1, 1, -1, -1]
+    assert distances[:3].tolist() == [0.0, 0.125, 0.1875]
+    assert distances[3] == pytest.approx(1.0)
+
+
+def test_locations_without_coordinates(index):
+    rows, distances = index.nearest_many([np.nan, 50.0], [np.nan, 30.0])
+    assert rows.tolist() == [-1, 0]
+    assert distances[0] == np.inf
+
+
+def test_nearest(index):
+    assert index.nearest(51.02, 30.0) == (2, pytest.approx(0.02))
+    assert index.nearest(55.0, 30.0) == (None, pytest.approx(4.0))
+
+
+def test_grid_id_identifies_the_grid():
+    same = GridIndex([50.0, 50.5, 51.0], [30.0, 30.0, 30.0])
+    assert same.grid_id == GridIndex(np.array([50.0, 50.5, 51.0]), np.array([30.0, 30.0, 30.0])).grid_id
+    assert same.grid_id != GridIndex([50.0, 50.5], [30.0, 30.0]).grid_id
+    assert same.grid_id != GridIndex([50.0, 50.5, 51.0], [30.0, 30.0, 30.0], threshold=0.2).grid_id
+
+
+def test_empty_grid():
+    rows, distances = GridIndex([], []).nearest_many([50.0], [30.0])
+    assert rows.tolist() == [-1] and distances[0] == np.inf
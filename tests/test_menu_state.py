@@ -0,0 +1,24 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_menu_state_follows_registration_and_farms(db):
+    await db.add_new_user(1, "user1")
+    assert await db.get_menu_state(1) == "not-registered"
+    await db.set_user_attribute(1, "name", "name")
+    await db.set_user_attribute(1, "phone-number", "09120000000")
+    assert await db.get_menu_state(1) == "no-farms"
+    await db.add_new_farm(1, "a", {"product": "گندم", "location": {"latitude": None, "longitude": None}})
+    assert await db.get_menu_state(1) == "no-location"
+    await db.update_farm(1, "a", {"location.latitude": 30.0, "location.longitude": 56.0})
+    assert await db.get_menu_state(1) == "not-pesteh"
+    await db.update_farm(1, "a", {"product": "پسته اکبری"})
+    assert await db.get_menu_state(1) == "pesteh"
+    assert await db.get_users_in_menu_state("pesteh") == [1]
+
+
+async def test_menu_state_of_documents_written_before_it_existed(db):
+    await db.user_collection.insert_one({"_id": 1, "username": "user1", "name": "name", "phone-number": "0912"})
+    assert await db.get_menu_state(1) == "no-farms"
+    assert await db.get_menu_state(2) == "not-registered"
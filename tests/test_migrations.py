@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def _activity_log(user_id: int, activity: str, timestamp: str, **fields) -> dict:
+    return {"type": "activity logs", "user_activity": activity, "value": "", "userID": user_id,
+            "username": f"user{user_id}", "timestamp": timestamp, **fields}
+
+
+async def test_member_counts_skip_unparseable_time_stamps(db):
+    await db.bot_collection.insert_one({"num-members": [10, 11, 12], "time-stamp": ["2023-07-01 10:00", "", "20230702 10:00"]})
+    assert await db.migrate_member_counts() == 2
+    points = await db.member_count_collection.find({}, {"_id": 0}).sort("timestamp", 1).to_list(None)
+    assert points == [{"timestamp": datetime(2023, 7, 1, 10), "members": 10},
+                      {"timestamp": datetime(2023, 7, 2, 10), "members": 12}]
+    assert await db.bot_collection.count_documents({}) == 0
+
+
+async def test_member_counts_in_the_coupons_document(db):
+    await db.bot_collection.insert_one({"_id": "coupons", "values": [{"SUMMER": 50000}],
+                                        "num-members": [10], "time-stamp": ["2023-07-01 10:00"]})
+    assert await db.migrate_member_counts() == 1
+    assert await db.bot_collection.find_one({"_id": "coupons"}) == {"_id": "coupons", "values": [{"SUMMER": 50000}]}
+    assert await db.migrate_coupons() == 1
+    assert await db.verify_coupon("SUMMER")
+    assert await db.bot_collection.count_documents({}) == 0
+
+
+async def test_coupons_document_keeps_the_member_counts(db):
+    await db.bot_collection.insert_one({"_id": "coupons", "values": [{"SUMMER": 50000}],
+                                        "num-members": [10], "time-stamp": ["2023-07-01 10:00"]})
+    assert await db.migrate_coupons() == 1
+    assert await db.migrate_coupons() == 0
+    assert await db.migrate_member_counts() == 1
+    assert await db.bot_collection.count_documents({}) == 0
+
+
+async def test_activity_logs_keep_the_member_counts(db):
+    await db.bot_collection.insert_many([
+        _activity_log(1, "start", "20230701 10:00", **{"num-members": [10], "time-stamp": ["2023-07-01 10:00"]}),
+        _activity_log(1, "start register", "20230701 10:05"),
+        _activity_log(2, "start", "bad timestamp"),
+    ])
+    assert await db.migrate_activity_logs() == 3
+    assert await db.bot_collection.count_documents({}) == 1
+    assert await db.check_if_user_activity_exsits(1, "start register", "20230701 00:00", "20230701 23:59")
+    assert await db.migrate_member_counts() == 1
+    assert await db.bot_collection.count_documents({}) == 0
+
+
+async def test_dialogs_keep_unparseable_timestamps(db):
+    await db.dialog_collection.insert_one({"_id": 1, "username": "user1", "message": [
+        "2023-07-01 10:00 - start - hello", "garbage - start - hi"]})
+    assert await db.migrate_dialogs() == 1
+    buckets = await db.dialog_collection.find({"userID": 1}).sort("day", 1).to_list(None)
+    assert [bucket["day"] for bucket in buckets] == [None, datetime(2023, 7, 1)]
+    assert buckets[0]["messages"][0]["timestamp"] == "garbage"
+
+
+async def test_timestamps_become_datetimes(db):
+    await db.user_collection.insert_many([
+        {"_id": 1, "first-seen": "2023-07-01 10:00", "payments": [{"code": "a", "time-approved": "20230702 11:30"}]},
+        {"_id": 2, "first-seen": "not a date"},
+    ])
+    await db.activity_collection.insert_one({"userID": 1, "day": "20230701", "count": 1,
+                                             "events": [{"user_activity": "start", "timestamp": "20230701 10:00"}]})
+    assert await db.migrate_timestamps() >= 2
+    user = await db.user_collection.find_one({"_id": 1})
+    assert user["first-seen"] == datetime(2023, 7, 1, 10)
+    assert user["payments"][0]["time-approved"] == datetime(2023, 7, 2, 11, 30)
+    assert (await db.user_collection.find_one({"_id": 2}))["first-seen"] == "not a date"
+    bucket = await db.activity_collection.find_one({"userID": 1})
+    assert bucket["day"] == datetime(2023, 7, 1) and bucket["events"][0]["timestamp"] == datetime(2023, 7, 1, 10)
+
+
+async def test_populate_user_collection_defaults_first_seen_to_now(db):
+    before = datetime.now()
+    await db.populate_user_collection(1, "user1")
+    first_seen = (await db.user_collection.find_one({"_id": 1}))["first-seen"]
+    # BSON keeps milliseconds
+    assert isinstance(first_seen, datetime) and first_seen >= before - timedelta(milliseconds=1)
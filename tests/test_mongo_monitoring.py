@@ -0,0 +1,56 @@
+import pytest
+
+import database
+from utils.mongo_monitoring import round_trip_budget
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_budget_fails_a_block_over_the_limit(db):
+    with pytest.raises(AssertionError, match="2 round trips, budget was 1"):
+        with round_trip_budget(1):
+            await db.get_user_document(1)
+            await db.get_user_document(2)
+
+
+async def test_budget_records_the_commands(db):
+    with round_trip_budget(2) as budget:
+        await db.get_user_document(1)
+    assert budget.commands == ["find newUserCollection"]
+
+
+async def test_log_sent_messages_reads_usernames_in_one_query(db):
+    users = list(range(1, 51))
+    for user_id in users:
+        await db.add_new_user(user_id, f"user{user_id}")
+    with round_trip_budget(2):
+        await db.log_sent_messages(users, "broadcast")
+    log = await db.bot_collection.find_one({"type": "sent messages"})
+    assert log["number-of-receivers"] == 50
+    assert log["receivers"]["7"] == "user7"
+
+
+async def test_update_farm_round_trips(db):
+    await db.add_new_user(1, "user1")
+    await db.add_new_farm(1, "farm", {"product": "گندم", "location": {"latitude": None, "longitude": None}})
+    with database.UnitOfWork():
+        await db.get_user_document(1)
+        await db.get_farm_map(1)
+        with round_trip_budget(1):
+            await db.update_farm(1, "farm", {"area": 3})
+        # the menu state and segments change, so they are written once
+        with round_trip_budget(2):
+            await db.update_farm(1, "farm", {"location.latitude": 30.0, "location.longitude": 56.0})
+    farm = await db.farm_collection.find_one({"name": "farm"})
+    assert farm["located"] and farm["geo"]["coordinates"] == [56.0, 30.0]
+    assert "with-location" in (await db.get_user_document(1))["segments"]
+
+
+async def test_commands_are_attributed_to_the_current_operation(db):
+    database.command_monitor.reset()
+    token = database.current_operation.set("recv_weather")
+    try:
+        await db.get_user_document(1)
+    finally:
+        database.current_operation.reset(token)
+    assert database.command_monitor.snapshot()["operations"]["recv_weather"]["count"] == 1
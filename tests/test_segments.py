@@ -0,0 +1,49 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def _register(db, user_id: int) -> None:
+    await db.add_new_user(user_id, f"user{user_id}")
+    await db.set_user_attribute(user_id, "name", "name")
+    await db.set_user_attribute(user_id, "phone-number", "09120000000")
+
+
+async def _segments(db, user_id: int) -> set:
+    return set((await db.user_collection.find_one({"_id": user_id}))["segments"])
+
+
+async def test_segments_follow_the_writes(db):
+    await db.add_new_user(1, "user1")
+    assert await _segments(db, 1) == {"without-location", "without-phone", "register-not-pressed"}
+    await db.log_activity(1, "start register")
+    await db.set_user_attribute(1, "phone-number", "09120000000")
+    assert await _segments(db, 1) == {"without-location"}
+    await db.add_new_farm(1, "a", {"product": "پسته اکبری", "location": {"latitude": 30.0, "longitude": 56.0}})
+    assert await _segments(db, 1) == {"pesteh-farmers", "with-location"}
+    assert await db.get_segment("pesteh-farmers") == [1]
+    await db.delete_farm(1, "a")
+    assert await _segments(db, 1) == {"without-location"}
+
+
+async def test_refresh_segments_corrects_drift_and_keeps_pressed_register(db, monkeypatch):
+    await _register(db, 1)
+    await _register(db, 2)
+    await db.log_activity(1, "start register")
+    await db.add_new_farm(2, "a", {"product": "پسته اکبری", "location": {"latitude": 30.0, "longitude": 56.0}})
+    # written behind Database's back, and user 1's press isn't in the activity logs yet
+    await db.user_collection.update_one({"_id": 2}, {"$set": {"segments": [], "menu-state": "no-farms"}})
+
+    async def not_pressed():
+        for user_id in (1, 2):
+            yield user_id
+
+    # mongomock can't run the $lookup with `let` of iter_register_not_pressed
+    monkeypatch.setattr(db, "iter_register_not_pressed", not_pressed)
+    assert await db.refresh_segments() == 1
+    user1 = await db.user_collection.find_one({"_id": 1})
+    assert user1["pressed-register"] and "register-not-pressed" not in user1["segments"]
+    user2 = await db.user_collection.find_one({"_id": 2})
+    assert set(user2["segments"]) == {"pesteh-farmers", "with-location", "register-not-pressed"}
+    assert user2["menu-state"] == "pesteh"
+    assert (await db.get_segment_info("with-location"))["count"] == 1
@@ -0,0 +1,62 @@
+import pytest
+
+import database
+from utils.mongo_monitoring import round_trip_budget
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_user_document_is_read_once_per_update(db):
+    await db.add_new_user(1, "user1")
+    with database.UnitOfWork() as uow:
+        with round_trip_budget(1):
+            assert (await db.get_user_document(1))["username"] == "user1"
+            assert await db.get_user_attribute(1, "username") == "user1"
+            assert await db.check_if_user_exists(1)
+        assert uow.round_trips == 1 and uow.saved_round_trips >= 2
+
+
+async def test_writes_patch_the_cached_document(db):
+    await db.add_new_user(1, "user1")
+    with database.UnitOfWork():
+        await db.get_user_document(1)
+        await db.set_user_attribute(1, "name", "Ali")
+        await db.set_user_attribute(1, "payments", {"code": "pay-1", "amount": 1}, array=True)
+        with round_trip_budget(0):
+            document = await db.get_user_document(1)
+        assert document["name"] == "Ali"
+        assert document["payments"] == [{"code": "pay-1", "amount": 1}]
+        # cached copies are handed out, not the cache itself
+        document["name"] = "changed"
+        assert (await db.get_user_document(1))["name"] == "Ali"
+
+
+async def test_writes_that_cant_be_replayed_drop_the_cached_document(db):
+    await db.add_new_user(1, "user1")
+    await db.log_payment(1, code="pay-1")
+    with database.UnitOfWork():
+        await db.get_user_document(1)
+        await db.modify_final_price_in_payment_dict(1, "pay-1", 399000)
+        with round_trip_budget(1):
+            assert await db.get_final_price(1, "pay-1") == 399000
+
+
+async def test_farm_map_is_cached_and_patched(db):
+    await db.add_new_user(1, "user1")
+    await db.add_new_farm(1, "a", {"product": "گندم"})
+    with database.UnitOfWork():
+        assert list(await db.get_farm_map(1)) == ["a"]
+        await db.add_new_farm(1, "b", {"product": "پسته اکبری"})
+        await db.update_farm(1, "a", {"area": 4})
+        await db.delete_farm(1, "b")
+        with round_trip_budget(0):
+            farms = await db.get_farm_map(1)
+        assert list(farms) == ["a"] and farms["a"]["area"] == 4
+    assert await db.get_farm_map(1) == farms
+
+
+async def test_no_caching_outside_an_update(db):
+    await db.add_new_user(1, "user1")
+    with round_trip_budget(2):
+        await db.get_user_document(1)
+        await db.get_user_document(1)